@@ -49,6 +49,20 @@ else:
 DB_POOL_SIZE    = _get_int("DB_POOL_SIZE", 20)
 DB_MAX_OVERFLOW = _get_int("DB_MAX_OVERFLOW", 20)
 
+# Device task leasing
+TASK_LEASE_MAX_POLLS     = _get_int("TASK_LEASE_MAX_POLLS", 500)                         # long-polls per worker
+TASK_LEASE_DB_SLOTS      = _get_int("TASK_LEASE_DB_SLOTS", max(1, DB_POOL_SIZE // 4))    # pooled connections for leasing
+TASK_LEASE_RETRY_SECONDS = _get_int("TASK_LEASE_RETRY_SECONDS", 5)
+TASK_LEASE_REAP_SECONDS  = _get_int("TASK_LEASE_REAP_SECONDS", 5)
+
+# Time series
+SENSOR_STORAGE          = os.getenv("SENSOR_STORAGE", "rows").lower()  # "rows" | "chunks"
+SENSOR_CACHE_SIZE       = _get_int("SENSOR_CACHE_SIZE", 3600)             # readings kept per series
+SENSOR_CACHE_WINDOW_SECONDS  = _get_int("SENSOR_CACHE_WINDOW_SECONDS", 3600)
+SENSOR_CACHE_REFRESH_SECONDS = _get_int("SENSOR_CACHE_REFRESH_SECONDS", 10)
+ROLLUP_INTERVAL_SECONDS = _get_int("ROLLUP_INTERVAL_SECONDS", 60)
+ROLLUP_LAG_SECONDS      = _get_int("ROLLUP_LAG_SECONDS", 120)
+
 # Camera / HLS
 DATA_ROOT             = os.getenv("CAM_DATA_ROOT", "./data")
 RAW_DIR               = os.getenv("CAM_RAW_DIR", "raw")
@@ -63,6 +77,31 @@ BOUNDARY              = os.getenv("CAM_BOUNDARY", "frame")
 YOLO_MODEL_PATH       = os.getenv("YOLO_MODEL_PATH", "yolov5s.pt")
 CAM_DETECTION_WORKERS = _get_int("CAM_DETECTION_WORKERS", 4)
 CAM_EVENT_GAP_SECONDS = _get_int("CAM_EVENT_GAP_SECONDS", 2)
+CAM_MAX_FRAME_BYTES   = _get_int("CAM_MAX_FRAME_BYTES", 2 * 1024 * 1024)
+CAM_HUB_QUEUE_SIZE    = _get_int("CAM_HUB_QUEUE_SIZE", 2)
+CAM_HUB_EVICT_AFTER   = _get_int("CAM_HUB_EVICT_AFTER", 50)
+CAM_HUB_SEND_TIMEOUT  = _get_int("CAM_HUB_SEND_TIMEOUT", 5)
+CAM_DETECT_BATCH_SIZE = _get_int("CAM_DETECT_BATCH_SIZE", 4)
+CAM_DETECT_BATCH_WAIT_MS = _get_int("CAM_DETECT_BATCH_WAIT_MS", 20)
+CAM_QUEUE_MAX_CAMERAS = _get_int("CAM_QUEUE_MAX_CAMERAS", 256)
+CAM_MOTION_THRESHOLD  = _get_int("CAM_MOTION_THRESHOLD", 4)
+# empty: every API worker runs its own detection pool (dev / single worker)
+CAM_DETECTION_SOCKET  = os.getenv("CAM_DETECTION_SOCKET", "")
+CAM_DETECTION_TIMEOUT = _get_int("CAM_DETECTION_TIMEOUT", 30)
+CAM_CLIP_THREADS      = _get_int("CAM_CLIP_THREADS", 2)
+CAM_CLIP_QUEUE_SIZE   = _get_int("CAM_CLIP_QUEUE_SIZE", 8)
+CAM_CLIP_MAX_OPEN     = _get_int("CAM_CLIP_MAX_OPEN", 64)
+CAM_CLIP_IDLE_SECONDS = _get_int("CAM_CLIP_IDLE_SECONDS", 120)
+CAM_HLS_ENABLED       = _get_bool("CAM_HLS_ENABLED")
+CAM_HLS_DIR           = os.getenv("CAM_HLS_DIR", "hls")
+CAM_HLS_IDLE_SECONDS  = _get_int("CAM_HLS_IDLE_SECONDS", 60)
+FFMPEG_BIN            = os.getenv("FFMPEG_BIN", "ffmpeg")
+CAM_STORAGE_QUOTA_MB  = _get_int("CAM_STORAGE_QUOTA_MB", 0)
+CAM_RETENTION_SWEEP_SECONDS = _get_int("CAM_RETENTION_SWEEP_SECONDS", 300)
+CAM_RETENTION_RESCAN_SECONDS = _get_int("CAM_RETENTION_RESCAN_SECONDS", 3600)
+CAM_STATS_FLUSH_SECONDS = _get_int("CAM_STATS_FLUSH_SECONDS", 5)
+CAM_PRESENCE_SOCKET   = os.getenv("CAM_PRESENCE_SOCKET", "/tmp/hydroleaf-presence.sock")
+CAM_EVENT_FLUSH_SECONDS = _get_int("CAM_EVENT_FLUSH_SECONDS", 5)
 DETECTORS             = [d.strip() for d in os.getenv("DETECTORS", "ssd,yolo").split(",")]
 # ——————————————————————————————————————————
 # LLM / Ollama / OpenAI
@@ -98,11 +137,26 @@ __all__ = [
     "API_V1_STR", "PROJECT_NAME", "SESSION_KEY", "ALLOWED_ORIGINS",
     # DB
     "TEST_DATABASE_URL", "DATABASE_URL", "DB_POOL_SIZE", "DB_MAX_OVERFLOW",
+    # task leasing
+    "TASK_LEASE_MAX_POLLS", "TASK_LEASE_DB_SLOTS", "TASK_LEASE_RETRY_SECONDS",
+    "TASK_LEASE_REAP_SECONDS",
+    # time series
+    "SENSOR_STORAGE", "SENSOR_CACHE_SIZE", "SENSOR_CACHE_WINDOW_SECONDS",
+    "SENSOR_CACHE_REFRESH_SECONDS", "ROLLUP_INTERVAL_SECONDS", "ROLLUP_LAG_SECONDS",
     # camera/HLS
     "DATA_ROOT", "RAW_DIR", "CLIPS_DIR", "PROCESSED_DIR",
     "HLS_TARGET_DURATION", "HLS_PLAYLIST_LENGTH", "FPS",
     "RETENTION_DAYS", "OFFLINE_TIMEOUT", "BOUNDARY",
     "YOLO_MODEL_PATH", "CAM_DETECTION_WORKERS", "CAM_EVENT_GAP_SECONDS",
+    "CAM_MAX_FRAME_BYTES", "CAM_HUB_QUEUE_SIZE", "CAM_HUB_EVICT_AFTER",
+    "CAM_HUB_SEND_TIMEOUT", "CAM_DETECT_BATCH_SIZE", "CAM_DETECT_BATCH_WAIT_MS",
+    "CAM_QUEUE_MAX_CAMERAS", "CAM_MOTION_THRESHOLD",
+    "CAM_DETECTION_SOCKET", "CAM_DETECTION_TIMEOUT",
+    "CAM_CLIP_THREADS", "CAM_CLIP_QUEUE_SIZE", "CAM_CLIP_MAX_OPEN", "CAM_CLIP_IDLE_SECONDS",
+    "CAM_HLS_ENABLED", "CAM_HLS_DIR", "CAM_HLS_IDLE_SECONDS", "FFMPEG_BIN",
+    "CAM_STORAGE_QUOTA_MB", "CAM_RETENTION_SWEEP_SECONDS", "CAM_RETENTION_RESCAN_SECONDS",
+    "CAM_STATS_FLUSH_SECONDS",
+    "CAM_PRESENCE_SOCKET", "CAM_EVENT_FLUSH_SECONDS",
     "DETECTORS",
     # LLM
     "LLM_PROVIDER", "OLLAMA_HOST", "OLLAMA_URL", "OLLAMA_MODEL",
@@ -81,6 +81,14 @@ async def init_db() -> None:
         if RESET_DB:
             await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+        # create_all skips indexes added to tables that already exist
+        await conn.run_sync(_create_missing_indexes)
+
+
+def _create_missing_indexes(sync_conn) -> None:
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
 
 # ─── Health-check for /health/database ───────────────────────────────────────
 async def check_db_connection() -> dict[str, str]:
@@ -17,8 +17,9 @@ from fastapi.responses import JSONResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 
 from app.core.config import ENVIRONMENT, ALLOWED_ORIGINS, SESSION_KEY, API_V1_STR, TESTING
-from app.core.database import init_db, check_db_connection, get_db
+from app.core.database import init_db, check_db_connection
 from app.schemas import HealthCheck, DatabaseHealthCheck, FullHealthCheck
+from app.utils.hls import HlsStaticFiles
 
 # ─── Routers ──────────────────────────────────────────────────────────────────
 from app.routers.auth import router as auth_router
@@ -85,7 +86,7 @@ app.add_middleware(
 _static_dir = Path("app/static"); _static_dir.mkdir(parents=True, exist_ok=True)
 _hls_dir    = Path(os.getenv("CAM_DATA_ROOT", "./data")); _hls_dir.mkdir(parents=True, exist_ok=True)
 app.mount("/static", StaticFiles(directory=str(_static_dir)), name="static")
-app.mount("/hls",    StaticFiles(directory=str(_hls_dir)),   name="hls")
+app.mount("/hls",    HlsStaticFiles(directory=str(_hls_dir)), name="hls")
 templates = Jinja2Templates(directory="app/templates")
 
 # ─── Request-logging Middleware ───────────────────────────────────────────────
@@ -113,19 +114,49 @@ async def on_startup():
     if not TESTING:
         await init_db()
         # import heavy CV/YOLO only when we actually run them
-        from app.utils.camera_tasks import offline_watcher
         from app.utils.camera_queue import camera_queue
-        asyncio.create_task(offline_watcher(db_factory=get_db, interval_seconds=30))
+        from app.utils.clip_writer import clip_writer
+        from app.utils.camera_stats import camera_stats
+        from app.utils.detection_events import event_builder
+        from app.utils.lease_reaper import lease_reaper
+        from app.utils.presence import presence
+        from app.utils.retention import retention_sweeper
+        from app.utils.rollups import rollup_job
+        from app.utils.sensor_store import sensor_store
+        from app.utils.task_signals import task_signals
+        asyncio.create_task(presence.run())
+        asyncio.create_task(camera_stats.run())
+        asyncio.create_task(event_builder.run())
+        asyncio.create_task(clip_writer.run_idle_sweeper())
+        asyncio.create_task(retention_sweeper.run())
+        asyncio.create_task(rollup_job.run())
+        asyncio.create_task(sensor_store.run_cache())  # warm-up, then catch-up
+        asyncio.create_task(task_signals.run())  # LISTEN for other workers' enqueues
+        asyncio.create_task(lease_reaper.run())
         camera_queue.start_workers()
 
 @app.on_event("shutdown")
 async def on_shutdown():
-    from app.routers.cameras import _clip_writers
-    for info in _clip_writers.values():
-        try:
-            info["writer"].release()
-        except:
-            pass
+    from app.utils.camera_queue import camera_queue
+    from app.utils.clip_writer import clip_writer
+    from app.utils.hls import hls_segmenter
+    from app.utils.camera_stats import camera_stats
+    from app.utils.detection_events import event_builder
+    from app.utils.lease_reaper import lease_reaper
+    from app.utils.presence import presence
+    presence.shutdown()
+    await lease_reaper.shutdown()
+    await hls_segmenter.shutdown()
+    clip_writer.shutdown()  # flush queued frames, close every open clip
+    camera_queue.shutdown()
+    try:
+        await camera_stats.flush()  # buffered frames/clips/last_seen/storage counters
+    except Exception:
+        logger.exception("Could not flush camera stats")
+    try:
+        await event_builder.flush()  # open events are written as they stand
+    except Exception:
+        logger.exception("Could not flush detection events")
 
 # ─── Health Endpoints ─────────────────────────────────────────────────────────
 @app.get(f"{API_V1_STR}/health", response_model=HealthCheck)
@@ -148,11 +179,18 @@ async def database_health():
 
 @app.get(f"{API_V1_STR}/health/system", response_model=FullHealthCheck)
 async def system_health():
+    from app.utils.camera_queue import camera_queue
     sys = await health_check()
     db  = await database_health()
-    return FullHealthCheck(system=sys, database=db,
+    det = await camera_queue.pool.health()
+    return FullHealthCheck(system=sys, database=db, detection=det,
                            timestamp=datetime.now(timezone.utc))
 
+@app.get(f"{API_V1_STR}/health/metrics")
+async def metrics_snapshot():
+    from app.utils import metrics
+    return metrics.snapshot()
+
 # ─── Exception Handlers ───────────────────────────────────────────────────────
 @app.exception_handler(HTTPException)
 async def http_exc_handler(request: Request, exc: HTTPException):
@@ -162,6 +200,7 @@ async def http_exc_handler(request: Request, exc: HTTPException):
         content={"detail": exc.detail,
                  "timestamp": datetime.now(timezone.utc).isoformat(),
                  "path": request.url.path},
+        headers=exc.headers,  # e.g. Retry-After, WWW-Authenticate
     )
 
 @app.exception_handler(Exception)
@@ -12,6 +12,7 @@ from sqlalchemy import (
     Boolean,
     ForeignKey,
     JSON,
+    LargeBinary,
     func,
     Index,
 )
@@ -254,6 +255,32 @@ class SensorReading(Base):
 
     device = relationship("Device", back_populates="sensor_readings")
 
+    __table_args__ = (
+        Index("ix_sensor_readings_timestamp", "timestamp"),  # rollup watermark scan
+    )
+
+
+class SensorChunk(Base):
+    """
+    Compact storage of one device's readings of one type for one hour
+    (`SENSOR_STORAGE=chunks`, see app.utils.sensor_store): packed little-endian
+    float32 values and int32 second offsets from `hour`, appended in place.
+    """
+    __tablename__ = "sensor_chunks"
+
+    device_id = Column(String(64), ForeignKey("devices.id", ondelete="CASCADE"), primary_key=True)
+    reading_type = Column(String(50), primary_key=True)
+    hour = Column(DateTime(timezone=True), primary_key=True)
+    location = Column(String(100))
+    count = Column(Integer, nullable=False, default=0)
+    samples = Column(LargeBinary, nullable=False)  # float32[count]
+    offsets = Column(LargeBinary, nullable=False)  # int32[count], seconds since `hour`
+
+    __table_args__ = (
+        Index("ix_sensor_chunks_hour", "hour"),
+        Index("ix_sensor_chunks_location", "location"),
+    )
+
 
 class DosingOperation(Base):
     __tablename__ = "dosing_operations"
@@ -439,6 +466,7 @@ class Camera(Base):
     hls_path = Column(String(256))
     user_cameras = relationship("UserCamera", back_populates="camera", cascade="all, delete-orphan")
     detection_records = relationship("DetectionRecord", back_populates="camera", cascade="all, delete-orphan")
+    detection_events = relationship("DetectionEvent", back_populates="camera", cascade="all, delete-orphan")
 
 
 class UserCamera(Base):
@@ -463,6 +491,59 @@ class DetectionRecord(Base):
 
     camera = relationship("Camera", back_populates="detection_records")
 
+    __table_args__ = (
+        # camera report: filter + LAG() ordering per object class
+        Index("ix_detection_records_cam_obj_ts", "camera_id", "object_name", "timestamp"),
+    )
+
+
+class DetectionEvent(Base):
+    """A run of detections of one class, separated by at most CAM_EVENT_GAP_SECONDS."""
+    __tablename__ = "detection_events"
+
+    id = Column(String(64), primary_key=True, default=_uuid)
+    camera_id = Column(String(64), ForeignKey("cameras.id", ondelete="CASCADE"), nullable=False)
+    object_name = Column(String(100), nullable=False)
+    start_time = Column(DateTime(timezone=True), nullable=False)
+    end_time = Column(DateTime(timezone=True), nullable=False)
+    count = Column(Integer, default=0, nullable=False)  # detections folded into the event
+    max_confidence = Column(Float)
+
+    camera = relationship("Camera", back_populates="detection_events")
+
+    __table_args__ = (
+        Index("ix_detection_events_cam_obj_start", "camera_id", "object_name", "start_time"),
+        Index("ix_detection_events_end_time", "end_time"),  # rollup watermark scan
+        Index("ix_detection_events_cam_end", "camera_id", "end_time"),  # report pages past a cursor
+    )
+
+
+class Rollup(Base):
+    """
+    Pre-aggregated bucket of a series (see app.utils.rollups).
+    avg = total / count.
+    """
+    __tablename__ = "rollups"
+
+    series = Column(String(20), primary_key=True)      # "detections" | "sensor"
+    source_id = Column(String(64), primary_key=True)   # camera / device id
+    metric = Column(String(100), primary_key=True)     # object class / reading type
+    resolution = Column(Integer, primary_key=True)     # bucket width in seconds
+    bucket = Column(DateTime(timezone=True), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0.0)
+    min_value = Column(Float)
+    max_value = Column(Float)
+
+
+class RollupWatermark(Base):
+    """Rows of a series up to `watermark` are folded into `rollups`."""
+    __tablename__ = "rollup_watermarks"
+
+    series = Column(String(20), primary_key=True)
+    watermark = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 
 class CloudKey(Base):
     __tablename__ = "cloud_keys"
@@ -1,21 +1,25 @@
 # app/routers/cameras.py
 
 import asyncio
-from datetime import datetime, timedelta, timezone
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
 import time
 from pathlib import Path
-from collections import defaultdict
+from typing import Optional
 
 from fastapi import (
     APIRouter,
     Depends,
     Request,
-    BackgroundTasks,
     HTTPException,
     Query,
+    Response,
     WebSocket,
+    WebSocketDisconnect,
 )
-from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -26,24 +30,32 @@ from app.core.config import (
     PROCESSED_DIR,
     BOUNDARY,
     FPS,
-    CAM_EVENT_GAP_SECONDS,
+    CAM_MAX_FRAME_BYTES,
+    CAM_HUB_SEND_TIMEOUT,
 )
 from app.core.database import get_db
 from app.dependencies import get_current_admin, verify_camera_token
-from app.models import Camera, DetectionRecord, DeviceCommand
-from app.schemas import CameraReportResponse, DetectionRange
+from app.models import Camera, DeviceCommand
+from app.schemas import CameraReportResponse, RollupResponse
+from app.utils import detection_report, metrics, rollups
 from app.utils.camera_queue import camera_queue
+from app.utils.camera_stats import camera_stats
+from app.utils.frame_hub import frame_hub
+from app.utils.hls import hls_segmenter
+from app.utils.presence import presence
+from app.utils.retention import storage_index
+from app.utils.frame_store import RAW, Frame, frame_store
 
 router = APIRouter()
-ws_clients: dict[str, list[WebSocket]] = defaultdict(list)
-
-# Clip writers: camera_id -> {'writer': VideoWriter, 'start': datetime}
-_clip_writers: dict[str, dict] = {}
-_clip_locks: dict[str, asyncio.Lock] = {}
-CLIP_DURATION = timedelta(minutes=10)
 
 JPEG_SOI = b"\xff\xd8"  # JPEG start-of-image magic
 
+# mkstemp creates 0600 files; published frames get the mode a plain open()
+# would have given them (0666 less the process umask)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+_FRAME_MODE = 0o666 & ~_UMASK
+
 
 def _camera_dirs(camera_id: str) -> tuple[Path, Path, Path]:
     base = Path(DATA_ROOT) / camera_id
@@ -53,56 +65,146 @@ def _camera_dirs(camera_id: str) -> tuple[Path, Path, Path]:
     return base, raw_dir, proc_dir, clip_dir
 
 
+def _open_spool(raw_dir: Path) -> tuple[int, str]:
+    """Create a hidden temp file next to the final frame (same filesystem)."""
+    try:
+        return tempfile.mkstemp(dir=raw_dir, prefix=".upload-", suffix=".part")
+    except FileNotFoundError:
+        raw_dir.mkdir(parents=True, exist_ok=True)
+        return tempfile.mkstemp(dir=raw_dir, prefix=".upload-", suffix=".part")
+
+
+def _spool_write(fd: int, chunk: bytes) -> None:
+    view = memoryview(chunk)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _spool_discard(fd: int | None, tmp_name: str) -> None:
+    if fd is not None:
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+    try:
+        os.unlink(tmp_name)
+    except OSError:
+        pass
+
+
+def _spool_commit(
+    fd: int, tmp_name: str, raw_dir: Path, base: Path, ts: int, size: int
+) -> tuple[Path, bytes]:
+    """
+    Publish the spooled frame as raw/<ts>.jpg *and* latest.jpg without
+    copying: the raw name is a hard link, latest.jpg an atomic rename.
+    Returns the raw path and the frame bytes, read back from the page cache.
+    """
+    try:
+        os.fchmod(fd, _FRAME_MODE)
+        data = os.pread(fd, size, 0)
+    finally:
+        os.close(fd)
+    while True:
+        raw_file = raw_dir / f"{ts}.jpg"
+        try:
+            os.link(tmp_name, raw_file)
+            break
+        except FileExistsError:
+            ts += 1  # two frames in the same millisecond
+        except OSError:
+            # filesystem without hard links – fall back to a copy
+            shutil.copyfile(tmp_name, raw_file)
+            break
+    os.replace(tmp_name, base / "latest.jpg")
+    return raw_file, data
+
+
 async def _process_upload(
     camera_id: str,
     request: Request,
-    background_tasks: BackgroundTasks,
+    response: Response,
     day_flag: bool,
 ) -> dict:
-    # 1) Read body (don’t rely solely on Content-Type – tests may omit it)
-    body = bytearray()
-    try:
-        async for chunk in request.stream():
-            body.extend(chunk)
-    except Exception:
-        # Non-standard 499 tends to confuse tests; use 400 instead
-        raise HTTPException(status_code=400, detail="Client disconnected during upload")
+    t_start = time.perf_counter()
 
-    if not body:
-        raise HTTPException(status_code=400, detail="Empty request body")
+    # 1) Refuse oversized frames before reading anything when the size is announced
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > CAM_MAX_FRAME_BYTES:
+        raise HTTPException(status_code=413, detail="Frame exceeds CAM_MAX_FRAME_BYTES")
 
-    # 2) Validate it looks like a JPEG (accepts image/* or octet-stream uploads)
-    ct = request.headers.get("content-type", "")
-    if not (ct.startswith("image/") or bytes(body[:2]) == JPEG_SOI):
-        raise HTTPException(status_code=415, detail="Unsupported media; expected image/jpeg")
-
-    # 3) Persist RAW and update 'latest.jpg'
+    # 2) Stream the body straight into a temp file, chunk by chunk as it
+    #    arrives (memory stays at one chunk); disk writes run off the event loop
     base, raw_dir, _, _ = _camera_dirs(camera_id)
-    raw_dir.mkdir(parents=True, exist_ok=True)
-    base.mkdir(parents=True, exist_ok=True)
-
-    ts = int(time.time() * 1000)
-    raw_file = raw_dir / f"{ts}.jpg"
-    raw_file.write_bytes(body)
+    loop = asyncio.get_running_loop()
+    fd: int | None
+    fd, tmp_name = await loop.run_in_executor(None, _open_spool, raw_dir)
 
-    latest_file = base / "latest.jpg"
-    tmp_latest = latest_file.with_suffix(".tmp")
-    tmp_latest.write_bytes(body)
-    tmp_latest.replace(latest_file)
-
-    # 4) Schedule async post-processing (non-blocking)
+    ct = request.headers.get("content-type", "")
+    size = 0
     try:
-        background_tasks.add_task(camera_queue.enqueue, camera_id, latest_file)
-    except Exception:
-        # Queue not available in certain tests; don’t fail the upload
-        pass
-
-    # 5) Broadcast to any websocket listeners (best-effort)
-    for ws in list(ws_clients.get(camera_id, [])):
         try:
-            await ws.send_bytes(body)
+            async for chunk in request.stream():
+                if not chunk:
+                    continue
+                # Validate it looks like a JPEG (accepts image/* or octet-stream uploads)
+                if not size and not (
+                    ct.startswith("image/") or chunk.startswith(JPEG_SOI[: len(chunk)])
+                ):
+                    raise HTTPException(status_code=415, detail="Unsupported media; expected image/jpeg")
+                size += len(chunk)
+                if size > CAM_MAX_FRAME_BYTES:
+                    raise HTTPException(status_code=413, detail="Frame exceeds CAM_MAX_FRAME_BYTES")
+                await loop.run_in_executor(None, _spool_write, fd, chunk)
+        except (HTTPException, OSError):
+            raise
         except Exception:
-            ws_clients[camera_id].remove(ws)
+            # Non-standard 499 tends to confuse tests; use 400 instead
+            raise HTTPException(status_code=400, detail="Client disconnected during upload")
+
+        if not size:
+            raise HTTPException(status_code=400, detail="Empty request body")
+        t_received = time.perf_counter()
+
+        # 3) Persist RAW and update 'latest.jpg' (link + atomic rename, no second write)
+        ts = int(time.time() * 1000)
+        spool_fd, fd = fd, None  # _spool_commit owns (and closes) the descriptor
+        raw_file, data = await loop.run_in_executor(
+            None, _spool_commit, spool_fd, tmp_name, raw_dir, base, ts, size
+        )
+    except BaseException:
+        _spool_discard(fd, tmp_name)
+        raise
+    t_persisted = time.perf_counter()
+    ts = int(raw_file.stem)
+    storage_index.record(camera_id, raw_file, size, ts / 1000)
+    camera_stats.add(camera_id, frames=1, seen=datetime.fromtimestamp(ts / 1000, timezone.utc))
+    presence.seen(camera_id, ts / 1000)
+    frame = frame_store.put(camera_id, data, RAW)
+
+    # 4) Offer the frame for detection; the queue keeps only the newest
+    #    pending frame per camera and never blocks
+    camera_queue.enqueue(camera_id, raw_file, frame.data)
+
+    # 5) Hand the frame to live viewers (never waits on them); HLS segments
+    #    are cut from the same feed
+    frame_hub.publish(frame)
+    hls_segmenter.ensure(camera_id)
+
+    # 6) Per-stage timings (Server-Timing header + /health/metrics)
+    t_done = time.perf_counter()
+    stages = {
+        "receive": t_received - t_start,
+        "persist": t_persisted - t_received,
+        "total": t_done - t_start,
+    }
+    for stage, seconds in stages.items():
+        metrics.observe(f"camera.upload.{stage}", seconds)
+    metrics.inc("camera.upload.frames")
+    metrics.inc("camera.upload.bytes", size)
+    response.headers["Server-Timing"] = ", ".join(
+        f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in stages.items()
+    )
 
     return {"ok": True, "ts": ts, "mode": "day" if day_flag else "night"}
 
@@ -111,80 +213,80 @@ async def _process_upload(
 async def upload_day_frame(
     camera_id: str,
     request: Request,
-    background_tasks: BackgroundTasks,
+    response: Response,
 ) -> dict:
-    return await _process_upload(camera_id, request, background_tasks, day_flag=True)
+    return await _process_upload(camera_id, request, response, day_flag=True)
 
 
 @router.post("/upload/{camera_id}/night", dependencies=[Depends(verify_camera_token)])
 async def upload_night_frame(
     camera_id: str,
     request: Request,
-    background_tasks: BackgroundTasks,
+    response: Response,
 ) -> dict:
-    return await _process_upload(camera_id, request, background_tasks, day_flag=False)
+    return await _process_upload(camera_id, request, response, day_flag=False)
+
+
+async def _current_frame(camera_id: str) -> Frame | None:
+    """
+    Newest frame for `camera_id` from the in-memory store.  Only when this
+    worker has not seen an upload for a frame interval do we look at disk,
+    and then just `latest.jpg` (one stat), never the processed/ listing.
+    """
+    raw = frame_store.get(camera_id, RAW)
+    if raw is None or time.time() - raw.ts > 1 / max(FPS, 1):
+        base, _, _, _ = _camera_dirs(camera_id)
+        await frame_store.refresh_from_disk(camera_id, base / "latest.jpg")
+    return frame_store.latest(camera_id)
+
+
+def _frame_response(frame: Frame, request: Request) -> Response:
+    headers = {"ETag": frame.etag, "Cache-Control": "no-cache", "X-Frame-Seq": str(frame.seq)}
+    if frame.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=frame.data, media_type="image/jpeg", headers=headers)
 
 
 @router.get("/stream/{camera_id}", dependencies=[Depends(get_current_admin)])
-def stream(
+async def stream(
     camera_id: str,
+    request: Request,
     mode: str = Query("mjpeg", description="`mjpeg` for live MJPEG, `poll` for single-frame snapshot"),
 ):
     if mode not in ("mjpeg", "poll"):
         raise HTTPException(status_code=422, detail="mode must be 'mjpeg' or 'poll'")
 
-    base, _, proc_dir, _ = _camera_dirs(camera_id)
-    if not base.exists():
-        raise HTTPException(status_code=404, detail="Camera not found")
+    base, _, _, _ = _camera_dirs(camera_id)
+    frame = await _current_frame(camera_id)
+    if frame is None:
+        if not base.exists():
+            raise HTTPException(status_code=404, detail="Camera not found")
+        if mode == "poll":
+            raise HTTPException(status_code=404, detail="Image not found")
 
     if mode == "poll":
-        candidates = (
-            sorted(proc_dir.glob("*.jpg"), key=lambda p: p.stat().st_mtime, reverse=True)
-            if proc_dir.exists()
-            else []
-        )
-        img_path = candidates[0] if candidates else (base / "latest.jpg")
-        if not img_path.exists():
-            raise HTTPException(status_code=404, detail="Image not found")
-        return FileResponse(img_path, media_type="image/jpeg")
+        return _frame_response(frame, request)
 
+    # Live MJPEG: viewers are fed by the broadcast hub, no per-viewer polling
     async def gen():
-        last_mtime = 0
-        while True:
-            proc = proc_dir
-            candidates = (
-                sorted(proc.glob("*.jpg"), key=lambda p: p.stat().st_mtime)
-                if proc.exists()
-                else []
-            )
-            img_path = candidates[-1] if candidates else (base / "latest.jpg")
-            if img_path.exists():
-                m = img_path.stat().st_mtime_ns
-                if m != last_mtime:
-                    last_mtime = m
-                    data = img_path.read_bytes()
-                    yield (
-                        f"--{BOUNDARY}\r\n"
-                        f"Content-Type: image/jpeg\r\n"
-                        f"Content-Length: {len(data)}\r\n\r\n"
-                    ).encode() + data + b"\r\n"
-            await asyncio.sleep(1 / max(FPS, 1))
+        sub = frame_hub.subscribe(camera_id, base / "latest.jpg")
+        try:
+            if frame is not None:
+                yield frame.mjpeg_part()
+            async for current in sub:
+                yield current.mjpeg_part()
+        finally:
+            frame_hub.unsubscribe(sub)
 
     return StreamingResponse(gen(), media_type=f"multipart/x-mixed-replace; boundary={BOUNDARY}")
 
 
 @router.get("/still/{camera_id}", dependencies=[Depends(get_current_admin)])
-def still(camera_id: str):
-    base, _, proc, _ = _camera_dirs(camera_id)
-    candidates = (
-        sorted(proc.glob("*.jpg"), key=lambda p: p.stat().st_mtime, reverse=True)
-        if proc.exists()
-        else []
-    )
-    p = candidates[0] if candidates else (base / "latest.jpg")
-    if not p.exists():
+async def still(camera_id: str, request: Request):
+    frame = await _current_frame(camera_id)
+    if frame is None:
         raise HTTPException(status_code=404, detail="Image not found")
-    return FileResponse(p, media_type="image/jpeg")
+    return _frame_response(frame, request)
 
 
 @router.get("/clips/{camera_id}")
@@ -215,8 +317,22 @@ async def cam_status(camera_id: str, db: AsyncSession = Depends(get_db)):
     cam = await db.get(Camera, camera_id)
     if not cam:
         raise HTTPException(status_code=404, detail="Camera not registered")
+    stats = {
+        "last_seen": cam.last_seen,
+        "frames_received": cam.frames_received or 0,
+        "clips_count": cam.clips_count or 0,
+        "storage_used": cam.storage_used or 0.0,
+    }
+    # counters are flushed periodically; add what this worker has not written yet
+    delta = camera_stats.pending(camera_id)
+    if delta is not None:
+        if delta.last_seen and (stats["last_seen"] is None or delta.last_seen > stats["last_seen"]):
+            stats["last_seen"] = delta.last_seen
+        stats["frames_received"] += delta.frames
+        stats["clips_count"] += delta.clips
+        stats["storage_used"] = max(0.0, stats["storage_used"] + delta.nbytes / 1024 ** 2)
     # FastAPI will JSON-encode datetimes; no need for manual isoformat
-    return {"is_online": cam.is_online, "last_seen": cam.last_seen}
+    return {"is_online": cam.is_online, **stats, "hls": cam.hls_path}
 
 
 @router.get("/commands/{camera_id}", dependencies=[Depends(verify_camera_token)])
@@ -235,45 +351,65 @@ async def next_command(camera_id: str, db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/report/{camera_id}", response_model=CameraReportResponse)
-async def get_camera_report(camera_id: str, db: AsyncSession = Depends(get_db)):
-    rows = await db.execute(
-        select(DetectionRecord)
-        .where(DetectionRecord.camera_id == camera_id)
-        .order_by(DetectionRecord.timestamp)
+async def get_camera_report(
+    camera_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    object_name: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(detection_report.DEFAULT_LIMIT, ge=1, le=detection_report.MAX_LIMIT),
+):
+    """
+    Detection ranges of a camera, grouped in the database and streamed.
+    Pass `next_cursor` back as `cursor` for the following page.
+    """
+    try:
+        after = detection_report.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    body = detection_report.stream_report(
+        camera_id, limit=limit, start=start, end=end, object_name=object_name, after=after
     )
-    records = rows.scalars().all()
-    grouped: dict[str, list[dict]] = {}
-    gap = timedelta(seconds=CAM_EVENT_GAP_SECONDS)
+    return StreamingResponse(body, media_type="application/json")
 
-    for rec in records:
-        lst = grouped.setdefault(rec.object_name, [])
-        if not lst:
-            lst.append({"start": rec.timestamp, "end": rec.timestamp})
-        else:
-            last = lst[-1]
-            if rec.timestamp - last["end"] <= gap:
-                last["end"] = rec.timestamp
-            else:
-                lst.append({"start": rec.timestamp, "end": rec.timestamp})
 
-    detections: list[DetectionRange] = []
-    for obj, ranges in grouped.items():
-        for r in ranges:
-            detections.append(DetectionRange(object_name=obj, start_time=r["start"], end_time=r["end"]))
-
-    return CameraReportResponse(camera_id=camera_id, detections=detections)
+@router.get("/rollup/{camera_id}", response_model=RollupResponse)
+async def get_camera_rollup(
+    camera_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    object_name: Optional[str] = None,
+    points: int = Query(rollups.DEFAULT_POINTS, ge=1, le=rollups.MAX_POINTS),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Detections per object class over time (default: the last day), from the
+    pre-aggregated rollups at the finest resolution within `points` buckets.
+    """
+    try:
+        start, end = rollups.resolve_range(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    resolution, points_ = await rollups.query_rollups(
+        db, "detections", camera_id, start=start, end=end, metric=object_name, max_points=points
+    )
+    return {"source_id": camera_id, "resolution": resolution, "points": points_}
 
 
 @router.websocket("/ws/stream/{camera_id}")
 async def ws_stream(websocket: WebSocket, camera_id: str):
     await websocket.accept()
-    ws_clients[camera_id].append(websocket)
+    base, _, _, _ = _camera_dirs(camera_id)
+    sub = frame_hub.subscribe(camera_id, base / "latest.jpg")
     try:
-        while True:
-            # Keep the connection alive; frames are pushed by uploads
-            await asyncio.sleep(30)
+        async for frame in sub:
+            try:
+                await asyncio.wait_for(websocket.send_bytes(frame.data), CAM_HUB_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                metrics.inc("camera.hub.evicted")
+                await websocket.close(code=1013)  # try again later
+                break
+    except (WebSocketDisconnect, RuntimeError):
+        pass
     finally:
-        try:
-            ws_clients[camera_id].remove(websocket)
-        except ValueError:
-            pass
+        frame_hub.unsubscribe(sub)
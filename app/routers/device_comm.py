@@ -43,30 +43,43 @@ from fastapi import (
     Response,
     status as http_status,
 )
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from fastapi.security import HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field
 
-from sqlalchemy import func, select, update
+from sqlalchemy import String, any_, bindparam, func, insert, or_, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.config import API_V1_STR, TESTING
-from app.core.database import get_db
+from app.core.config import (
+    API_V1_STR,
+    TASK_LEASE_DB_SLOTS,
+    TASK_LEASE_MAX_POLLS,
+    TASK_LEASE_RETRY_SECONDS,
+    TESTING,
+)
+from app.core.database import AsyncSessionLocal, get_db
 from app.models import (
     Device,
+    Farm,
     TaskStatus,
     SwitchState,
     Task,
+    User,
     ValveState,
 )
 from app.schemas import SimpleDosingCommand, DeviceType
-from app.dependencies import verify_device_token
+from app.dependencies import get_current_user, verify_device_token
+from app.utils import metrics
+from app.utils.task_signals import FALLBACK_POLL_SECONDS, task_signals
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Router
 # ─────────────────────────────────────────────────────────────────────────────
 router = APIRouter(tags=["device_comm"])
 
+BULK_ENQUEUE_MAX = 50_000  # tasks per bulk enqueue request
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Helpers
 # ─────────────────────────────────────────────────────────────────────────────
@@ -93,26 +106,13 @@ async def _authz_optional_device(request: Request, db: AsyncSession, expected_de
     if device_id_from_token != expected_device_id:
         raise HTTPException(status_code=401, detail="Token/device mismatch")
 
-async def _requeue_expired(db: AsyncSession, device_id: str) -> None:
-    now = datetime.now(timezone.utc)
-    await db.execute(
-        update(Task)
-        .where(
-            Task.device_id == device_id,
-            Task.status == TaskStatus.LEASED,
-            Task.leased_until.isnot(None),
-            Task.leased_until < now,
-        )
-        .values(status=TaskStatus.PENDING, lease_id=None, leased_until=None)
-    )
-
 async def _lease_once(db: AsyncSession, device_id: str, max_tasks: int, lease_seconds: int) -> tuple[str | None, list[Task]]:
     """
     Try to lease up to `max_tasks`. Returns (lease_id, tasks).
     Uses SKIP LOCKED on Postgres; falls back gracefully on SQLite.
+    Expired leases are put back by the lease reaper (app.utils.lease_reaper).
     """
     now = datetime.now(timezone.utc)
-    await _requeue_expired(db, device_id)
 
     stmt = (
         select(Task)
@@ -144,6 +144,35 @@ async def _lease_once(db: AsyncSession, device_id: str, max_tasks: int, lease_se
     await db.commit()
     return lease_id, tasks
 
+async def _next_due(db: AsyncSession, device_id: str) -> datetime | None:
+    """
+    When a task of `device_id` comes due without an enqueue: the earliest
+    delayed one.  (Expired leases wake leasers through the reaper.)
+    """
+    due = await db.scalar(
+        select(func.min(Task.available_at))
+        .where(Task.device_id == device_id, Task.status == TaskStatus.PENDING)
+    )
+    if due is None:
+        return None
+    return due if due.tzinfo else due.replace(tzinfo=timezone.utc)
+
+class _LeaseGate:
+    """
+    Per-worker limits for `/tasks/lease`: at most `max_polls` long-polls in
+    flight (the rest are turned away with a retry hint), and at most
+    `db_slots` of them holding a pooled connection at once – parked polls
+    hold none, so the rest of the pool stays free for everyone else.
+    """
+
+    def __init__(self, max_polls: int = TASK_LEASE_MAX_POLLS, db_slots: int = TASK_LEASE_DB_SLOTS):
+        self.max_polls = max_polls
+        self.polls = 0
+        self.db = asyncio.Semaphore(db_slots)
+
+_lease_gate = _LeaseGate()
+metrics.register_gauge("tasks.lease.polls", lambda: _lease_gate.polls)
+
 def _find_latest_firmware(device_type: str) -> Tuple[str, str]:
     """
     Return (version, path) for the newest firmware in firmware/<type>/<ver>/.
@@ -218,6 +247,26 @@ class EnqueueTask(BaseModel):
     priority: int = 100
     delay_seconds: int = 0
 
+class BulkTaskEntry(BaseModel):
+    device_id: str
+    type: str
+    parameters: dict = Field(default_factory=dict)
+    priority: int = 100
+    delay_seconds: int = 0
+
+class DeviceSelector(BaseModel):
+    farm_id: str | None = None
+    device_type: DeviceType | None = None
+
+class BulkEnqueue(BaseModel):
+    """Either explicit `tasks`, or one task (`type`, `parameters`, …) for every device `selector` matches."""
+    tasks: list[BulkTaskEntry] = Field(default_factory=list, max_length=BULK_ENQUEUE_MAX)
+    selector: DeviceSelector | None = None
+    type: str | None = None
+    parameters: dict = Field(default_factory=dict)
+    priority: int = 100
+    delay_seconds: int = 0
+
 class LeaseRequest(BaseModel):
     device_id: str
     max_tasks: int = Field(1, ge=1, le=50)
@@ -256,7 +305,8 @@ class SimpleResult(BaseModel):
 
 class ExtendRequest(BaseModel):
     device_id: str
-    lease_id: str
+    lease_id: str | None = None
+    lease_ids: list[str] = Field(default_factory=list, description="extend several leases at once")
     extend_seconds: int = Field(30, ge=5, le=600)
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -339,6 +389,7 @@ async def switch_event(
         ss = SwitchState(device_id=payload.device_id, states={})
         db.add(ss)
     ss.states[str(payload.channel)] = payload.state
+    await task_signals.notify(db, payload.device_id)
     await db.commit()
     return {"message": "Switch event recorded"}
 
@@ -365,6 +416,7 @@ async def valve_event(
         vs = ValveState(device_id=payload.device_id, states={})
         db.add(vs)
     vs.states[str(payload.valve_id)] = payload.state
+    await task_signals.notify(db, payload.device_id)
     await db.commit()
     return {"message": "Valve event recorded"}
 
@@ -432,6 +484,7 @@ async def toggle_switch(
             parameters={"channel": channel, "new_state": data.get("new_state")},
         )
     )
+    await task_signals.notify(db, device_id)
     await db.commit()
     return data
 
@@ -496,6 +549,7 @@ async def toggle_valve(
             parameters={"valve_id": valve_id, "new_state": data.get("new_state")},
         )
     )
+    await task_signals.notify(db, device_id)
     await db.commit()
     return data
 
@@ -528,7 +582,9 @@ async def enqueue_pump_legacy(
         parameters={"pump": body.pump, "amount": body.amount},
         status=TaskStatus.PENDING,
     )
-    db.add(task); await db.commit(); await db.refresh(task)
+    db.add(task)
+    await task_signals.notify(db, device_id)
+    await db.commit(); await db.refresh(task)
     return {"message": "Pump task enqueued", "task": task.parameters, "task_id": task.id}
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -595,9 +651,79 @@ async def enqueue_task(
         status=TaskStatus.PENDING,
     )
     db.add(task)
+    await task_signals.notify(db, req.device_id)
     await db.commit(); await db.refresh(task)
     return {"task_id": task.id, "status": "queued"}
 
+@router.post("/tasks/enqueue/bulk", summary="Enqueue tasks for many devices at once")
+async def enqueue_tasks_bulk(
+    req: BulkEnqueue,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Fleet-wide commands: one multi-row INSERT in one transaction, one
+    wake-up for all leasers.  Devices must belong to the caller, directly
+    or through a farm they own; the whole request is rejected otherwise.
+    """
+    if bool(req.tasks) == (req.selector is not None):
+        raise HTTPException(status_code=422, detail="Give either tasks or a selector")
+
+    owned = or_(
+        Device.user_id == current_user.id,
+        Device.farm_id.in_(select(Farm.id).where(Farm.user_id == current_user.id)),
+    )
+    now = datetime.now(timezone.utc)
+    if req.selector is not None:
+        if not req.type:
+            raise HTTPException(status_code=422, detail="A selector needs a task type")
+        if req.selector.farm_id is None and req.selector.device_type is None:
+            raise HTTPException(status_code=422, detail="Select by farm_id and/or device_type")
+        q = select(Device.id).where(owned, Device.is_active.is_(True))
+        if req.selector.farm_id is not None:
+            q = q.where(Device.farm_id == req.selector.farm_id)
+        if req.selector.device_type is not None:
+            q = q.where(Device.type == req.selector.device_type)
+        device_ids = (await db.scalars(q.order_by(Device.id))).all()
+        if len(device_ids) > BULK_ENQUEUE_MAX:
+            raise HTTPException(status_code=422, detail=f"Selector matches more than {BULK_ENQUEUE_MAX} devices")
+        entries = [
+            BulkTaskEntry(device_id=d, type=req.type, parameters=req.parameters,
+                          priority=req.priority, delay_seconds=req.delay_seconds)
+            for d in device_ids
+        ]
+    else:
+        entries = req.tasks
+        wanted = {e.device_id for e in entries}
+        # one array parameter: an IN list binds one per device, past asyncpg's 32767 limit
+        ids = bindparam("device_ids", sorted(wanted), type_=ARRAY(String))
+        found = set((await db.scalars(select(Device.id).where(owned, Device.id == any_(ids)))).all())
+        if missing := sorted(wanted - found):
+            raise HTTPException(status_code=404, detail=f"Unknown devices: {', '.join(missing[:10])}")
+
+    rows = [
+        {
+            "id": uuid4().hex,
+            "device_id": e.device_id,
+            "type": e.type,
+            "parameters": e.parameters,
+            "priority": e.priority,
+            "available_at": now + timedelta(seconds=e.delay_seconds) if e.delay_seconds else now,
+            "status": TaskStatus.PENDING,
+        }
+        for e in entries
+    ]
+    if rows:
+        # Core insert, batched by the driver into multi-row VALUES (no ORM unit of work)
+        await db.execute(insert(Task.__table__), rows)
+        await task_signals.notify(db, *{r["device_id"] for r in rows})
+    await db.commit()
+    # plain JSONResponse: jsonable_encoder costs more than the INSERT at this size
+    return JSONResponse({
+        "count": len(rows),
+        "tasks": [{"task_id": r["id"], "device_id": r["device_id"]} for r in rows],
+    })
+
 @router.post("/tasks/lease", response_model=LeaseResponse, summary="Lease tasks (long-poll)")
 async def lease_tasks(
     req: LeaseRequest,
@@ -606,16 +732,40 @@ async def lease_tasks(
 ):
     if token_device_id != req.device_id:
         raise HTTPException(status_code=401, detail="Token/device mismatch")
-
-    deadline = asyncio.get_running_loop().time() + req.wait_seconds
-    while True:
-        lease_id, tasks = await _lease_once(db, req.device_id, req.max_tasks, req.lease_seconds)
-        if tasks or asyncio.get_running_loop().time() >= deadline:
-            return LeaseResponse(
-                lease_id=lease_id,
-                tasks=[TaskBrief(id=t.id, type=t.type, parameters=t.parameters or {}) for t in tasks],
-            )
-        await asyncio.sleep(0.5)
+    await db.commit()  # end the auth transaction: its connection goes back to the pool
+
+    if _lease_gate.polls >= _lease_gate.max_polls:
+        metrics.inc("tasks.lease.rejected")
+        raise HTTPException(
+            status_code=http_status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many devices waiting for tasks; retry later",
+            headers={"Retry-After": str(TASK_LEASE_RETRY_SECONDS)},
+        )
+    _lease_gate.polls += 1
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + req.wait_seconds
+        while True:
+            generation = task_signals.generation(req.device_id)
+            # a session (and pooled connection) per attempt, none while parked
+            async with _lease_gate.db, AsyncSessionLocal() as session:
+                lease_id, tasks = await _lease_once(session, req.device_id, req.max_tasks, req.lease_seconds)
+                remaining = deadline - loop.time()
+                if tasks or remaining <= 0:
+                    return LeaseResponse(
+                        lease_id=lease_id,
+                        tasks=[TaskBrief(id=t.id, type=t.type, parameters=t.parameters or {}) for t in tasks],
+                    )
+                due = await _next_due(session, req.device_id)
+                await session.commit()
+            # park until an enqueue or the reaper wakes us, or a delayed task comes due
+            if due is not None:
+                remaining = min(remaining, (due - datetime.now(timezone.utc)).total_seconds() + 0.05)
+            if not task_signals.listening:
+                remaining = min(remaining, FALLBACK_POLL_SECONDS)
+            await task_signals.wait(req.device_id, generation, remaining)
+    finally:
+        _lease_gate.polls -= 1
 
 @router.post("/tasks/ack", summary="Acknowledge leased tasks (complete/fail/requeue)")
 async def ack_tasks(
@@ -626,30 +776,53 @@ async def ack_tasks(
     if token_device_id != req.device_id:
         raise HTTPException(status_code=401, detail="Token/device mismatch")
 
+    # last result per id wins; one UPDATE per outcome, each guarded by lease and status
+    outcomes = {res.id: res for res in req.results}
+    groups: dict[str, dict[str, str | None]] = {"completed": {}, "requeued": {}, "failed": {}}
+    for res in outcomes.values():
+        kind = "completed" if res.success else "requeued" if res.requeue else "failed"
+        groups[kind][res.id] = None if res.success else (res.error or "")[:255]
+
     now = datetime.now(timezone.utc)
-    for res in req.results:
-        t: Task | None = await db.get(Task, res.id)
-        if not t or t.device_id != req.device_id or t.lease_id != req.lease_id or t.status != TaskStatus.LEASED:
+    done: dict[str, str] = {}
+    for kind, errors in groups.items():
+        if not errors:
             continue
-        if res.success:
-            t.status = TaskStatus.COMPLETED
-            t.lease_id = None
-            t.leased_until = None
-            t.error_message = None
+        # array parameters, as for bulk enqueue: an IN list or a CASE binds one per task
+        ids = bindparam(f"{kind}_ids", list(errors), type_=ARRAY(String))
+        values = {"lease_id": None, "leased_until": None}
+        if kind == "completed":
+            values.update(status=TaskStatus.COMPLETED, error_message=None)
+            match = Task.id == any_(ids)
         else:
-            if res.requeue:
-                t.status = TaskStatus.PENDING
-                t.lease_id = None
-                t.leased_until = None
-                t.available_at = now + timedelta(seconds=3)
-                t.error_message = (res.error or "")[:255]
-            else:
-                t.status = TaskStatus.FAILED
-                t.lease_id = None
-                t.leased_until = None
-                t.error_message = (res.error or "")[:255]
+            per_task = func.unnest(
+                ids, bindparam(f"{kind}_errors", list(errors.values()), type_=ARRAY(String))
+            ).table_valued("id", "error")
+            values.update(
+                status=TaskStatus.PENDING if kind == "requeued" else TaskStatus.FAILED,
+                error_message=per_task.c.error,
+            )
+            match = Task.id == per_task.c.id
+            if kind == "requeued":
+                values["available_at"] = now + timedelta(seconds=3)
+        rows = await db.execute(
+            update(Task)
+            .where(
+                match,
+                Task.device_id == req.device_id,
+                Task.lease_id == req.lease_id,
+                Task.status == TaskStatus.LEASED,
+            )
+            .values(**values)
+            .returning(Task.id)
+            .execution_options(synchronize_session=False)
+        )
+        done.update((task_id, kind) for task_id, in rows)
+    if "requeued" in done.values():
+        await task_signals.notify(db, req.device_id)  # parked leasers re-check when it comes due
     await db.commit()
-    return {"ok": True}
+    # tasks not (or no longer) leased under this lease are left alone
+    return {"ok": True, "results": {task_id: done.get(task_id, "ignored") for task_id in outcomes}}
 
 @router.post("/tasks/extend", summary="Extend lease visibility timeout")
 async def extend_lease(
@@ -660,14 +833,27 @@ async def extend_lease(
     if token_device_id != req.device_id:
         raise HTTPException(status_code=401, detail="Token/device mismatch")
 
-    now = datetime.now(timezone.utc)
-    await db.execute(
+    lease_ids = list(dict.fromkeys([*([req.lease_id] if req.lease_id else []), *req.lease_ids]))
+    if not lease_ids:
+        raise HTTPException(status_code=422, detail="lease_id or lease_ids is required")
+
+    leased_until = datetime.now(timezone.utc) + timedelta(seconds=req.extend_seconds)
+    rows = await db.execute(
         update(Task)
-        .where(Task.device_id == req.device_id, Task.lease_id == req.lease_id, Task.status == TaskStatus.LEASED)
-        .values(leased_until=now + timedelta(seconds=req.extend_seconds))
+        .where(
+            Task.device_id == req.device_id,
+            Task.lease_id == any_(bindparam("lease_ids", lease_ids, type_=ARRAY(String))),
+            Task.status == TaskStatus.LEASED,
+        )
+        .values(leased_until=leased_until)
+        .returning(Task.lease_id)
+        .execution_options(synchronize_session=False)
     )
+    extended = dict.fromkeys(lease_ids, 0)  # tasks extended per lease; 0: unknown or expired
+    for lease_id, in rows:
+        extended[lease_id] += 1
     await db.commit()
-    return {"ok": True}
+    return {"ok": True, "leased_until": leased_until.isoformat(), "leases": extended}
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Simple test-compat queue (public API used by tests)
@@ -688,6 +874,7 @@ async def enqueue_simple_request(req: SimpleRequest, request: Request, db: Async
         available_at=datetime.now(timezone.utc),
     )
     db.add(task)
+    await task_signals.notify(db, req.device_id)
     await db.commit()
     await db.refresh(task)
     return {"id": task.id, "status": _public_status(task.status)}
@@ -6,7 +6,7 @@ import ipaddress
 import asyncio
 from pathlib import Path as FsPath 
 import socket
-from typing import List
+from typing import List, Optional
 import httpx
 import logging
 from fastapi import APIRouter, HTTPException, Depends, Query, Request,  WebSocket, Path as PathParam
@@ -19,11 +19,14 @@ from app.models import Device, Subscription, User
 from app.dependencies import get_current_user
 from app.core.database import get_db
 from app.services.device_controller import DeviceController
+from app.utils import rollups
+from app.utils.sensor_store import device_readings, sensor_store
 from app.schemas import (
     DosingDeviceCreate,
     SensorDeviceCreate,
     DeviceResponse,
     DeviceType,
+    RollupResponse,
     ValveDeviceCreate,
     SwitchDeviceCreate,
 )
@@ -246,9 +249,34 @@ async def get_sensor_readings(device_id: str, db: AsyncSession = Depends(get_db)
         async with httpx.AsyncClient() as client:
             r = await client.get(f"{device.http_endpoint.rstrip('/')}/sensor", timeout=5)
             r.raise_for_status()
-            return r.json()
+            data = r.json()
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Failed to fetch sensor data: {e}")
+    if isinstance(data, dict):
+        await sensor_store.record(device_readings(device, data))  # own session: this stays a read
+    return data
+
+@router.get("/{device_id}/readings/rollup", response_model=RollupResponse)
+async def get_sensor_rollup(
+    device_id: str,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    reading_type: Optional[str] = None,
+    points: int = Query(rollups.DEFAULT_POINTS, ge=1, le=rollups.MAX_POINTS),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    count/min/max/avg of the device's stored readings over time (default: the
+    last day) at the finest rollup resolution within `points` buckets.
+    """
+    try:
+        start, end = rollups.resolve_range(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    resolution, points_ = await rollups.query_rollups(
+        db, "sensor", device_id, start=start, end=end, metric=reading_type, max_points=points
+    )
+    return {"source_id": device_id, "resolution": resolution, "points": points_}
 
 @router.get("/device/{device_id}/version", summary="Get device version")
 async def get_device_version(device_id: str, db: AsyncSession = Depends(get_db)):
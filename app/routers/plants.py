@@ -1,6 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.logger import logger
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from app.core.database import get_db
@@ -11,7 +10,9 @@ from app.services.plant_service import (
     delete_plant
 )
 from app.schemas import PlantCreate, PlantDosingResponse, PlantResponse
-from app.models import Plant, SensorReading as SensorReadingModel
+from app.models import Plant
+from app.utils.sensor_cache import sensor_cache
+from app.utils.sensor_store import sensor_store
 router = APIRouter()
 
 @router.get("/", response_model=List[PlantResponse])
@@ -35,6 +36,16 @@ async def remove_plant(plant_id: str, db: AsyncSession = Depends(get_db)):
     """Delete a plant by ID."""
     return await delete_plant(plant_id, db)
 
+async def _latest_readings(db: AsyncSession, location: str) -> dict[str, float]:
+    """
+    Latest sensor readings for a location: in-process cache first, the
+    database (row or chunk storage) for whatever of pH/TDS the cache lacks.
+    """
+    cached = sensor_cache.latest_values(location=location)
+    if "ph" in cached and "tds" in cached:
+        return cached
+    return {**await sensor_store.latest(db, location=location), **cached}
+
 @router.post("/execute-dosing/{plant_id}", response_model=PlantDosingResponse)
 async def execute_dosing(plant_id: str, db: AsyncSession = Depends(get_db)):
     """
@@ -58,17 +69,13 @@ async def execute_dosing(plant_id: str, db: AsyncSession = Depends(get_db)):
     target_tds_min = getattr(plant, "target_tds_min")
     target_tds_max = getattr(plant, "target_tds_max")
     
-    # Get latest sensor readings for the plant's location.
-    readings_result = await db.execute(
-        select(SensorReadingModel).where(SensorReadingModel.location == plant.location)
-    )
-    latest_readings = readings_result.scalars().all()
+    latest_readings = await _latest_readings(db, plant.location)
     if not latest_readings:
         raise HTTPException(status_code=400, detail="No sensor readings available")
     
     # Extract pH and TDS values.
-    ph = next((r.value for r in latest_readings if r.reading_type == "ph"), None)
-    tds = next((r.value for r in latest_readings if r.reading_type == "tds"), None)
+    ph = latest_readings.get("ph")
+    tds = latest_readings.get("tds")
     if ph is None or tds is None:
         raise HTTPException(status_code=400, detail="Missing pH or TDS readings")
     
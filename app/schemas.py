@@ -190,6 +190,7 @@ class DatabaseHealthCheck(BaseModel):
 class FullHealthCheck(BaseModel):
     system: HealthCheck
     database: DatabaseHealthCheck
+    detection: Optional[Dict[str, Any]] = None
     timestamp: datetime
 
 
@@ -478,11 +479,29 @@ class DetectionRange(BaseModel):
     object_name: str
     start_time: datetime
     end_time: datetime
+    detections: Optional[int] = None
+    max_confidence: Optional[float] = None
 
 
 class CameraReportResponse(BaseModel):
     camera_id: str
     detections: List[DetectionRange]
+    next_cursor: Optional[str] = None
+
+
+class RollupPoint(BaseModel):
+    metric: str
+    bucket: datetime
+    count: int
+    min: Optional[float] = None
+    max: Optional[float] = None
+    avg: Optional[float] = None
+
+
+class RollupResponse(BaseModel):
+    source_id: str
+    resolution: int  # bucket width in seconds
+    points: List[RollupPoint]
 
 
 # -------------------- Misc Auth -------------------- #
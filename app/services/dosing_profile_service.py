@@ -9,6 +9,7 @@ from app.models import Device, DosingProfile
 from app.services.ph_tds import get_ph_tds_readings
 from app.services.llm import call_llm_async, build_dosing_prompt
 from app.schemas import DosingProfileResponse
+from app.utils.sensor_store import device_readings, sensor_store
 
 logger = logging.getLogger(__name__)
 
@@ -44,6 +45,9 @@ async def set_dosing_profile_service(
     tds = readings.get("tds")
     if ph is None or tds is None:
         raise HTTPException(status_code=502, detail="Incomplete pH/TDS readings from device")
+    # stored on their own: kept even if the dosing plan fails below, and
+    # nothing of the caller's transaction is committed with them
+    await sensor_store.record(device_readings(device, readings))
 
     # 4) Build & send LLM prompt
     try:
@@ -13,6 +13,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from app.models import Device
+from app.utils.sensor_cache import sensor_cache
 
 logger = logging.getLogger(__name__)
 
@@ -319,7 +320,9 @@ async def process_dosing_request(
     dev = (await db.execute(select(Device).where(Device.id == device_id))).scalars().first()
     if not dev:
         raise HTTPException(status_code=404, detail="Device not found")
-    prompt = await build_dosing_prompt(dev, dict(sensor_data or {}), dict(plant_profile or {}))
+    # readings the caller did not send come from the recent-readings cache
+    sensor_data = {**sensor_cache.latest_values(device_id=device_id), **dict(sensor_data or {})}
+    prompt = await build_dosing_prompt(dev, sensor_data, dict(plant_profile or {}))
     actions: list[dict[str, Any]] = []
     warnings: list[str] = []
     try:
@@ -330,7 +333,11 @@ async def process_dosing_request(
             actions.append({"pump": 2, "dose_ml": 10, "reason": "Decrease pH"})
     except Exception:
         warnings.append("Invalid pH reading")
-    result = {"actions": actions, "warnings": warnings, "meta": {"device_id": device_id}}
+    meta: dict[str, Any] = {"device_id": device_id}
+    trend = sensor_cache.window(device_id, "ph")
+    if trend.count >= 2:
+        meta["ph_trend_per_hour"] = round(trend.slope * 3600, 4)
+    result = {"actions": actions, "warnings": warnings, "meta": meta}
     return result, {"prompt": prompt}
 
 async def process_sensor_plan(
@@ -1,68 +1,192 @@
 import asyncio
+import logging
+import time
+from collections import deque
 from pathlib import Path
 from datetime import datetime, timezone
-from app.utils.detectors import get_detector
-try:
-    import cv2  # type: ignore
-except Exception:  # pragma: no cover
-    cv2 = None
-from app.core.config    import DATA_ROOT, RAW_DIR, PROCESSED_DIR, YOLO_MODEL_PATH, CAM_DETECTION_WORKERS
+from sqlalchemy import select
+from app.utils import metrics
+from app.utils.detection_events import event_builder
+from app.utils.detection_pool import DetectionPool
+from app.utils.detection_service import DetectionClient
+from app.utils.frame_hub import frame_hub
+from app.utils.frame_store import PROCESSED, frame_store
+from app.utils.motion_gate import MotionGate
+from app.utils.retention import storage_index
+from app.core.config    import (
+    DATA_ROOT, PROCESSED_DIR, CAM_DETECTION_WORKERS, CAM_QUEUE_MAX_CAMERAS, CAM_DETECTION_SOCKET,
+    CAM_DETECTION_TIMEOUT, CAM_DETECT_BATCH_SIZE,
+)
 from app.core.database  import AsyncSessionLocal
-from app.models         import DetectionRecord
+from app.models         import Camera
+
+logger = logging.getLogger(__name__)
+
+# how often per-camera settings (motion threshold) are re-read
+SETTINGS_REFRESH_SECONDS = 60
+
+
+def _write_processed(out_path: Path, data: bytes) -> None:
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_bytes(data)
+
 
 class CameraQueue:
-    def __init__(self):
-        self.queue    = asyncio.Queue()
-        self.detector = get_detector()
+    """
+    Detection scheduler keyed by camera.
+
+    Each camera has at most one pending frame: a newer upload replaces the
+    one still waiting (latest frame wins), so memory is bounded by
+    `max_cameras` frames and detection always sees the freshest image.
+    Cameras are served round-robin and never have more than one frame in
+    detection at a time, so a chatty camera cannot starve the others.
+
+    Frames that barely differ from the camera's previous one (`MotionGate`)
+    skip inference and are recorded with the last detections.
+    """
+
+    def __init__(self, max_cameras: int = CAM_QUEUE_MAX_CAMERAS):
+        self.max_cameras = max_cameras
         self.workers  = CAM_DETECTION_WORKERS
+        # YOLO lives in the pool processes, never in the API worker: either the
+        # shared detection service (gunicorn) or a pool of our own
+        if CAM_DETECTION_SOCKET:
+            self.pool = DetectionClient(
+                CAM_DETECTION_SOCKET, CAM_DETECTION_TIMEOUT, self.workers * CAM_DETECT_BATCH_SIZE,
+            )
+        else:
+            self.pool = DetectionPool(workers=self.workers)
+        self.gate     = MotionGate()
+        self._pending: dict[str, tuple[Path, bytes | None, float]] = {}
+        self._ready: deque[str] = deque()   # cameras with a pending frame and none in flight
+        self._busy: set[str] = set()
+        self._wakeup = asyncio.Event()
+        self.coalesced = 0
+        self.rejected  = 0
+        self.dropped_by_camera: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, camera_id: str, frame_path: Path, data: bytes | None = None) -> bool:
+        """
+        Offer a newly saved raw frame (optionally with its bytes) for detection.
+        Returns False when the frame was refused because the queue is full.
+        """
+        entry = (frame_path, data, time.perf_counter())
+        if camera_id in self._pending:
+            self._pending[camera_id] = entry
+            self._drop(camera_id, "camera.detect.coalesced")
+            self.coalesced += 1
+            return True
+        if len(self._pending) >= self.max_cameras:
+            self._drop(camera_id, "camera.detect.rejected")
+            self.rejected += 1
+            return False
+        self._pending[camera_id] = entry
+        if camera_id not in self._busy:
+            self._ready.append(camera_id)
+            self._wakeup.set()
+        return True
+
+    def _drop(self, camera_id: str, metric: str) -> None:
+        self.dropped_by_camera[camera_id] = self.dropped_by_camera.get(camera_id, 0) + 1
+        metrics.inc(metric)
 
-    async def enqueue(self, camera_id: str, frame_path: Path):
-        """Push a newly saved raw frame into the detection queue."""
-        await self.queue.put((camera_id, frame_path))
+    async def _next(self) -> tuple[str, Path, bytes | None, float]:
+        while not self._ready:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        camera_id = self._ready.popleft()
+        self._busy.add(camera_id)
+        return (camera_id, *self._pending.pop(camera_id))
+
+    def _done(self, camera_id: str) -> None:
+        self._busy.discard(camera_id)
+        if camera_id in self._pending:
+            # a newer frame arrived meanwhile – back of the round-robin line
+            self._ready.append(camera_id)
+            self._wakeup.set()
 
     async def _worker(self):
+        loop = asyncio.get_running_loop()
         while True:
-            camera_id, frame_path = await self.queue.get()
+            camera_id, frame_path, data, queued_at = await self._next()
             try:
-                if cv2 is None:
-                    # CV stack not available in CI – skip gracefully
-                    continue
-                frame = cv2.imread(str(frame_path))                
-                if frame is None:
-                    continue
-
-                # Run YOLO inference
-                annotated, dets = self.detector.detect_and_annotate(frame)
+                if data is None:
+                    data = await loop.run_in_executor(None, frame_path.read_bytes)
+
+                if await loop.run_in_executor(None, self.gate.changed, camera_id, data):
+                    # Run YOLO inference in the pool (frame handed over via shared memory)
+                    annotated, dets = await self.pool.detect(data)
+                    self.gate.remember(camera_id, dets)
+                else:
+                    # static scene: keep the previous annotated frame, reuse its detections
+                    annotated, dets = None, self.gate.last(camera_id)
                 if dets:
-                    # save annotated
-                    proc_dir = Path(DATA_ROOT)/camera_id/PROCESSED_DIR
-                    proc_dir.mkdir(parents=True, exist_ok=True)
-                    out_path  = proc_dir/frame_path.name
-                    cv2.imwrite(str(out_path), annotated)
-
-                    # Record each detection
-                    async with AsyncSessionLocal() as session:
-                        for det in dets:
-                            name      = det["name"]
-                            record    = DetectionRecord(
-                                camera_id=camera_id,
-                                object_name=name,
-                                timestamp=datetime.now(timezone.utc)
-                            )
-                            session.add(record)
-                        await session.commit()
-
-            except Exception as e:
-                # you’d normally use proper logging
-                print(f"[camera_queue] error: {e}")
+                    # save annotated (and keep it in memory for still/stream)
+                    out_path = Path(DATA_ROOT)/camera_id/PROCESSED_DIR/frame_path.name
+                    if annotated:
+                        await loop.run_in_executor(None, _write_processed, out_path, annotated)
+                        storage_index.record(camera_id, out_path, len(annotated))
+                        frame_hub.publish(frame_store.put(camera_id, annotated, PROCESSED))
+                    elif (previous := frame_store.get(camera_id, PROCESSED)) is not None:
+                        frame_hub.publish(previous)  # live viewers keep the annotated view
+
+                    # fold into the camera's open detection events (written behind)
+                    event_builder.observe(camera_id, dets, datetime.now(timezone.utc))
+
+            except Exception:
+                logger.exception("[camera_queue] detection failed for %s", camera_id)
             finally:
-                self.queue.task_done()
+                metrics.observe("camera.detect.latency", time.perf_counter() - queued_at)
+                self._done(camera_id)
+
+    async def refresh_settings(self) -> None:
+        """Load per-camera motion thresholds from `Camera.settings`."""
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(select(Camera.id, Camera.settings))).all()
+        thresholds = {}
+        for camera_id, settings in rows:
+            value = (settings or {}).get("motion_threshold") if isinstance(settings, dict) else None
+            if value is not None:
+                try:
+                    thresholds[camera_id] = float(value)
+                except (TypeError, ValueError):
+                    logger.warning("[camera_queue] bad motion_threshold for %s: %r", camera_id, value)
+        self.gate.thresholds = thresholds
+
+    async def _settings_loop(self):
+        while True:
+            try:
+                await self.refresh_settings()
+            except Exception:
+                logger.exception("[camera_queue] failed to load camera settings")
+            await asyncio.sleep(SETTINGS_REFRESH_SECONDS)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self._pending),
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "motion_skip_rate": self.gate.skip_rate(),
+            **self.pool.stats(),
+        }
 
     def start_workers(self):
-        """Spawn N background tasks on the running loop."""
+        """Start the detection pool and enough feeder tasks to fill its batches."""
+        self.pool.start()
         loop = asyncio.get_event_loop()
-        for _ in range(self.workers):
+        loop.create_task(self._settings_loop())
+        for _ in range(self.pool.capacity):
             loop.create_task(self._worker())
 
+    def shutdown(self):
+        self.pool.shutdown()
+
 # Singleton queue
 camera_queue = CameraQueue()
+metrics.register_gauge("camera.detect.queue_depth", camera_queue.__len__)
+metrics.register_gauge("camera.detect.in_flight", lambda: camera_queue.pool.in_flight)
+metrics.register_gauge("camera.detect.utilisation", camera_queue.pool.utilisation)
+metrics.register_gauge("camera.motion.skip_rate", camera_queue.gate.skip_rate)
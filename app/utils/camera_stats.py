@@ -0,0 +1,176 @@
+# app/utils/camera_stats.py
+"""
+Write-behind camera counters.
+
+Per-frame bookkeeping (`frames_received`, `last_seen`, `clips_count`,
+`last_clip_time`, `storage_used`) is aggregated in memory per worker and
+written every `CAM_STATS_FLUSH_SECONDS` with a single statement for all
+cameras that changed:
+
+    UPDATE cameras SET frames_received = cameras.frames_received + v.frames, …
+    FROM (VALUES (:id, :frames, :clips, :mb, :seen, :clip_time), …) AS v
+    WHERE cameras.id = v.id
+
+so the `cameras` rows stop being a lock hot spot.  `add()` is thread-safe
+(clip rotations are counted on the clip-writer threads); `pending()` lets
+readers such as `cam_status` merge what has not been flushed yet.  The
+remainder is flushed on shutdown.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime
+
+from sqlalchemy import DateTime, Float, Integer, String, case, cast, column, update, values
+
+from app.core.config import CAM_STATS_FLUSH_SECONDS
+from app.core.database import AsyncSessionLocal
+from app.models import Camera
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 ** 2
+
+
+@dataclass
+class CameraDelta:
+    frames: int = 0
+    clips: int = 0
+    nbytes: int = 0
+    last_seen: datetime | None = None
+    last_clip_time: datetime | None = None
+
+    def merge(self, other: "CameraDelta") -> None:
+        self.frames += other.frames
+        self.clips += other.clips
+        self.nbytes += other.nbytes
+        self.last_seen = _later(self.last_seen, other.last_seen)
+        self.last_clip_time = _later(self.last_clip_time, other.last_clip_time)
+
+
+def _later(a: datetime | None, b: datetime | None) -> datetime | None:
+    if a is None or (b is not None and b > a):
+        return b
+    return a
+
+
+def _latest(current, incoming):
+    """SQL: the later of two nullable timestamps."""
+    # a VALUES column that is NULL in every row would otherwise be text
+    incoming = cast(incoming, DateTime(timezone=True))
+    return case(
+        (incoming.is_(None), current),
+        (current.is_(None), incoming),
+        (incoming > current, incoming),
+        else_=current,
+    )
+
+
+class CameraStats:
+    def __init__(self, interval: float = CAM_STATS_FLUSH_SECONDS):
+        self.interval = interval
+        self._pending: dict[str, CameraDelta] = {}
+        self._lock = threading.Lock()
+        self.flushes = 0
+
+    def add(
+        self,
+        camera_id: str,
+        *,
+        frames: int = 0,
+        clips: int = 0,
+        nbytes: int = 0,
+        seen: datetime | None = None,
+        clip_time: datetime | None = None,
+    ) -> None:
+        """Accumulate a change for `camera_id`. O(1), safe from any thread."""
+        with self._lock:
+            delta = self._pending.get(camera_id)
+            if delta is None:
+                delta = self._pending[camera_id] = CameraDelta()
+            delta.frames += frames
+            delta.clips += clips
+            delta.nbytes += nbytes
+            if seen is not None:
+                delta.last_seen = _later(delta.last_seen, seen)
+            if clip_time is not None:
+                delta.last_clip_time = _later(delta.last_clip_time, clip_time)
+
+    def pending(self, camera_id: str) -> CameraDelta | None:
+        """A copy of the not-yet-flushed delta of `camera_id`, if any."""
+        with self._lock:
+            delta = self._pending.get(camera_id)
+            return replace(delta) if delta is not None else None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def flush(self) -> int:
+        """Write all pending deltas in one UPDATE; returns the cameras written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        v = values(
+            column("id", String),
+            column("frames", Integer),
+            column("clips", Integer),
+            column("mb", Float),
+            column("seen", DateTime(timezone=True)),
+            column("clip_time", DateTime(timezone=True)),
+            name="v",
+        ).data([
+            (cam_id, d.frames, d.clips, d.nbytes / MB, d.last_seen, d.last_clip_time)
+            for cam_id, d in pending.items()
+        ])
+        t = Camera.__table__
+        used = t.c.storage_used + v.c.mb
+        stmt = (
+            update(t)
+            .where(t.c.id == v.c.id)
+            .values(
+                frames_received=t.c.frames_received + v.c.frames,
+                clips_count=t.c.clips_count + v.c.clips,
+                storage_used=case((used < 0, 0.0), else_=used),
+                last_seen=_latest(t.c.last_seen, v.c.seen),
+                last_clip_time=_latest(t.c.last_clip_time, v.c.clip_time),
+            )
+        )
+        start = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(stmt)
+                await session.commit()
+        except Exception:
+            # keep the deltas (merged with anything added meanwhile) for the next try
+            with self._lock:
+                for cam_id, delta in pending.items():
+                    current = self._pending.get(cam_id)
+                    if current is None:
+                        self._pending[cam_id] = delta
+                    else:
+                        current.merge(delta)
+            raise
+        self.flushes += 1
+        metrics.observe("camera.stats.flush", time.perf_counter() - start)
+        metrics.inc("camera.stats.rows", len(pending))
+        return len(pending)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Camera stats flush failed")
+
+
+camera_stats = CameraStats()
+metrics.register_gauge("camera.stats.pending", camera_stats.__len__)
@@ -8,12 +8,15 @@ Responsibilities
    loop) and draw bounding boxes on a cleaned version of the frame.
 2. **Crop every “leaf” detection** and hand the crop to the (external)
    Plant-Village disease classifier *without* blocking the main path.
-3. **Append the frame to a rolling MP4 clip** (one clip ≈ CLIP_DURATION) using
-   a per-camera `cv2.VideoWriter`.  Clips older than `RETENTION_DAYS` are
-   purged automatically.
-4. **Maintain camera stats** (`frames_received`, `clips_count`, `storage_used`)
-   and `detection_records` in the database – all inside a single fast
-   `async_session`.
+3. **Append the frame to a rolling MP4 clip** (one clip ≈ CLIP_DURATION) via
+   the threaded `clip_writer` service.  Every file written is recorded in
+   `storage_index`; the retention sweeper ages it out and keeps
+   `storage_used` up to date.
+4. **Fold detections into `detection_events`** – the batch goes through
+   `event_builder` and its changed events are upserted in one statement
+   (cameras without a `cameras` row are skipped there).  Camera counters
+   are write-behind (`camera_stats`): frames are counted on upload, clips
+   by the clip writer.
 """
 
 from __future__ import annotations
@@ -21,29 +24,28 @@ from __future__ import annotations
 import asyncio
 import logging
 import os
-from datetime import datetime, timedelta, timezone
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
 
 import cv2
 import numpy as np
-from sqlalchemy import func, select
 from app.utils.detectors import get_detector
+from app.utils.frame_store import PROCESSED, frame_store
 from app.core.config import (
     BOUNDARY,
     CAM_DETECTION_WORKERS,
     CLIPS_DIR,
     DATA_ROOT,
-    FPS,
-    OFFLINE_TIMEOUT,
     PROCESSED_DIR,
     RAW_DIR,
-    RETENTION_DAYS,
     YOLO_MODEL_PATH,
 )
-from app.core.database import AsyncSessionLocal
-from app.models import Camera, DetectionRecord
+from app.utils.clip_writer import clip_writer
+from app.utils.detection_events import event_builder
 from app.utils.image_utils import clean_frame, is_day
+from app.utils.retention import storage_index
 
 # --------------------------------------------------------------------------- #
 # Globals                                                                     #
@@ -54,10 +56,6 @@ os.environ.setdefault("OPENCV_LOG_LEVEL", "SILENT")
 _executor = asyncio.get_event_loop().run_in_executor
 _detector = get_detector()
 
-# share the clip-writer dictionaries used by routers.cameras
-from app.routers.cameras import _clip_writers, _clip_locks, CLIP_DURATION  # noqa
-
-FOURCC = cv2.VideoWriter_fourcc(*"mp4v")
 
 
 # --------------------------------------------------------------------------- #
@@ -77,9 +75,9 @@ def _ensure_dirs(cam_id: str) -> tuple[Path, Path, Path]:
     return raw, proc, clips
 
 
-def _annotate(img: np.ndarray) -> tuple[np.ndarray, list[dict[str, Any]]]:
+def _annotate_batch(imgs: list[np.ndarray]) -> list[tuple[np.ndarray, list[dict[str, Any]]]]:
     """Delegate to configured detector (YOLO in prod; stub in CI)."""
-    return _detector.detect_and_annotate(img)
+    return _detector.detect_batch(imgs)
 
 async def _call_disease_model(crop_path: Path) -> None:
     """
@@ -92,184 +90,108 @@ async def _call_disease_model(crop_path: Path) -> None:
         logger.warning("Plant-Village request failed for %s – %s", crop_path, exc)
 
 
-async def _update_camera_stats(
-    sess: Any, cam: Camera, added_bytes: int = 0, new_clip: bool = False
-) -> None:
-    cam.frames_received = (cam.frames_received or 0) + 1
-    if new_clip:
-        cam.clips_count = (cam.clips_count or 0) + 1
-        cam.last_clip_time = func.now()
-    cam.storage_used = (cam.storage_used or 0.0) + added_bytes / 1024 ** 2
-    cam.last_seen = func.now()
-    await sess.commit()
-
-
 # --------------------------------------------------------------------------- #
-# Clip writer                                                                 #
+# Frame pipeline: decode → clean → detect → persist                          #
 # --------------------------------------------------------------------------- #
-async def _write_to_clip(cam_id: str, frame: np.ndarray, clips_dir: Path) -> bool:
-    """
-    Append `frame` to the current mp4 clip (rotates every CLIP_DURATION).
-    Returns True if a *new* clip was started.
-    """
-    lock = _clip_locks.setdefault(cam_id, asyncio.Lock())
-    now = datetime.now(timezone.utc)
-    async with lock:
-        writer_info = _clip_writers.get(cam_id)
-        rotate = False
+PERSIST_BATCH = 32  # frames per detector call / DB commit
+
 
-        if not writer_info:
-            rotate = True
-        else:
-            started: datetime = writer_info["start"]
-            if (now - started) >= CLIP_DURATION:
-                writer_info["writer"].release()
-                rotate = True
+@dataclass
+class _Processed:
+    raw_path: Path
+    annotated: np.ndarray
+    jpeg: bytes
+    detections: list[dict[str, Any]]
+    written: list[tuple[Path, int]]  # (path, size) of every file created
+    crops: list[Path]
 
-        if rotate:
-            out_path = clips_dir / f"{int(now.timestamp() * 1000)}.mp4"
-            h, w, _ = frame.shape
-            writer = cv2.VideoWriter(str(out_path), FOURCC, FPS, (w, h))
-            _clip_writers[cam_id] = {"writer": writer, "start": now}
 
-        _clip_writers[cam_id]["writer"].write(frame)
-        return rotate
+def _frame_time(raw_path: Path) -> datetime:
+    """raw/<epoch-ms>.jpg → capture time (falls back to now)."""
+    try:
+        return datetime.fromtimestamp(int(raw_path.stem) / 1000, timezone.utc)
+    except ValueError:
+        return datetime.now(timezone.utc)
 
 
-def _purge_old_clips(clips_dir: Path) -> None:
+def _process_batch(raw_paths: list[Path], proc_dir: Path) -> list[_Processed]:
     """
-    Delete clips older than RETENTION_DAYS.
+    All CPU / disk work for one batch, in one executor hop: decode and clean
+    every frame, run the detector once over the batch, then write the
+    annotated JPEG and leaf crops.  Undecodable frames are dropped.
     """
-    if RETENTION_DAYS <= 0:
-        return
-    cutoff = datetime.now(timezone.utc) - timedelta(days=RETENTION_DAYS)
-    for mp4 in clips_dir.glob("*.mp4"):
-        ts = datetime.fromtimestamp(int(mp4.stem) / 1000, timezone.utc)
-        if ts < cutoff:
-            try:
-                mp4.unlink()
-            except Exception:
-                logger.warning("Failed to delete old clip %s", mp4)
-
-
-# --------------------------------------------------------------------------- #
-# Public entry-point                                                          #
-# --------------------------------------------------------------------------- #
-async def encode_and_cleanup(cam_id: str) -> None:
+    decoded: list[tuple[Path, np.ndarray]] = []
+    for raw_path in raw_paths:
+        img = cv2.imread(str(raw_path))
+        if img is None:
+            logger.warning("Unreadable frame %s", raw_path)
+            continue
+        decoded.append((raw_path, clean_frame(img, is_day(img))))
+    if not decoded:
+        return []
+
+    results = _annotate_batch([cleaned for _, cleaned in decoded])
+
+    out: list[_Processed] = []
+    for (raw_path, cleaned), (annotated, detections) in zip(decoded, results):
+        ok, buf = cv2.imencode(".jpg", annotated)
+        jpeg = buf.tobytes() if ok else b""
+        written: list[tuple[Path, int]] = []
+        if jpeg:
+            out_path = proc_dir / f"{raw_path.stem}_processed.jpg"
+            out_path.write_bytes(jpeg)
+            written.append((out_path, len(jpeg)))
+
+        crops: list[Path] = []
+        for det in detections:
+            if det.get("name", "").lower() == "leaf":
+                x1, y1, x2, y2 = det["bbox"]
+                leaf_dir = proc_dir / "leaf"
+                leaf_dir.mkdir(exist_ok=True)
+                crop_path = leaf_dir / f"{raw_path.stem}_leaf.jpg"
+                if cv2.imwrite(str(crop_path), cleaned[y1:y2, x1:x2]):
+                    written.append((crop_path, crop_path.stat().st_size))
+                crops.append(crop_path)
+        out.append(_Processed(raw_path, annotated, jpeg, detections, written, crops))
+    return out
+
+
+async def encode_and_cleanup(cam_id: str, batch_size: int = PERSIST_BATCH) -> None:
     """
-    Process every raw JPEG for `cam_id` *once*.
+    Process every raw JPEG for `cam_id` exactly once.
+
+    Frames go through the pipeline in batches; per batch there is one
+    detector call and one upsert of detection events.  Clip encoding
+    happens on the clip-writer threads; retention is left to the background
+    sweeper.
     """
     raw_dir, proc_dir, clips_dir = _ensure_dirs(cam_id)
     raw_files = sorted(raw_dir.glob("*.jpg"))
     if not raw_files:
         return
 
-    async with AsyncSessionLocal() as sess:
-        cam = await sess.get(Camera, cam_id)
-
-        for raw_path in raw_files:
-            try:
-                img = cv2.imread(str(raw_path))
-                if img is None:
-                    raw_path.unlink(missing_ok=True)
-                    continue
-
-                # 1) pre-clean
-                cleaned = clean_frame(img, is_day(img))
-
-                # 2) YOLO
-                loop = asyncio.get_running_loop()
-                annotated, detections = await loop.run_in_executor(
-                    None, _annotate, cleaned.copy()
-                )
-
-                # 3) store annotated frame
-                proc_path = proc_dir / f"{raw_path.stem}_processed.jpg"
-                cv2.imwrite(str(proc_path), annotated)
-
-                # 4) leaf crops
-                for det in detections:
-                    if det.get("name", "").lower() == "leaf":
-                        x1, y1, x2, y2 = det["bbox"]
-                        crop = cleaned[y1:y2, x1:x2]
-                        leaf_dir = proc_dir / "leaf"
-                        leaf_dir.mkdir(exist_ok=True)
-                        crop_path = leaf_dir / f"{raw_path.stem}_leaf.jpg"
-                        cv2.imwrite(str(crop_path), crop)
-                        # fire-and-forget disease classifier (non-blocking)
-                        asyncio.create_task(_call_disease_model(crop_path))
-        
-                # 5) persist detections (one row per detection)
-                if cam:
-                    for det in detections:
-                        try:
-                            name = det.get("name", "")
-                            if name:
-                                sess.add(DetectionRecord(
-                                    camera_id=cam_id,
-                                    object_name=name,
-                                    timestamp=func.now(),
-                                ))
-                        except Exception:
-                            pass
-                # 6) append to rolling clip, update stats, purge old content
-                started_new_clip = await _write_to_clip(cam_id, annotated, clips_dir)
-                try:
-                    added_bytes = raw_path.stat().st_size
-                except Exception:
-                    added_bytes = 0
-                await _update_camera_stats(sess, cam, added_bytes=added_bytes, new_clip=started_new_clip)
-                _purge_old_clips(clips_dir)
-
-                # 7) delete raw file after processing so it isn’t reprocessed
-                try:
-                    raw_path.unlink(missing_ok=True)
-                except Exception:
-                    pass
-                # 8) append to clip
-                new_clip = await _write_to_clip(cam_id, cleaned, clips_dir)
-
-                # 9) update stats
-                if cam:
-                    added = raw_path.stat().st_size + proc_path.stat().st_size
-                    await _update_camera_stats(sess, cam, added_bytes=added, new_clip=new_clip)
-
-                # 10) detection records
-                if detections:
-                    for det in detections:
-                        record = DetectionRecord(
-                            camera_id=cam_id,
-                            object_name=det["name"],
-                            timestamp=datetime.now(timezone.utc),
-                        )
-                        await sess.merge(record)
-                    await sess.commit()
-
-            except Exception:
-                logger.exception("Processing error (%s)", raw_path)
-            finally:
+    loop = asyncio.get_running_loop()
+    for i in range(0, len(raw_files), batch_size):
+        batch = raw_files[i:i + batch_size]
+        try:
+            processed = await loop.run_in_executor(None, _process_batch, batch, proc_dir)
+
+            for frame in processed:
+                for path, size in frame.written:
+                    storage_index.record(cam_id, path, size)
+                if frame.jpeg:
+                    frame_store.put(cam_id, frame.jpeg, PROCESSED)
+                for crop_path in frame.crops:
+                    # fire-and-forget disease classifier (non-blocking)
+                    asyncio.create_task(_call_disease_model(crop_path))
+                clip_writer.submit(cam_id, frame.annotated, clips_dir)
+                event_builder.observe(cam_id, frame.detections, _frame_time(frame.raw_path))
+
+            await event_builder.flush()
+        except Exception:
+            logger.exception("Processing error (%s, %d frames)", cam_id, len(batch))
+        finally:
+            # never reprocess a raw frame, whatever happened to it
+            for raw_path in batch:
                 raw_path.unlink(missing_ok=True)
-
-        _purge_old_clips(clips_dir)
-
-
-# --------------------------------------------------------------------------- #
-# Camera offline/online watcher (unchanged API)                               #
-# --------------------------------------------------------------------------- #
-async def offline_watcher(db_factory, interval_seconds: float = 30.0):
-    """
-    Periodically mark cameras as online/offline based on `last_seen`.
-    """
-    logger.info("Camera offline-watcher running every %.0fs", interval_seconds)
-    while True:
-        await asyncio.sleep(interval_seconds)
-        now = datetime.now(timezone.utc)
-        async with db_factory() as sess:
-            rows = await sess.execute(select(Camera))
-            for cam in rows.scalars().all():
-                last = cam.last_seen or datetime(1970, 1, 1, tzinfo=timezone.utc)
-                online = (now - last).total_seconds() <= OFFLINE_TIMEOUT
-                if cam.is_online != online:
-                    cam.is_online = online
-                    logger.info("Camera %s online=%s", cam.id, online)
-            await sess.commit()
+                storage_index.forget(cam_id, raw_path)
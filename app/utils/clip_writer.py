@@ -0,0 +1,227 @@
+# app/utils/clip_writer.py
+"""
+Rolling MP4 clips, encoded off the event loop.
+
+`submit()` only appends the frame to the camera's bounded queue (oldest
+frame dropped when full) and, if nobody is draining that camera yet, hands a
+drain job to a small thread pool.  A camera is drained by one thread at a
+time, so its writer needs no further locking from callers.
+
+Open `cv2.VideoWriter`s are kept in an LRU capped at `CAM_CLIP_MAX_OPEN`;
+writers idle for `CAM_CLIP_IDLE_SECONDS` are closed by `sweep_idle()` and the
+camera's state is dropped entirely, so thousands of cameras cost memory only
+while they are actually sending frames.  Rotation (every `CLIP_DURATION`)
+and the shutdown flush go through this service.  Each new clip is counted
+in `camera_stats` and each finished one is handed to `storage_index`, so the
+retention sweeper can age it out.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from app.core.config import (
+    CAM_CLIP_IDLE_SECONDS,
+    CAM_CLIP_MAX_OPEN,
+    CAM_CLIP_QUEUE_SIZE,
+    CAM_CLIP_THREADS,
+    FPS,
+)
+from app.utils import metrics
+from app.utils.camera_stats import CameraStats, camera_stats
+from app.utils.retention import storage_index
+
+logger = logging.getLogger(__name__)
+
+CLIP_DURATION = timedelta(minutes=10)
+FOURCC = cv2.VideoWriter_fourcc(*"mp4v")
+
+
+class _Camera:
+    __slots__ = ("cam_id", "clips_dir", "frames", "lock", "scheduled",
+                 "writer", "path", "start", "last_write", "dropped")
+
+    def __init__(self, cam_id: str, clips_dir: Path, queue_size: int):
+        self.cam_id = cam_id
+        self.clips_dir = clips_dir
+        self.frames: deque[np.ndarray] = deque(maxlen=queue_size)
+        self.lock = threading.Lock()        # held while draining / closing
+        self.scheduled = False
+        self.writer: cv2.VideoWriter | None = None
+        self.path: Path | None = None
+        self.start: datetime | None = None
+        self.last_write = time.monotonic()
+        self.dropped = 0
+
+
+class ClipWriterService:
+    def __init__(
+        self,
+        threads: int = CAM_CLIP_THREADS,
+        queue_size: int = CAM_CLIP_QUEUE_SIZE,
+        max_open: int = CAM_CLIP_MAX_OPEN,
+        idle_seconds: float = CAM_CLIP_IDLE_SECONDS,
+        clip_duration: timedelta = CLIP_DURATION,
+        stats: CameraStats = camera_stats,
+    ):
+        self.queue_size = queue_size
+        self.max_open = max(1, max_open)
+        self.idle_seconds = idle_seconds
+        self.clip_duration = clip_duration
+        self.stats = stats
+        self._threads = max(1, threads)
+        self._pool: ThreadPoolExecutor | None = None
+        self._cameras: dict[str, _Camera] = {}
+        self._open: OrderedDict[str, _Camera] = OrderedDict()   # LRU of open writers
+        self._state = threading.Lock()      # guards _cameras / _open / scheduled
+
+    # ----------------------------------------------------------------- API --
+    def submit(self, cam_id: str, frame: np.ndarray, clips_dir: Path) -> None:
+        """Queue `frame` for the camera's current clip. Never blocks."""
+        with self._state:
+            cam = self._cameras.get(cam_id)
+            if cam is None:
+                cam = self._cameras[cam_id] = _Camera(cam_id, clips_dir, self.queue_size)
+            if len(cam.frames) == cam.frames.maxlen:
+                cam.dropped += 1
+                metrics.inc("camera.clip.dropped")
+            cam.frames.append(frame)
+            if cam.scheduled:
+                return
+            cam.scheduled = True
+        self._executor().submit(self._drain, cam)
+
+    def flush(self, cam_id: str) -> None:
+        """Synchronously write everything queued for `cam_id` (tests, shutdown)."""
+        cam = self._cameras.get(cam_id)
+        if cam is not None:
+            self._drain(cam)
+
+    def sweep_idle(self) -> int:
+        """Close writers idle for longer than `idle_seconds`; returns how many."""
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._state:
+            idle = [c for c in self._cameras.values()
+                    if not c.scheduled and not c.frames and c.last_write < cutoff]
+        closed = 0
+        for cam in idle:
+            if not cam.lock.acquire(blocking=False):
+                continue
+            try:
+                with self._state:
+                    if cam.frames or cam.scheduled:
+                        continue  # woke up meanwhile
+                    self._cameras.pop(cam.cam_id, None)
+                    self._open.pop(cam.cam_id, None)
+                if cam.writer is not None:
+                    self._release(cam)
+                    closed += 1
+            finally:
+                cam.lock.release()
+        if closed:
+            metrics.inc("camera.clip.idle_closed", closed)
+        return closed
+
+    async def run_idle_sweeper(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_seconds / 2))
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.sweep_idle)
+            except Exception:
+                logger.exception("Clip idle sweep failed")
+
+    def open_writers(self) -> int:
+        return len(self._open)
+
+    def shutdown(self) -> None:
+        """Flush every queue and close every writer (main.on_shutdown)."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        for cam in list(self._cameras.values()):
+            self._drain(cam)
+            with cam.lock:
+                self._release(cam)
+        self._cameras.clear()
+        self._open.clear()
+
+    # ------------------------------------------------------------ internals --
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self._threads, thread_name_prefix="clip-writer")
+        return self._pool
+
+    def _drain(self, cam: _Camera) -> None:
+        with cam.lock:
+            while True:
+                with self._state:
+                    if not cam.frames:
+                        cam.scheduled = False
+                        return
+                    frame = cam.frames.popleft()
+                try:
+                    self._write(cam, frame)
+                except Exception:
+                    logger.exception("Clip write failed for %s", cam.cam_id)
+
+    def _write(self, cam: _Camera, frame: np.ndarray) -> None:
+        now = datetime.now(timezone.utc)
+        if cam.writer is None or now - cam.start >= self.clip_duration:
+            self._release(cam)
+            cam.clips_dir.mkdir(parents=True, exist_ok=True)
+            cam.path = cam.clips_dir / f"{int(now.timestamp() * 1000)}.mp4"
+            h, w = frame.shape[:2]
+            cam.writer = cv2.VideoWriter(str(cam.path), FOURCC, FPS, (w, h))
+            cam.start = now
+            self.stats.add(cam.cam_id, clips=1, clip_time=now)
+            metrics.inc("camera.clip.rotated")
+            self._touch(cam)
+        else:
+            with self._state:
+                self._open.move_to_end(cam.cam_id)
+        cam.writer.write(frame)
+        cam.last_write = time.monotonic()
+
+    def _touch(self, cam: _Camera) -> None:
+        """Register a freshly opened writer and evict the LRU ones over the cap."""
+        with self._state:
+            self._open[cam.cam_id] = cam
+            self._open.move_to_end(cam.cam_id)
+            victims = [c for c in self._open.values() if c is not cam][: max(0, len(self._open) - self.max_open)]
+        for victim in victims:
+            # a victim busy draining is skipped; it will be closed when idle
+            if victim.lock.acquire(blocking=False):
+                try:
+                    self._release(victim)
+                    metrics.inc("camera.clip.lru_closed")
+                finally:
+                    victim.lock.release()
+
+    def _release(self, cam: _Camera) -> None:
+        if cam.writer is not None:
+            try:
+                cam.writer.release()
+            except Exception:
+                logger.warning("Failed to close clip %s", cam.path)
+            cam.writer = None
+            try:
+                storage_index.record(cam.cam_id, cam.path, os.path.getsize(cam.path), cam.start.timestamp())
+            except OSError:
+                pass
+        with self._state:
+            self._open.pop(cam.cam_id, None)
+
+
+clip_writer = ClipWriterService()
+metrics.register_gauge("camera.clip.open_writers", clip_writer.open_writers)
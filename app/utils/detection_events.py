@@ -0,0 +1,260 @@
+# app/utils/detection_events.py
+"""
+Ingest-time detection events.
+
+Instead of one `DetectionRecord` per object per frame, the detection path
+calls `event_builder.observe()`.  For every (camera, object class) the
+builder keeps the open event in memory and stretches its `end_time` while
+detections keep arriving within `CAM_EVENT_GAP_SECONDS`; a longer gap closes
+it and opens the next one.  Each event is one `DetectionEvent` row with the
+number of detections folded into it and their highest confidence.
+
+Rows are written behind: every `CAM_EVENT_FLUSH_SECONDS` all new or changed
+events go out in one multi-row upsert (by event id), so an ongoing event is
+visible to the report after one flush and a closed one is written exactly
+once more at most.  Idle events are closed by the same flush.  Gunicorn
+workers build events independently; the report merges overlapping events
+of the same class.
+
+Camera ids come straight from the upload token, which does not imply a
+`cameras` row.  Events of cameras without one are dropped at flush time
+(`camera.events.unknown_camera`) rather than failing the upsert for every
+camera; a batch that still violates the foreign key (camera deleted
+mid-flush) is discarded, not retried.  Other failures put the batch back,
+bounded by `MAX_BACKLOG` closed events.
+
+`backfill_records()` converts the per-frame `detection_records` of older
+deployments into events, one camera per transaction (insert the islands,
+delete the records), so the report keeps its history.  The records are gone
+afterwards, so it never runs on its own: it is the one-off migration
+`backfill_detection_events.py`.  The events it writes end before the
+detections rollup watermark, so it rebuilds that series when done.  On
+PostgreSQL only the holder of an advisory lock does the work.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import CAM_EVENT_FLUSH_SECONDS, CAM_EVENT_GAP_SECONDS
+from app.core.database import AsyncSessionLocal
+from app.models import Camera, DetectionEvent, DetectionRecord
+from app.utils import metrics, rollups
+from app.utils.detection_report import record_islands_query
+
+logger = logging.getLogger(__name__)
+
+# closed events kept for retry while the database is unreachable
+MAX_BACKLOG = 10_000
+
+BACKFILL_LOCK_KEY = 0x6A7973  # next to the lease reaper's 0x6A7972
+
+
+@dataclass
+class _Event:
+    id: str
+    camera_id: str
+    object_name: str
+    start_time: datetime
+    end_time: datetime
+    count: int
+    max_confidence: float | None
+    dirty: bool = True
+
+    def row(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "camera_id": self.camera_id,
+            "object_name": self.object_name,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "count": self.count,
+            "max_confidence": self.max_confidence,
+        }
+
+
+def _max(a: float | None, b: float | None) -> float | None:
+    if a is None:
+        return b
+    return a if b is None or a >= b else b
+
+
+class DetectionEventBuilder:
+    def __init__(self, gap_seconds: float = CAM_EVENT_GAP_SECONDS, interval: float = CAM_EVENT_FLUSH_SECONDS):
+        self.gap = timedelta(seconds=gap_seconds)
+        self.interval = interval
+        self._open: dict[tuple[str, str], _Event] = {}
+        self._closed: list[_Event] = []
+
+    def observe(self, camera_id: str, detections: Iterable[dict], ts: datetime | None = None) -> None:
+        """Fold one frame's detections into the camera's events. O(classes in frame)."""
+        ts = ts or datetime.now(timezone.utc)
+        per_class: dict[str, tuple[int, float | None]] = {}
+        for det in detections:
+            name = det.get("name")
+            if not name:
+                continue
+            n, conf = per_class.get(name, (0, None))
+            per_class[name] = (n + 1, _max(conf, det.get("conf")))
+
+        for name, (n, conf) in per_class.items():
+            key = (camera_id, name)
+            event = self._open.get(key)
+            if event is not None and ts < event.start_time - self.gap:
+                # a straggler from well before the open event: an event of its own
+                self._closed.append(_Event(uuid.uuid4().hex, camera_id, name, ts, ts, n, conf))
+                continue
+            if event is None or ts - event.end_time > self.gap:
+                if event is not None:
+                    self._closed.append(event)
+                self._open[key] = _Event(uuid.uuid4().hex, camera_id, name, ts, ts, n, conf)
+                metrics.inc("camera.events.opened")
+                continue
+            event.start_time = min(event.start_time, ts)
+            event.end_time = max(event.end_time, ts)
+            event.count += n
+            event.max_confidence = _max(event.max_confidence, conf)
+            event.dirty = True
+        metrics.inc("camera.events.detections", sum(n for n, _ in per_class.values()))
+
+    def close_idle(self, now: datetime | None = None) -> int:
+        """Close events with nothing new for longer than the gap."""
+        cutoff = (now or datetime.now(timezone.utc)) - self.gap
+        idle = [key for key, event in self._open.items() if event.end_time < cutoff]
+        for key in idle:
+            self._closed.append(self._open.pop(key))
+        return len(idle)
+
+    def open_events(self, camera_id: str | None = None) -> list[_Event]:
+        return [e for (cam, _), e in self._open.items() if camera_id is None or cam == camera_id]
+
+    def __len__(self) -> int:
+        return len(self._open)
+
+    async def flush(self, now: datetime | None = None) -> int:
+        """Upsert every closed and changed open event of known cameras in one statement."""
+        self.close_idle(now)
+        closed, self._closed = self._closed, []
+        dirty = [e for e in self._open.values() if e.dirty]
+        events = closed + dirty
+        if not events:
+            return 0
+        for event in dirty:
+            event.dirty = False
+        start = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as session:
+                cam_ids = {e.camera_id for e in events}
+                known = set(await session.scalars(select(Camera.id).where(Camera.id.in_(cam_ids))))
+                if len(known) < len(cam_ids):
+                    events = self._drop_unknown(events, cam_ids - known)
+                if events:
+                    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+                    stmt = dialect.insert(DetectionEvent).values([e.row() for e in events])
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[DetectionEvent.id],
+                        set_={
+                            "start_time": stmt.excluded.start_time,
+                            "end_time": stmt.excluded.end_time,
+                            "count": stmt.excluded.count,
+                            "max_confidence": stmt.excluded.max_confidence,
+                        },
+                    )
+                    await session.execute(stmt)
+                    await session.commit()
+        except IntegrityError:
+            # a camera went away between the check and the insert: retrying cannot help
+            logger.warning("Dropping %d detection events that violate constraints", len(events))
+            metrics.inc("camera.events.dropped", len(events))
+            return 0
+        except Exception:
+            self._requeue(closed, dirty)
+            raise
+        metrics.observe("camera.events.flush", time.perf_counter() - start)
+        metrics.inc("camera.events.closed", len(closed))
+        return len(events)
+
+    def _drop_unknown(self, events: list[_Event], unknown: set[str]) -> list[_Event]:
+        """Forget every event of cameras without a `cameras` row."""
+        for key in [key for key in self._open if key[0] in unknown]:
+            del self._open[key]
+        kept = [e for e in events if e.camera_id not in unknown]
+        metrics.inc("camera.events.unknown_camera", len(events) - len(kept))
+        return kept
+
+    def _requeue(self, closed: list[_Event], dirty: list[_Event]) -> None:
+        self._closed = closed + self._closed
+        overflow = len(self._closed) - MAX_BACKLOG
+        if overflow > 0:
+            del self._closed[:overflow]  # oldest first
+            metrics.inc("camera.events.dropped", overflow)
+        for event in dirty:
+            event.dirty = True
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Detection event flush failed")
+
+
+async def backfill_records(before: datetime | None = None) -> int:
+    """
+    Move `detection_records` up to `before` into `detection_events`, one
+    camera per transaction, then rebuild the detections rollups.  Returns
+    the events written (0 when another process holds the backfill lock or
+    there is nothing left).
+    """
+    before = before or datetime.now(timezone.utc)
+    r = DetectionRecord.__table__
+    written = 0
+    while True:
+        async with AsyncSessionLocal() as session:
+            dialect = session.bind.dialect.name
+            if dialect == "postgresql":
+                if not await session.scalar(select(func.pg_try_advisory_xact_lock(BACKFILL_LOCK_KEY))):
+                    break
+            camera_id = await session.scalar(select(r.c.camera_id).where(r.c.timestamp <= before).limit(1))
+            if camera_id is None:
+                break
+            rows = (await session.execute(record_islands_query(dialect, camera_id, before=before))).all()
+            await session.execute(insert(DetectionEvent), [
+                {
+                    "id": uuid.uuid4().hex,
+                    "camera_id": camera_id,
+                    "object_name": name,
+                    "start_time": start_time,
+                    "end_time": end_time,
+                    "count": count,
+                    "max_confidence": None,
+                }
+                for name, start_time, end_time, count in rows
+            ])
+            await session.execute(delete(r).where(r.c.camera_id == camera_id, r.c.timestamp <= before))
+            await session.commit()
+        written += len(rows)
+        metrics.inc("camera.events.backfilled", len(rows))
+        logger.info("Backfilled %d detection events for camera %s", len(rows), camera_id)
+
+    if written:
+        async with AsyncSessionLocal() as session:
+            await rollups.rebuild(session, rollups.SERIES["detections"])
+            await session.commit()
+        logger.info("Detection rollups reset; the next rollup pass refolds every event")
+    return written
+
+
+event_builder = DetectionEventBuilder()
+metrics.register_gauge("camera.events.open", event_builder.__len__)
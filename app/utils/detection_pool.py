@@ -0,0 +1,331 @@
+# app/utils/detection_pool.py
+"""
+Detector inference in a dedicated process pool.
+
+The API worker never decodes or runs YOLO itself.  Each pool process loads
+the detector once (initializer) and receives frames through pre-allocated
+`multiprocessing.shared_memory` slots instead of pickled arrays:
+
+    parent: copy JPEG bytes into a free slot ──► child: imdecode from the slot
+    child:  detect + imencode annotated JPEG back into the same slot
+    parent: read the annotated bytes out of the slot, release it
+
+Only slot names, byte counts and the (small) detection lists cross the
+process boundary.  Frames from all cameras are micro-batched so one detector
+call covers up to `CAM_DETECT_BATCH_SIZE` frames (or whatever arrived within
+`CAM_DETECT_BATCH_WAIT_MS`).  Pool size comes from `CAM_DETECTION_WORKERS`;
+slot size from `CAM_MAX_FRAME_BYTES`.
+
+If a pool process dies (OOM, a crash inside cv2 or the runtime), the
+executor is broken for good.  The first batch to hit that starts a fresh
+executor, moves its frames to new slots and runs once more; a batch that
+breaks the new pool as well fails, so one poisonous frame cannot take the
+pool down in a loop.  Restarts are counted in `camera.detect.pool_restarts`.
+
+Spawned children re-import this module, so it must not pull in
+`app.core.config` (which insists on database settings) at import time.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing as mp
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable
+
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------------- #
+# Child-process side                                                          #
+# --------------------------------------------------------------------------- #
+_child_detector: Any = None
+_child_slots: dict[str, shared_memory.SharedMemory] = {}
+
+
+def _init_child(detector_factory: Callable[[], Any] | None) -> None:
+    global _child_detector
+    if detector_factory is None:
+        from app.utils.detectors import get_detector
+        detector_factory = get_detector
+    _child_detector = detector_factory()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    shm = _child_slots.get(name)
+    if shm is None:
+        # spawned children share the parent's resource tracker, so attaching
+        # only re-registers a name the parent already owns and unlinks
+        shm = shared_memory.SharedMemory(name=name)
+        _child_slots[name] = shm
+    return shm
+
+
+def _detect_batch(items: list[tuple[str, int]]) -> tuple[list[tuple[int, list[dict], bytes | None]], float]:
+    """
+    Decode the JPEGs in the given (slot name, length) pairs, run the detector
+    once over all decodable frames and, for frames where something was found,
+    write the annotated JPEG back into its slot.
+
+    Returns ([(annotated_len, detections, overflow), ...], busy_seconds) in
+    input order; `overflow` carries the annotated bytes only if they did not
+    fit the slot.
+    """
+    start = time.perf_counter()
+    results: list[tuple[int, list[dict], bytes | None]] = [(0, [], None)] * len(items)
+    try:
+        import cv2  # type: ignore
+        import numpy as np
+    except Exception:  # CV stack not available – nothing to do
+        return results, time.perf_counter() - start
+
+    frames, index = [], []
+    for i, (name, length) in enumerate(items):
+        encoded = np.ndarray((length,), dtype=np.uint8, buffer=_attach(name).buf)
+        frame = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+        del encoded
+        if frame is not None:
+            frames.append(frame)
+            index.append(i)
+    if not frames:
+        return results, time.perf_counter() - start
+
+    for i, (annotated, dets) in zip(index, _child_detector.detect_batch(frames)):
+        if not dets:
+            continue
+        ok, jpeg = cv2.imencode(".jpg", annotated)
+        if not ok:
+            results[i] = (0, dets, None)
+            continue
+        shm = _attach(items[i][0])
+        size = int(jpeg.size)
+        if size > shm.size:
+            results[i] = (0, dets, jpeg.tobytes())
+            continue
+        shm.buf[:size] = jpeg.reshape(-1)
+        results[i] = (size, dets, None)
+    return results, time.perf_counter() - start
+
+
+# --------------------------------------------------------------------------- #
+# Parent side                                                                 #
+# --------------------------------------------------------------------------- #
+class DetectionPool:
+    def __init__(
+        self,
+        workers: int | None = None,
+        slot_bytes: int | None = None,
+        detector_factory: Callable[[], Any] | None = None,
+        batch_size: int | None = None,
+        batch_wait_ms: int | None = None,
+    ):
+        if None in (workers, slot_bytes, batch_size, batch_wait_ms):
+            # only for defaults: the detection service passes every setting
+            from app.core import config
+
+            workers = config.CAM_DETECTION_WORKERS if workers is None else workers
+            slot_bytes = config.CAM_MAX_FRAME_BYTES if slot_bytes is None else slot_bytes
+            batch_size = config.CAM_DETECT_BATCH_SIZE if batch_size is None else batch_size
+            batch_wait_ms = config.CAM_DETECT_BATCH_WAIT_MS if batch_wait_ms is None else batch_wait_ms
+
+        self.workers = max(1, workers)
+        self.slot_bytes = slot_bytes
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = max(0, batch_wait_ms) / 1000.0
+        self._detector_factory = detector_factory
+        self._executor: ProcessPoolExecutor | None = None
+        self._slots: list[shared_memory.SharedMemory] = []
+        self._free: asyncio.Queue[shared_memory.SharedMemory] | None = None
+        # (slot, length, future, jpeg): the bytes are kept to refill a slot for a retry
+        self._pending: list[tuple[shared_memory.SharedMemory, int, asyncio.Future, bytes]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._started_at = 0.0
+        self._busy = 0.0
+        self.in_flight = 0
+        self.frames = 0
+        self.batches = 0
+        self.restarts = 0
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    @property
+    def capacity(self) -> int:
+        """Frames that can be in the pool at once (one full batch per process)."""
+        return self.workers * self.batch_size
+
+    def start(self) -> None:
+        if self._executor is not None:
+            return
+        self._executor = self._new_executor()
+        self._free = asyncio.Queue()
+        for _ in range(self.capacity):
+            shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes)
+            self._slots.append(shm)
+            self._free.put_nowait(shm)
+        self._started_at = time.monotonic()
+        logger.info(
+            "Detection pool started (%d processes, batch %d / %d ms)",
+            self.workers, self.batch_size, int(self.batch_wait * 1000),
+        )
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: never fork a process that owns an event loop and DB sockets
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_child,
+            initargs=(self._detector_factory,),
+        )
+
+    async def detect(self, jpeg: bytes) -> tuple[bytes | None, list[dict]]:
+        """
+        Run detection on one JPEG. Returns (annotated_jpeg | None, detections);
+        the annotated frame is only produced when something was detected.
+
+        Frames from all callers are collected into micro-batches of up to
+        `batch_size` frames or `batch_wait` seconds, whichever comes first,
+        and each batch is one detector call in one pool process.
+        """
+        if self._executor is None or self._free is None:
+            raise RuntimeError("DetectionPool.start() has not been called")
+        if len(jpeg) > self.slot_bytes:
+            raise ValueError(f"frame of {len(jpeg)} bytes exceeds detection slot")
+
+        slot = await self._free.get()
+        slot.buf[: len(jpeg)] = jpeg
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        # from here on the slot belongs to the batch, which releases it
+        self._pending.append((slot, len(jpeg), fut, jpeg))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.batch_wait, self._flush)
+
+        self.in_flight += 1
+        try:
+            return await fut
+        finally:
+            self.in_flight -= 1
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        asyncio.get_running_loop().create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch: list[tuple[shared_memory.SharedMemory, int, asyncio.Future, bytes]]) -> None:
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            try:
+                results, busy = await loop.run_in_executor(
+                    executor, _detect_batch, [(slot.name, length) for slot, length, _, _ in batch]
+                )
+            except BrokenProcessPool:
+                batch = self._recover(executor, batch)
+                results, busy = await loop.run_in_executor(
+                    self._executor, _detect_batch, [(slot.name, length) for slot, length, _, _ in batch]
+                )
+            for (slot, _, fut, _), (size, dets, overflow) in zip(batch, results):
+                if fut.done():  # caller went away
+                    continue
+                annotated = overflow if overflow is not None else (bytes(slot.buf[:size]) if size else None)
+                fut.set_result((annotated, dets))
+        except Exception as exc:
+            for _, _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+        finally:
+            if self._free is not None:
+                for slot, _, _, _ in batch:
+                    self._free.put_nowait(slot)
+
+        self._busy += busy
+        self.frames += len(batch)
+        self.batches += 1
+        metrics.observe("camera.detect.inference", busy)
+        metrics.inc("camera.detect.batches")
+        metrics.inc("camera.detect.batched_frames", len(batch))
+
+    def _recover(
+        self,
+        broken: ProcessPoolExecutor,
+        batch: list[tuple[shared_memory.SharedMemory, int, asyncio.Future, bytes]],
+    ) -> list[tuple[shared_memory.SharedMemory, int, asyncio.Future, bytes]]:
+        """
+        A pool process died.  Replace the broken executor (once, whichever
+        batch notices first) and move the batch to fresh slots, refilled
+        from the caller's bytes – a dying child may have half-written its
+        annotated frame into the old ones.
+        """
+        if self._executor is None:
+            raise RuntimeError("DetectionPool was shut down")
+        if self._executor is broken:
+            logger.warning("Detection pool process died; starting a new pool")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._new_executor()
+            self.restarts += 1
+            metrics.inc("camera.detect.pool_restarts")
+        moved = []
+        for slot, length, fut, jpeg in batch:
+            fresh = shared_memory.SharedMemory(create=True, size=self.slot_bytes)
+            fresh.buf[:length] = jpeg
+            self._slots[self._slots.index(slot)] = fresh
+            slot.close()
+            slot.unlink()
+            moved.append((fresh, length, fut, jpeg))
+        return moved
+
+    async def health(self) -> dict[str, Any]:
+        return {"mode": "in-process", "ready": self.running, **self.stats()}
+
+    def utilisation(self) -> float:
+        """Share of pool capacity spent inside the detector since start."""
+        if not self._started_at:
+            return 0.0
+        elapsed = time.monotonic() - self._started_at
+        return round(self._busy / (elapsed * self.workers), 4) if elapsed > 0 else 0.0
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+            "in_flight": self.in_flight,
+            "frames": self.frames,
+            "batches": self.batches,
+            "avg_batch": round(self.frames / self.batches, 2) if self.batches else 0.0,
+            "restarts": self.restarts,
+            "utilisation": self.utilisation(),
+        }
+
+    def shutdown(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for _, _, fut, _ in self._pending:
+            if not fut.done():
+                fut.cancel()
+        self._pending = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        for shm in self._slots:
+            try:
+                shm.close()
+                shm.unlink()
+            except Exception:
+                pass
+        self._slots.clear()
+        self._free = None
@@ -0,0 +1,237 @@
+# app/utils/detection_report.py
+"""
+Camera detection report computed in the database (gaps and islands).
+
+The rows are the `DetectionEvent`s materialised at ingest time
+(`app.utils.detection_events`), so the report reads one row per event rather
+than one per detection.  Events of one object class are merged into an
+island while each starts at most `CAM_EVENT_GAP_SECONDS` after the latest end
+before it – this joins events split by a flush or built side by side by
+several workers:
+
+    marked   – MAX(end_time) of the preceding events per object_name; a gap
+               above the limit (or no previous event) starts a new island
+    numbered – running SUM of those starts = island number
+    islands  – GROUP BY (object_name, island) → start, end, detections,
+               max confidence
+
+Pages are ordered by (start_time, object_name) and continued with an opaque
+keyset cursor, so a client can walk millions of rows without OFFSET: a page
+after the cursor reads only events ending at most one gap before it (an
+island starting past the cursor cannot depend on anything older; islands
+cut short by the bound start before the cursor and are skipped anyway).  The
+same statement runs on PostgreSQL and on SQLite (tests); only the gap test
+differs, since SQLite keeps timestamps as text.
+
+The `(camera_id, object_name, start_time)` index on `detection_events`
+serves both the filter and the window ordering.
+
+`record_islands_query()` applies the same grouping to the per-frame
+`detection_records` written before events existed; the one-off backfill in
+`app.utils.detection_events` turns them into events with it (served by the
+`(camera_id, object_name, timestamp)` index).
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+
+from sqlalchemy import Select, case, func, select, tuple_
+
+from app.core.config import CAM_EVENT_GAP_SECONDS
+from app.core.database import AsyncSessionLocal
+from app.models import DetectionEvent, DetectionRecord
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+
+def encode_cursor(start_time: datetime, object_name: str) -> str:
+    raw = json.dumps([start_time.isoformat(), object_name]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """Inverse of `encode_cursor`; raises ValueError on anything else."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        start, name = json.loads(raw)
+        return datetime.fromisoformat(start), str(name)
+    except Exception as exc:
+        raise ValueError("invalid cursor") from exc
+
+
+def _gap_exceeded(dialect: str, ts, prev, gap_seconds: float):
+    if dialect == "sqlite":
+        return (func.julianday(ts) - func.julianday(prev)) * 86400.0 > gap_seconds
+    return ts - prev > timedelta(seconds=gap_seconds)
+
+
+def _event_filter(
+    camera_id: str,
+    *,
+    start: datetime | None,
+    end: datetime | None,
+    object_name: str | None,
+    after: tuple[datetime, str] | None,
+    gap_seconds: float,
+) -> list:
+    """
+    WHERE clause of the events feeding the islands.  Past a cursor only
+    events ending within the gap before it can decide where the next island
+    starts, so older ones are not read at all.
+    """
+    e = DetectionEvent.__table__
+    conds = [e.c.camera_id == camera_id]
+    if start is not None:
+        conds.append(e.c.end_time >= start)
+    if end is not None:
+        conds.append(e.c.start_time < end)
+    if object_name is not None:
+        conds.append(e.c.object_name == object_name)
+    if after is not None:
+        conds.append(e.c.end_time >= after[0] - timedelta(seconds=gap_seconds))
+    return conds
+
+
+def islands_query(
+    dialect: str,
+    camera_id: str,
+    *,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    object_name: str | None = None,
+    after: tuple[datetime, str] | None = None,
+    limit: int = DEFAULT_LIMIT,
+    gap_seconds: float = CAM_EVENT_GAP_SECONDS,
+) -> Select:
+    """
+    (object_name, start_time, end_time, detections, max_confidence) per
+    island, in (start_time, object_name) order, for events overlapping
+    [start, end).
+    """
+    e = DetectionEvent.__table__
+    conds = _event_filter(
+        camera_id, start=start, end=end, object_name=object_name, after=after, gap_seconds=gap_seconds
+    )
+
+    prev_end = func.max(e.c.end_time).over(
+        partition_by=e.c.object_name, order_by=(e.c.start_time, e.c.id), rows=(None, -1)
+    )
+    marked = (
+        select(
+            e.c.id,
+            e.c.object_name,
+            e.c.start_time,
+            e.c.end_time,
+            e.c.count,
+            e.c.max_confidence,
+            case(
+                (prev_end.is_(None), 1),
+                (_gap_exceeded(dialect, e.c.start_time, prev_end, gap_seconds), 1),
+                else_=0,
+            ).label("new_island"),
+        )
+        .where(*conds)
+        .subquery("marked")
+    )
+    numbered = select(
+        marked,
+        func.sum(marked.c.new_island)
+        .over(
+            partition_by=marked.c.object_name,
+            order_by=(marked.c.start_time, marked.c.id),
+            rows=(None, 0),
+        )
+        .label("island"),
+    ).subquery("numbered")
+    islands = (
+        select(
+            numbered.c.object_name,
+            func.min(numbered.c.start_time).label("start_time"),
+            func.max(numbered.c.end_time).label("end_time"),
+            func.sum(numbered.c.count).label("detections"),
+            func.max(numbered.c.max_confidence).label("max_confidence"),
+        )
+        .group_by(numbered.c.object_name, numbered.c.island)
+        .subquery("islands")
+    )
+
+    q = select(islands).order_by(islands.c.start_time, islands.c.object_name).limit(limit)
+    if after is not None:
+        q = q.where(tuple_(islands.c.start_time, islands.c.object_name) > tuple_(*after))
+    return q
+
+
+def record_islands_query(
+    dialect: str,
+    camera_id: str,
+    *,
+    before: datetime,
+    gap_seconds: float = CAM_EVENT_GAP_SECONDS,
+) -> Select:
+    """
+    (object_name, start_time, end_time, detections) per island of the
+    camera's `detection_records` up to `before`.
+    """
+    r = DetectionRecord.__table__
+    prev = func.lag(r.c.timestamp).over(partition_by=r.c.object_name, order_by=(r.c.timestamp, r.c.id))
+    marked = (
+        select(
+            r.c.id,
+            r.c.object_name,
+            r.c.timestamp,
+            case(
+                (prev.is_(None), 1),
+                (_gap_exceeded(dialect, r.c.timestamp, prev, gap_seconds), 1),
+                else_=0,
+            ).label("new_island"),
+        )
+        .where(r.c.camera_id == camera_id, r.c.timestamp <= before)
+        .subquery("marked")
+    )
+    numbered = select(
+        marked,
+        func.sum(marked.c.new_island)
+        .over(
+            partition_by=marked.c.object_name,
+            order_by=(marked.c.timestamp, marked.c.id),
+            rows=(None, 0),
+        )
+        .label("island"),
+    ).subquery("numbered")
+    return select(
+        numbered.c.object_name,
+        func.min(numbered.c.timestamp).label("start_time"),
+        func.max(numbered.c.timestamp).label("end_time"),
+        func.count().label("detections"),
+    ).group_by(numbered.c.object_name, numbered.c.island)
+
+
+async def stream_report(camera_id: str, limit: int = DEFAULT_LIMIT, **filters) -> AsyncIterator[str]:
+    """
+    JSON body of one report page, produced row by row from a server-side
+    cursor:  {"camera_id", "detections": [...], "next_cursor"}.
+    """
+    yield '{"camera_id":%s,"detections":[' % json.dumps(camera_id)
+    last = None
+    rows = 0
+    async with AsyncSessionLocal() as session:
+        dialect = session.bind.dialect.name
+        result = await session.stream(islands_query(dialect, camera_id, limit=limit, **filters))
+        async for name, start_time, end_time, count, max_confidence in result:
+            item = {
+                "object_name": name,
+                "start_time": start_time.isoformat(),
+                "end_time": end_time.isoformat(),
+                "detections": int(count),
+                "max_confidence": max_confidence,
+            }
+            yield ("," if rows else "") + json.dumps(item)
+            rows += 1
+            last = (start_time, name)
+    cursor = encode_cursor(*last) if rows == limit and last else None
+    yield '],"next_cursor":%s}' % json.dumps(cursor)
@@ -0,0 +1,365 @@
+# app/utils/detection_service.py
+"""
+One detection service per host instead of one model per gunicorn worker.
+
+`gunicorn_conf.py` starts `serve()` in its own process next to the app.  It
+owns the only `DetectionPool` (so the model is loaded `CAM_DETECTION_WORKERS`
+times in total, and batching spans every API worker) and listens on the Unix
+socket `CAM_DETECTION_SOCKET`.  API workers talk to it through
+`DetectionClient`, which has the same `detect()` / `stats()` surface as the
+pool, so `CameraQueue` does not care which one it holds.
+
+Wire format, both directions, several requests in flight per connection:
+
+    !I header length | JSON header | header["size"] payload bytes
+
+    → {"id": 7, "op": "detect", "size": n}  + JPEG
+    ← {"id": 7, "dets": [...], "size": m}   + annotated JPEG (m may be 0)
+    → {"id": 8, "op": "health", "size": 0}
+    ← {"id": 8, "health": {...}, "size": 0}
+    ← {"id": n, "error": "...", "size": 0}
+
+The service process is spawned, so like `detection_pool` this module does not
+import `app.core.config`: its settings arrive as arguments.  The gunicorn
+master keeps it alive through `ServiceSupervisor`, which restarts it (with
+backoff) whenever it exits; clients reconnect on their next request.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import multiprocessing as mp
+import os
+import signal
+import struct
+import threading
+import time
+from typing import Any
+
+from app.utils.detection_pool import DetectionPool
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("!I")
+
+
+def _pack(header: dict[str, Any], payload: bytes = b"") -> bytes:
+    header["size"] = len(payload)
+    raw = json.dumps(header, separators=(",", ":")).encode()
+    return _HEADER.pack(len(raw)) + raw + payload
+
+
+async def _read_msg(reader: asyncio.StreamReader) -> tuple[dict[str, Any], bytes]:
+    (length,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    header = json.loads(await reader.readexactly(length))
+    size = header.get("size", 0)
+    return header, (await reader.readexactly(size) if size else b"")
+
+
+# --------------------------------------------------------------------------- #
+# Service side                                                                #
+# --------------------------------------------------------------------------- #
+class DetectionServer:
+    def __init__(self, path: str, pool: DetectionPool | None = None):
+        self.path = path
+        self.pool = pool or DetectionPool()
+        self._server: asyncio.AbstractServer | None = None
+        self._started_at = 0.0
+        self._writers: set[asyncio.StreamWriter] = set()
+
+    async def start(self) -> None:
+        self.pool.start()
+        try:
+            os.unlink(self.path)  # stale socket from a previous run
+        except FileNotFoundError:
+            pass
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, 0o660)
+        self._started_at = time.monotonic()
+        logger.info("Detection service listening on %s", self.path)
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for writer in list(self._writers):
+            writer.close()  # clients see the disconnect and reconnect later
+        self.pool.shutdown()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    @property
+    def clients(self) -> int:
+        return len(self._writers)
+
+    def health(self) -> dict[str, Any]:
+        return {
+            "ready": self.pool.running and self._server is not None,
+            "clients": self.clients,
+            "uptime": round(time.monotonic() - self._started_at, 1) if self._started_at else 0.0,
+            **self.pool.stats(),
+        }
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        lock = asyncio.Lock()
+        tasks: set[asyncio.Task] = set()
+
+        async def reply(header: dict[str, Any], payload: bytes) -> None:
+            try:
+                if header.get("op") == "detect":
+                    annotated, dets = await self.pool.detect(payload)
+                    msg = _pack({"id": header["id"], "dets": dets}, annotated or b"")
+                elif header.get("op") == "health":
+                    msg = _pack({"id": header["id"], "health": self.health()})
+                else:
+                    msg = _pack({"id": header.get("id"), "error": f"unknown op {header.get('op')!r}"})
+            except Exception as exc:
+                msg = _pack({"id": header.get("id"), "error": f"{type(exc).__name__}: {exc}"})
+            async with lock:
+                writer.write(msg)
+                await writer.drain()
+
+        try:
+            while True:
+                header, payload = await _read_msg(reader)
+                task = asyncio.create_task(reply(header, payload))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # client went away
+        finally:
+            self._writers.discard(writer)
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+
+async def _serve(path: str, pool_options: dict[str, Any]) -> None:
+    server = DetectionServer(path, DetectionPool(**pool_options))
+    await server.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await server.close()
+
+
+def serve(path: str, pool_options: dict[str, Any] | None = None) -> None:
+    """Process entry point: run the detection service until SIGTERM."""
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve(path, pool_options or {}))
+
+
+def start_process(path: str, pool_options: dict[str, Any] | None = None) -> mp.Process:
+    """
+    Start the service in a fresh (spawned) process.  `pool_options` are
+    `DetectionPool` keyword arguments (workers, slot_bytes, batch_size,
+    batch_wait_ms); the child never reads the app settings itself.
+    """
+    proc = mp.get_context("spawn").Process(
+        target=serve, args=(path, pool_options), name="detection-service",
+    )
+    proc.start()
+    return proc
+
+
+class ServiceSupervisor:
+    """
+    Keeps one detection service process running; used by gunicorn_conf.
+
+    A watcher thread in the gunicorn master restarts the process whenever it
+    exits.  The delay doubles on every crash (up to `max_backoff`) and resets
+    once a process has stayed up for `stable_after` seconds, so a service
+    that cannot load its model does not spin.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        pool_options: dict[str, Any] | None = None,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        stable_after: float = 60.0,
+        poll: float = 1.0,
+    ):
+        self.path = path
+        self.pool_options = pool_options or {}
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.poll = poll
+        self.proc: mp.Process | None = None
+        self.restarts = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self.proc = start_process(self.path, self.pool_options)
+        self._thread = threading.Thread(target=self._watch, name="detection-supervisor", daemon=True)
+        self._thread.start()
+
+    def _watch(self) -> None:
+        delay = self.backoff
+        started = time.monotonic()
+        while not self._stop.wait(self.poll):
+            if self.proc is not None and self.proc.is_alive():
+                continue
+            exitcode = self.proc.exitcode if self.proc is not None else None
+            if time.monotonic() - started >= self.stable_after:
+                delay = self.backoff
+            logger.warning("Detection service exited (code %s); restarting in %.0f s", exitcode, delay)
+            if self._stop.wait(delay):
+                return
+            self.proc = start_process(self.path, self.pool_options)
+            self.restarts += 1
+            started = time.monotonic()
+            delay = min(delay * 2, self.max_backoff)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self.proc is not None:
+            self.proc.terminate()
+            self.proc.join(timeout)
+            self.proc = None
+
+
+# --------------------------------------------------------------------------- #
+# API-worker side                                                             #
+# --------------------------------------------------------------------------- #
+class DetectionClient:
+    """Drop-in for `DetectionPool` that forwards to the detection service."""
+
+    def __init__(self, path: str, timeout: float, capacity: int):
+        self.path = path
+        self.timeout = timeout
+        self.capacity = capacity  # frames this worker keeps in flight; the service batches across workers
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task | None = None
+        self._connect_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._pending: dict[int, asyncio.Future] = {}
+        self._next_id = 0
+        self._remote: dict[str, Any] = {}
+        self.in_flight = 0
+        self.frames = 0
+        self.reconnects = 0
+
+    @property
+    def running(self) -> bool:
+        return self._writer is not None
+
+    def start(self) -> None:
+        pass  # connects lazily, the service may still be loading its model
+
+    async def _connect(self) -> asyncio.StreamWriter:
+        """Return the live connection, opening a new one if it was lost."""
+        async with self._connect_lock:
+            if self._writer is not None:
+                return self._writer
+            reader, writer = await asyncio.open_unix_connection(self.path)
+            if self._reader_task is not None:
+                self.reconnects += 1
+            self._reader, self._writer = reader, writer
+            self._reader_task = asyncio.create_task(self._read_loop(reader))
+            return writer
+
+    async def _read_loop(self, reader: asyncio.StreamReader) -> None:
+        error: BaseException = ConnectionError("detection service closed the connection")
+        try:
+            while True:
+                header, payload = await _read_msg(reader)
+                fut = self._pending.pop(header.get("id"), None)
+                if fut is not None and not fut.done():
+                    fut.set_result((header, payload))
+        except (asyncio.IncompleteReadError, ConnectionError) as exc:
+            error = ConnectionError(f"detection service connection lost: {exc}")
+        except asyncio.CancelledError:
+            raise
+        finally:
+            if self._reader is reader:  # not already replaced by a reconnect
+                self._disconnect(error)
+
+    def _disconnect(self, error: BaseException) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+        pending, self._pending = self._pending, {}
+        for fut in pending.values():
+            if not fut.done():
+                fut.set_exception(error)
+
+    async def _call(self, header: dict[str, Any], payload: bytes = b"") -> tuple[dict[str, Any], bytes]:
+        self._next_id += 1
+        header["id"] = req_id = self._next_id
+        msg = _pack(header, payload)
+        try:
+            for attempt in range(2):
+                fut = asyncio.get_running_loop().create_future()
+                async with self._write_lock:
+                    # (re)connect under the lock: the connection may have been
+                    # lost while this request waited for it
+                    writer = self._writer or await self._connect()
+                    self._pending[req_id] = fut
+                    try:
+                        writer.write(msg)
+                        await writer.drain()
+                        break
+                    except ConnectionError:
+                        # never reached the service (it is restarting): retry once
+                        self._pending.pop(req_id, None)
+                        if writer is self._writer:
+                            self._disconnect(ConnectionError("detection service connection lost"))
+                        if attempt:
+                            raise
+            reply, body = await asyncio.wait_for(fut, self.timeout)
+        finally:
+            self._pending.pop(req_id, None)
+        if "error" in reply:
+            raise RuntimeError(f"detection service: {reply['error']}")
+        return reply, body
+
+    async def detect(self, jpeg: bytes) -> tuple[bytes | None, list[dict]]:
+        self.in_flight += 1
+        try:
+            reply, annotated = await self._call({"op": "detect"}, jpeg)
+        finally:
+            self.in_flight -= 1
+        self.frames += 1
+        return annotated or None, reply["dets"]
+
+    async def health(self) -> dict[str, Any]:
+        try:
+            reply, _ = await self._call({"op": "health"})
+        except Exception as exc:
+            return {"mode": "service", "socket": self.path, "ready": False, "error": str(exc)}
+        self._remote = reply["health"]
+        return {"mode": "service", "socket": self.path, **self._remote}
+
+    def utilisation(self) -> float:
+        return float(self._remote.get("utilisation", 0.0))
+
+    def stats(self) -> dict[str, float]:
+        return {"in_flight": self.in_flight, "frames": self.frames, "utilisation": self.utilisation()}
+
+    def shutdown(self) -> None:
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        self._disconnect(ConnectionError("detection client shut down"))
+
+
+if __name__ == "__main__":
+    serve(os.environ["CAM_DETECTION_SOCKET"])
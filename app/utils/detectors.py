@@ -1,4 +1,5 @@
 from __future__ import annotations
+import logging
 import os
 from typing import Any, List, Tuple
 try:
@@ -7,16 +8,33 @@ except Exception:  # very thin stub for type hints
     class _NPStub:
         ndarray = object
     np = _NPStub()  # type: ignore
+
+logger = logging.getLogger(__name__)
+
 # Env knobs:
-#   DETECTOR_BACKEND=YOLO|STUB (default: YOLO if ultralytics present & model exists)
+#   DETECTOR_BACKEND=YOLO|ONNX|STUB (default: YOLO if ultralytics present & model exists)
 #   YOLO_MODEL_PATH follows app.core.config (can be overridden here)
+#   ONNX_MODEL_PATH  exported model (`yolo export format=onnx dynamic=True`)
+#   ONNX_THREADS     intra-op threads per process (0 = onnxruntime default)
+#   ONNX_INT8=1      run dynamically int8-quantised weights (<model>.int8.onnx)
 BACKEND = os.getenv("DETECTOR_BACKEND", "").upper()
 YOLO_MODEL_PATH = os.getenv("YOLO_MODEL_PATH", "yolov5s.pt")
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", "yolov5s.onnx")
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "1"))
+ONNX_INT8 = os.getenv("ONNX_INT8", "").strip().lower() in ("1", "true", "yes", "on")
+
+IMGSZ = 640
+CONF_THRESHOLD = 0.35
+IOU_THRESHOLD = 0.45
 
 class BaseDetector:
     def detect_and_annotate(self, img: np.ndarray) -> Tuple[np.ndarray, List[dict]]:
         raise NotImplementedError
 
+    def detect_batch(self, imgs: List[np.ndarray]) -> List[Tuple[np.ndarray, List[dict]]]:
+        # backends that can run several images per model call override this
+        return [self.detect_and_annotate(img) for img in imgs]
+
 class StubDetector(BaseDetector):
     # Simple brightness-based fake "leaf" hotspot – good enough for CI
     def detect_and_annotate(self, img: np.ndarray):
@@ -29,7 +47,15 @@ class YoloDetector(BaseDetector):
         self.names = self.model.names
 
     def detect_and_annotate(self, img: np.ndarray):
-        res = self.model(img, imgsz=640, conf=0.35, verbose=False)[0]
+        res = self.model(img, imgsz=IMGSZ, conf=CONF_THRESHOLD, verbose=False)[0]
+        return self._unpack(res)
+
+    def detect_batch(self, imgs: List[np.ndarray]):
+        # one forward pass over the whole batch
+        results = self.model(list(imgs), imgsz=IMGSZ, conf=CONF_THRESHOLD, verbose=False)
+        return [self._unpack(res) for res in results]
+
+    def _unpack(self, res) -> Tuple[np.ndarray, List[dict]]:
         annotated = res.plot()
         out = []
         for box in res.boxes:
@@ -39,6 +65,163 @@ class YoloDetector(BaseDetector):
             out.append({"name": self.names[cls], "conf": conf, "bbox": (x1, y1, x2, y2)})
         return annotated, out
 
+def _letterbox(img: np.ndarray, size: int = IMGSZ) -> tuple[np.ndarray, float, tuple[int, int]]:
+    """Resize keeping aspect ratio and pad to size x size (ultralytics grey 114)."""
+    import cv2  # type: ignore
+
+    h, w = img.shape[:2]
+    scale = min(size / h, size / w)
+    nh, nw = round(h * scale), round(w * scale)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    out = np.full((size, size, 3), 114, dtype=np.uint8)
+    out[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return out, scale, (left, top)
+
+
+def _postprocess(
+    pred: np.ndarray,
+    scale: float,
+    pad: tuple[int, int],
+    shape: tuple[int, int],
+    names: dict[int, str],
+    conf: float = CONF_THRESHOLD,
+    iou: float = IOU_THRESHOLD,
+) -> List[dict]:
+    """
+    Decode one image's raw YOLO head output into `{"name","conf","bbox"}`.
+
+    Accepts both export layouts: YOLOv5 `(N, 5 + nc)` rows with objectness
+    and YOLOv8 `(4 + nc, N)` columns without.
+    """
+    import cv2  # type: ignore
+
+    nc = len(names)
+    if pred.shape[0] == 4 + nc and pred.shape[1] != 4 + nc:
+        pred = pred.T  # v8: (4 + nc, N) -> (N, 4 + nc)
+    if pred.shape[1] == 5 + nc:
+        scores = pred[:, 5:] * pred[:, 4:5]
+    else:
+        scores = pred[:, 4:]
+    cls = scores.argmax(1)
+    best = scores[np.arange(len(scores)), cls]
+    keep = best >= conf
+    if not keep.any():
+        return []
+    boxes, best, cls = pred[keep, :4], best[keep], cls[keep]
+
+    # cx, cy, w, h in letterbox space -> x1, y1, x2, y2 in the original image
+    xyxy = np.empty_like(boxes)
+    xyxy[:, 0] = boxes[:, 0] - boxes[:, 2] / 2
+    xyxy[:, 1] = boxes[:, 1] - boxes[:, 3] / 2
+    xyxy[:, 2] = boxes[:, 0] + boxes[:, 2] / 2
+    xyxy[:, 3] = boxes[:, 1] + boxes[:, 3] / 2
+    xyxy[:, [0, 2]] -= pad[0]
+    xyxy[:, [1, 3]] -= pad[1]
+    xyxy /= scale
+    h, w = shape
+    xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+    xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+
+    # class-aware NMS: shift each class into its own coordinate range, past
+    # the largest coordinate so no two classes' ranges can overlap
+    offset = cls[:, None].astype(np.float32) * (float(xyxy.max()) + 1.0)
+    shifted = xyxy + offset
+    rects = np.column_stack([shifted[:, :2], shifted[:, 2:] - shifted[:, :2]])
+    idx = cv2.dnn.NMSBoxes(rects.tolist(), best.tolist(), conf, iou)
+    out = []
+    for i in np.array(idx).reshape(-1):
+        x1, y1, x2, y2 = map(int, xyxy[i])
+        out.append({"name": names.get(int(cls[i]), str(int(cls[i]))), "conf": float(best[i]), "bbox": (x1, y1, x2, y2)})
+    return out
+
+
+def _draw(img: np.ndarray, dets: List[dict]) -> np.ndarray:
+    import cv2  # type: ignore
+
+    out = img.copy()
+    for d in dets:
+        x1, y1, x2, y2 = d["bbox"]
+        cv2.rectangle(out, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(out, f"{d['name']} {d['conf']:.2f}", (x1, max(y1 - 4, 12)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1, cv2.LINE_AA)
+    return out
+
+
+def _quantized_path(model_path: str) -> str:
+    """Return `<model>.int8.onnx`, creating it with dynamic quantisation once."""
+    root, _ = os.path.splitext(model_path)
+    target = f"{root}.int8.onnx"
+    if not os.path.exists(target):
+        from onnxruntime.quantization import QuantType, quantize_dynamic  # lazy import
+
+        tmp = f"{target}.{os.getpid()}.tmp"
+        quantize_dynamic(model_path, tmp, weight_type=QuantType.QUInt8)
+        os.replace(tmp, target)  # several pool processes may race here
+    return target
+
+
+class OnnxDetector(BaseDetector):
+    """
+    Exported YOLO model on ONNX Runtime's CPU provider: full graph
+    optimisation, a fixed intra-op thread count per process (the detection
+    pool already runs one process per core budget) and optional int8 weights.
+    """
+
+    def __init__(self, model_path: str, threads: int = ONNX_THREADS, int8: bool = ONNX_INT8):
+        import onnxruntime as ort  # lazy import
+
+        if int8:
+            model_path = _quantized_path(model_path)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, opts, providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        # a static export has batch dim 1; dynamic exports report a symbol
+        self.batched = not isinstance(inp.shape[0], int) or inp.shape[0] > 1
+        self.names = self._names()
+
+    def _names(self) -> dict[int, str]:
+        import ast
+
+        meta = self.session.get_modelmeta().custom_metadata_map
+        try:
+            names = ast.literal_eval(meta.get("names", "{}"))
+        except (ValueError, SyntaxError):
+            names = {}
+        if isinstance(names, list):
+            names = dict(enumerate(names))
+        if not names:  # no metadata: fall back to class indices
+            _, a, b = self.session.get_outputs()[0].shape
+            if isinstance(a, int) and isinstance(b, int):
+                nc = a - 4 if a < b else b - 5  # v8 (4 + nc, N) vs v5 (N, 5 + nc)
+                names = {i: str(i) for i in range(nc)}
+        return {int(k): v for k, v in names.items()}
+
+    def detect_and_annotate(self, img: np.ndarray):
+        return self.detect_batch([img])[0]
+
+    def detect_batch(self, imgs: List[np.ndarray]):
+        boxed = [_letterbox(img) for img in imgs]
+        # HWC BGR uint8 -> NCHW RGB float32 in [0, 1]
+        blob = np.stack([b[0] for b in boxed])[..., ::-1].transpose(0, 3, 1, 2)
+        blob = np.ascontiguousarray(blob, dtype=np.float32) / 255.0
+        if self.batched:
+            preds = self.session.run(None, {self.input_name: blob})[0]
+        else:
+            preds = np.concatenate(
+                [self.session.run(None, {self.input_name: blob[i:i + 1]})[0] for i in range(len(imgs))]
+            )
+        out = []
+        for img, (_, scale, pad), pred in zip(imgs, boxed, preds):
+            dets = _postprocess(pred, scale, pad, img.shape[:2], self.names)
+            out.append((_draw(img, dets), dets))
+        return out
+
+
 _detector: BaseDetector | None = None
 
 def get_detector() -> BaseDetector:
@@ -51,6 +234,16 @@ def get_detector() -> BaseDetector:
         _detector = StubDetector()
         return _detector
 
+    if BACKEND == "ONNX":
+        try:
+            if not os.path.exists(ONNX_MODEL_PATH):
+                raise FileNotFoundError(ONNX_MODEL_PATH)
+            _detector = OnnxDetector(ONNX_MODEL_PATH)
+        except Exception:
+            logger.exception("ONNX detector unavailable, falling back to stub")
+            _detector = StubDetector()
+        return _detector
+
     # Try YOLO, fallback to stub on any issue (no model, no ultralytics, etc.)
     try:
         if not os.path.exists(YOLO_MODEL_PATH):
@@ -0,0 +1,166 @@
+# app/utils/frame_hub.py
+"""
+Per-camera broadcast hub for live viewers (MJPEG and WebSocket).
+
+`publish()` is synchronous and never waits on a viewer: every subscriber owns
+a small bounded deque and the oldest frame is dropped when it is full.  A
+subscriber that keeps dropping for `CAM_HUB_EVICT_AFTER` publishes in a row is
+evicted, so one stalled browser cannot hold memory or slow the uploader.
+Frames are shared by reference; the MJPEG part is encoded once per frame
+(`Frame.mjpeg_part`).
+
+Uploads publish the raw frame and the detection workers the annotated one.
+Viewers prefer annotated frames, like `frame_store.latest()`: while a
+camera's processed frames keep coming (one within `PROCESSED_HOLD_SECONDS`),
+its raw frames are not fanned out, so the stream does not flicker between
+the two; once detection goes quiet the raw feed takes over.
+
+When a camera has viewers on this worker but its uploads land on another
+worker, a single follower task per camera polls `latest.jpg` through the
+frame store and republishes – one stat per frame interval, independent of
+the number of viewers.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from pathlib import Path
+
+from app.core.config import CAM_HUB_EVICT_AFTER, CAM_HUB_QUEUE_SIZE, FPS
+from app.utils import metrics
+from app.utils.frame_store import PROCESSED, Frame, frame_store
+
+logger = logging.getLogger(__name__)
+
+PROCESSED_HOLD_SECONDS = 2.0
+
+
+class Subscriber:
+    __slots__ = ("camera_id", "frames", "dropped", "stalled", "closed", "_wakeup")
+
+    def __init__(self, camera_id: str, maxlen: int):
+        self.camera_id = camera_id
+        self.frames: deque[Frame] = deque(maxlen=max(1, maxlen))
+        self.dropped = 0
+        self.stalled = 0  # consecutive drops since the last successful get()
+        self.closed = False
+        self._wakeup = asyncio.Event()
+
+    def offer(self, frame: Frame) -> bool:
+        """Queue `frame`, dropping the oldest one. Returns False once evicted."""
+        if self.closed:
+            return False
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+            self.stalled += 1
+            metrics.inc("camera.hub.dropped")
+            if self.stalled >= CAM_HUB_EVICT_AFTER:
+                self.close()
+                return False
+        self.frames.append(frame)
+        self._wakeup.set()
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+        self._wakeup.set()
+
+    async def get(self) -> Frame:
+        while not self.frames:
+            if self.closed:
+                raise StopAsyncIteration
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        self.stalled = 0
+        return self.frames.popleft()
+
+    def __aiter__(self) -> "Subscriber":
+        return self
+
+    async def __anext__(self) -> Frame:
+        return await self.get()
+
+
+class FrameHub:
+    def __init__(self, queue_size: int = CAM_HUB_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subs: dict[str, set[Subscriber]] = {}
+        self._followers: dict[str, asyncio.Task] = {}
+        self._last_seq: dict[str, int] = {}
+        self._last_publish: dict[str, float] = {}
+        self._last_processed: dict[str, float] = {}
+
+    # ── viewers ──────────────────────────────────────────────────────────────
+    def subscribe(self, camera_id: str, latest_path: Path | None = None) -> Subscriber:
+        sub = Subscriber(camera_id, self.queue_size)
+        self._subs.setdefault(camera_id, set()).add(sub)
+        if latest_path is not None and camera_id not in self._followers:
+            self._followers[camera_id] = asyncio.create_task(self._follow(camera_id, latest_path))
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        sub.close()
+        subs = self._subs.get(sub.camera_id)
+        if subs is None:
+            return
+        subs.discard(sub)
+        if not subs:
+            del self._subs[sub.camera_id]
+            follower = self._followers.pop(sub.camera_id, None)
+            if follower is not None:
+                follower.cancel()
+
+    def viewers(self, camera_id: str | None = None) -> int:
+        if camera_id is not None:
+            return len(self._subs.get(camera_id, ()))
+        return sum(len(s) for s in self._subs.values())
+
+    # ── producers ────────────────────────────────────────────────────────────
+    def publish(self, frame: Frame) -> int:
+        """Fan a locally received `frame` out to its camera's viewers. Never blocks."""
+        now = time.monotonic()
+        self._last_publish[frame.camera_id] = now
+        last_processed = self._last_processed.get(frame.camera_id)
+        if frame.kind == PROCESSED:
+            self._last_processed[frame.camera_id] = now
+        elif last_processed is not None and now - last_processed < PROCESSED_HOLD_SECONDS:
+            return 0  # annotated frames are flowing: viewers get those
+        return self._fanout(frame)
+
+    def _fanout(self, frame: Frame) -> int:
+        self._last_seq[frame.camera_id] = frame.seq
+        subs = self._subs.get(frame.camera_id)
+        if not subs:
+            return 0
+        delivered = 0
+        for sub in list(subs):
+            if sub.offer(frame):
+                delivered += 1
+            else:
+                metrics.inc("camera.hub.evicted")
+                logger.info("Evicting slow viewer of camera %s (%d frames dropped)", sub.camera_id, sub.dropped)
+                self.unsubscribe(sub)
+        metrics.inc("camera.hub.published")
+        return delivered
+
+    async def _follow(self, camera_id: str, latest_path: Path) -> None:
+        interval = 1 / max(FPS, 1)
+        while True:
+            await asyncio.sleep(interval)
+            if time.monotonic() - self._last_publish.get(camera_id, 0.0) < interval:
+                continue  # fed by local uploads
+            try:
+                frame = await frame_store.refresh_from_disk(camera_id, latest_path)
+            except Exception:
+                logger.exception("Frame follower failed for camera %s", camera_id)
+                continue
+            if frame is not None and frame.seq != self._last_seq.get(camera_id):
+                self._fanout(frame)
+
+
+# Singleton hub (one per worker process)
+frame_hub = FrameHub()
+metrics.register_gauge("camera.hub.viewers", frame_hub.viewers)
@@ -0,0 +1,126 @@
+# app/utils/frame_store.py
+"""
+Per-camera in-memory cache of the newest raw and processed JPEG.
+
+The upload handler and the detection workers `put()` every frame here, so
+`still`, `stream?mode=poll` and the MJPEG generator can answer without listing
+or stat-sorting directories.  Each entry carries a per-camera sequence number,
+a wall-clock timestamp and a content-derived ETag (identical across gunicorn
+workers for the same bytes).
+
+The store lives in each worker process.  Frames that arrived through a
+*different* worker are picked up by `refresh_from_disk()`, which costs a
+single `stat()` of `latest.jpg` and only reads the file when it changed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+import zlib
+from pathlib import Path
+
+from app.core.config import BOUNDARY
+from app.utils import metrics
+
+RAW = "raw"
+PROCESSED = "processed"
+
+
+class Frame:
+    __slots__ = ("camera_id", "kind", "data", "seq", "ts", "etag", "_mjpeg_part")
+
+    def __init__(self, camera_id: str, kind: str, data: bytes, seq: int, ts: float):
+        self.camera_id = camera_id
+        self.kind = kind
+        self.data = data
+        self.seq = seq
+        self.ts = ts
+        self.etag = f'"{zlib.crc32(data):08x}-{len(data):x}"'
+        self._mjpeg_part: bytes | None = None
+
+    def mjpeg_part(self) -> bytes:
+        """multipart/x-mixed-replace chunk, built once and shared by all viewers."""
+        if self._mjpeg_part is None:
+            self._mjpeg_part = (
+                f"--{BOUNDARY}\r\n"
+                f"Content-Type: image/jpeg\r\n"
+                f"Content-Length: {len(self.data)}\r\n\r\n"
+            ).encode() + self.data + b"\r\n"
+        return self._mjpeg_part
+
+    def matches(self, if_none_match: str | None) -> bool:
+        """True if an `If-None-Match` header value covers this frame."""
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*" or tag.removeprefix("W/") == self.etag:
+                return True
+        return False
+
+
+def _read_if_newer(path: Path, known_mtime_ns: int) -> tuple[bytes, int] | None:
+    try:
+        st = os.stat(path)
+        if st.st_mtime_ns <= known_mtime_ns:
+            return None
+        return path.read_bytes(), st.st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class FrameStore:
+    def __init__(self) -> None:
+        self._frames: dict[str, dict[str, Frame]] = {}
+        self._seq: dict[str, int] = {}
+        self._disk_mtime: dict[str, int] = {}
+
+    def put(self, camera_id: str, data: bytes, kind: str = RAW, ts: float | None = None) -> Frame:
+        seq = self._seq.get(camera_id, 0) + 1
+        self._seq[camera_id] = seq
+        frame = Frame(camera_id, kind, data, seq, ts if ts is not None else time.time())
+        self._frames.setdefault(camera_id, {})[kind] = frame
+        return frame
+
+    def get(self, camera_id: str, kind: str = RAW) -> Frame | None:
+        slots = self._frames.get(camera_id)
+        return slots.get(kind) if slots else None
+
+    def latest(self, camera_id: str) -> Frame | None:
+        """Processed frame when one exists, otherwise the raw frame."""
+        slots = self._frames.get(camera_id)
+        if not slots:
+            return None
+        return slots.get(PROCESSED) or slots.get(RAW)
+
+    async def refresh_from_disk(self, camera_id: str, path: Path) -> Frame | None:
+        """
+        Load `path` (the camera's latest.jpg) if it is newer than what we hold.
+        Used for cameras whose uploads land on another worker.
+        """
+        current = self.get(camera_id, RAW)
+        # anything older than the frame we hold was published by us already
+        threshold = self._disk_mtime.get(camera_id, 0)
+        if current is not None:
+            threshold = max(threshold, int(current.ts * 1e9))
+        loop = asyncio.get_running_loop()
+        found = await loop.run_in_executor(None, _read_if_newer, path, threshold)
+        if found is None:
+            return current
+        data, mtime_ns = found
+        self._disk_mtime[camera_id] = mtime_ns
+        return self.put(camera_id, data, RAW, ts=mtime_ns / 1e9)
+
+    def forget(self, camera_id: str) -> None:
+        self._frames.pop(camera_id, None)
+        self._disk_mtime.pop(camera_id, None)
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+
+# Singleton store (one per worker process)
+frame_store = FrameStore()
+metrics.register_gauge("camera.frame_store.cameras", lambda: len(frame_store))
@@ -0,0 +1,219 @@
+# app/utils/hls.py
+"""
+Live HLS for camera streams, served as static files from the `/hls` mount.
+
+When `CAM_HLS_ENABLED` is on, the first upload of a camera starts one
+segmenter for it: an `ffmpeg` process fed with the camera's JPEG frames
+(through a `frame_hub` subscription, so frames uploaded to other workers are
+included) that writes H.264 MPEG-TS segments and a rolling playlist to
+
+    <CAM_DATA_ROOT>/<camera_id>/<CAM_HLS_DIR>/index.m3u8  →  /hls/<camera_id>/hls/index.m3u8
+
+Segments last `HLS_TARGET_DURATION` seconds and the playlist keeps the last
+`HLS_PLAYLIST_LENGTH`; older segments are deleted by ffmpeg.  Only one
+gunicorn worker segments a given camera – it holds an `flock` on the
+camera's HLS directory, released automatically if the worker dies.  A
+segmenter with no frames for `CAM_HLS_IDLE_SECONDS` stops.
+
+Viewers then cost a static file read (or a CDN hit) instead of a Python
+generator per viewer; `HlsStaticFiles` marks playlists `no-cache` and the
+epoch-numbered segments immutable.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import logging
+import os
+import time
+from pathlib import Path
+
+from sqlalchemy import update
+from starlette.staticfiles import StaticFiles
+
+from app.core.config import (
+    CAM_HLS_DIR,
+    CAM_HLS_ENABLED,
+    CAM_HLS_IDLE_SECONDS,
+    DATA_ROOT,
+    FFMPEG_BIN,
+    FPS,
+    HLS_PLAYLIST_LENGTH,
+    HLS_TARGET_DURATION,
+)
+from app.core.database import AsyncSessionLocal
+from app.models import Camera
+from app.utils import metrics
+from app.utils.frame_hub import frame_hub
+
+logger = logging.getLogger(__name__)
+
+PLAYLIST = "index.m3u8"
+OWNER_RETRY_SECONDS = 10  # how often a non-owner worker re-checks the lock
+
+
+def playlist_url(camera_id: str) -> str:
+    return f"/hls/{camera_id}/{CAM_HLS_DIR}/{PLAYLIST}"
+
+
+def ffmpeg_args(out_dir: Path, ffmpeg: str = FFMPEG_BIN) -> list[str]:
+    gop = max(FPS, 1) * HLS_TARGET_DURATION  # one keyframe per segment
+    return [
+        ffmpeg, "-hide_banner", "-loglevel", "error",
+        "-use_wallclock_as_timestamps", "1",
+        "-f", "image2pipe", "-c:v", "mjpeg", "-i", "-",
+        "-c:v", "libx264", "-preset", "veryfast", "-tune", "zerolatency",
+        "-pix_fmt", "yuv420p", "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
+        "-f", "hls",
+        "-hls_time", str(HLS_TARGET_DURATION),
+        "-hls_list_size", str(HLS_PLAYLIST_LENGTH),
+        "-hls_flags", "delete_segments+independent_segments+program_date_time",
+        "-hls_start_number_source", "epoch",
+        "-hls_segment_filename", str(out_dir / "seg_%d.ts"),
+        str(out_dir / PLAYLIST),
+    ]
+
+
+class HlsSegmenter:
+    def __init__(
+        self,
+        enabled: bool = CAM_HLS_ENABLED,
+        data_root: str = DATA_ROOT,
+        ffmpeg: str = FFMPEG_BIN,
+        idle_seconds: float = CAM_HLS_IDLE_SECONDS,
+    ):
+        self.enabled = enabled
+        self.data_root = data_root
+        self.ffmpeg = ffmpeg
+        self.idle_seconds = idle_seconds
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._next_try: dict[str, float] = {}
+
+    def running(self, camera_id: str | None = None) -> int:
+        if camera_id is not None:
+            return int(camera_id in self._tasks)
+        return len(self._tasks)
+
+    def ensure(self, camera_id: str) -> bool:
+        """
+        Make sure some worker segments `camera_id`. Cheap enough to call on
+        every upload; returns True when this worker runs the segmenter.
+        """
+        if not self.enabled:
+            return False
+        if camera_id in self._tasks:
+            return True
+        if time.monotonic() < self._next_try.get(camera_id, 0.0):
+            return False
+
+        out_dir = Path(self.data_root) / camera_id / CAM_HLS_DIR
+        out_dir.mkdir(parents=True, exist_ok=True)
+        lock_fd = os.open(out_dir / ".owner", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(lock_fd)
+            self._next_try[camera_id] = time.monotonic() + OWNER_RETRY_SECONDS
+            return False
+        self._tasks[camera_id] = asyncio.create_task(self._run(camera_id, out_dir, lock_fd))
+        return True
+
+    async def _run(self, camera_id: str, out_dir: Path, lock_fd: int) -> None:
+        proc = None
+        sub = None
+        try:
+            for stale in out_dir.glob("seg_*.ts"):
+                stale.unlink(missing_ok=True)
+            proc = await asyncio.create_subprocess_exec(
+                *ffmpeg_args(out_dir, self.ffmpeg),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            logger.info("HLS segmenter started for camera %s", camera_id)
+            await _record_playlist(camera_id)
+            latest = Path(self.data_root) / camera_id / "latest.jpg"
+            while True:
+                if sub is None or sub.closed:
+                    if sub is not None:
+                        frame_hub.unsubscribe(sub)
+                    sub = frame_hub.subscribe(camera_id, latest)
+                try:
+                    frame = await asyncio.wait_for(sub.get(), self.idle_seconds)
+                except asyncio.TimeoutError:
+                    break  # camera went quiet
+                except StopAsyncIteration:
+                    continue  # evicted while ffmpeg lagged – resubscribe
+                proc.stdin.write(frame.data)
+                await proc.stdin.drain()
+                metrics.inc("camera.hls.frames")
+        except (BrokenPipeError, ConnectionResetError):
+            logger.warning("ffmpeg exited for camera %s", camera_id)
+        except FileNotFoundError:
+            logger.error("HLS enabled but %r was not found", self.ffmpeg)
+            self.enabled = False
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception("HLS segmenter failed for camera %s", camera_id)
+        finally:
+            if sub is not None:
+                frame_hub.unsubscribe(sub)
+            if proc is not None:
+                await _stop(proc)
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+            self._tasks.pop(camera_id, None)
+            logger.info("HLS segmenter stopped for camera %s", camera_id)
+
+    async def shutdown(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _record_playlist(camera_id: str) -> None:
+    """Publish the playlist URL in `Camera.hls_path` (only writes on change)."""
+    url = playlist_url(camera_id)
+    try:
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(Camera)
+                .where(Camera.id == camera_id, Camera.hls_path.is_distinct_from(url))
+                .values(hls_path=url)
+            )
+            await session.commit()
+    except Exception:
+        logger.warning("Could not record HLS path for camera %s", camera_id, exc_info=True)
+
+
+async def _stop(proc: asyncio.subprocess.Process, timeout: float = 5.0) -> None:
+    """Close stdin so ffmpeg finalises the playlist; kill it if it lingers."""
+    try:
+        proc.stdin.close()
+    except Exception:
+        pass
+    try:
+        await asyncio.wait_for(proc.wait(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+
+
+class HlsStaticFiles(StaticFiles):
+    """StaticFiles with cache headers suited to live HLS."""
+
+    async def get_response(self, path: str, scope):
+        response = await super().get_response(path, scope)
+        if path.endswith(".m3u8"):
+            response.headers["Cache-Control"] = "no-cache"
+        elif path.endswith(".ts"):
+            # epoch-numbered segment names are never reused
+            response.headers["Cache-Control"] = "public, max-age=86400, immutable"
+        return response
+
+
+hls_segmenter = HlsSegmenter()
+metrics.register_gauge("camera.hls.segmenters", hls_segmenter.running)
@@ -0,0 +1,117 @@
+# app/utils/lease_reaper.py
+"""
+Recovery of expired task leases.
+
+A device that leases tasks and never acks them leaves them `LEASED` past
+`leased_until`.  Every `TASK_LEASE_REAP_SECONDS` one worker puts all of
+them back to `PENDING` with a single `UPDATE … RETURNING` (served by the
+`leased_until` index) and wakes the leasers of the affected devices
+through `task_signals` – in every worker, since the `pg_notify` goes out
+with the same commit.
+
+One worker reaps.  On PostgreSQL it is the one holding the session-level
+advisory lock `LOCK_KEY` on a dedicated connection, kept for as long as the
+connection lives (checked every pass); the others try to take it each pass
+and skip the UPDATE while they cannot, so a new leader steps in within one
+interval of the old one going away.  Recovered leases are counted in
+`tasks.lease.reaped`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core.config import TASK_LEASE_REAP_SECONDS
+from app.core.database import AsyncSessionLocal
+from app.models import Task, TaskStatus
+from app.utils import metrics
+from app.utils.task_signals import task_signals
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = 0x6A7972
+
+
+class LeaseReaper:
+    def __init__(self, interval: float = TASK_LEASE_REAP_SECONDS):
+        self.interval = interval
+        self.leader = False
+        self._lock_conn: AsyncConnection | None = None
+
+    async def _lead(self) -> bool:
+        """Take or keep the reaper lock; True while this worker holds it."""
+        if self._lock_conn is not None:
+            try:
+                await self._lock_conn.exec_driver_sql("SELECT 1")  # the lock lives as long as this connection
+                return True
+            except Exception:
+                logger.warning("Lease reaper lost its lock connection")
+                await self.shutdown()
+        engine = AsyncSessionLocal.kw["bind"]
+        if engine.dialect.name != "postgresql":
+            self.leader = True  # a single process: nothing to elect
+            return True
+        conn = await engine.connect()
+        try:
+            # autocommit: the connection must not sit idle in a transaction
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            if not await conn.scalar(select(func.pg_try_advisory_lock(LOCK_KEY))):
+                await conn.close()
+                return False
+        except BaseException:
+            await conn.invalidate()
+            raise
+        self._lock_conn = conn
+        self.leader = True
+        logger.info("Lease reaper leading (advisory lock %#x)", LOCK_KEY)
+        return True
+
+    async def shutdown(self) -> None:
+        """Give up the lock so another worker takes over on its next pass."""
+        conn, self._lock_conn = self._lock_conn, None
+        self.leader = False
+        if conn is not None:
+            try:
+                await conn.invalidate()  # never hand a lock-holding connection back to the pool
+            except Exception:
+                pass
+
+    async def run_once(self, now: datetime | None = None) -> int:
+        """Requeue every lease expired at `now`; returns how many (0 when another worker leads)."""
+        now = now or datetime.now(timezone.utc)
+        if not await self._lead():
+            return 0
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(
+                update(Task)
+                .where(
+                    Task.leased_until < now,
+                    Task.status == TaskStatus.LEASED,
+                )
+                .values(status=TaskStatus.PENDING, lease_id=None, leased_until=None)
+                .returning(Task.device_id)
+                .execution_options(synchronize_session=False)
+            )).all()
+            device_ids = {device_id for device_id, in rows}
+            await task_signals.notify(session, *device_ids)
+            await session.commit()
+        if rows:
+            metrics.inc("tasks.lease.reaped", len(rows))
+            logger.info("Requeued %d expired task leases on %d devices", len(rows), len(device_ids))
+        return len(rows)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Lease reaping failed")
+            await asyncio.sleep(self.interval)
+
+
+lease_reaper = LeaseReaper()
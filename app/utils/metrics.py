@@ -0,0 +1,106 @@
+# app/utils/metrics.py
+"""
+Tiny in-process metrics registry.
+
+Counters, gauges and timings are kept per worker process in plain dicts and
+exposed as JSON through `/api/v1/health/metrics`.  Everything here is cheap
+enough to call on the hot frame path (a dict lookup plus a deque append).
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+_RECENT_SAMPLES = 1024
+
+_lock = threading.Lock()
+_counters: dict[str, float] = {}
+_gauges: dict[str, Callable[[], float]] = {}
+_timings: dict[str, "Timing"] = {}
+
+
+class Timing:
+    """Running count/sum/max plus a window of recent samples for percentiles."""
+
+    __slots__ = ("count", "total", "max", "recent")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent: deque[float] = deque(maxlen=_RECENT_SAMPLES)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.recent.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+        return ordered[idx]
+
+    def as_dict(self) -> dict[str, float]:
+        avg = self.total / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "avg_ms": round(avg * 1000, 3),
+            "p50_ms": round(self.percentile(0.50) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+def inc(name: str, value: float = 1.0) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0.0) + value
+
+
+def observe(name: str, seconds: float) -> None:
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = Timing()
+        timing.observe(seconds)
+
+
+def register_gauge(name: str, fn: Callable[[], float]) -> None:
+    """Register a callable sampled lazily whenever a snapshot is taken."""
+    _gauges[name] = fn
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def snapshot() -> dict[str, dict]:
+    with _lock:
+        counters = dict(_counters)
+        timings = {k: t.as_dict() for k, t in _timings.items()}
+    gauges: dict[str, float | None] = {}
+    for name, fn in list(_gauges.items()):
+        try:
+            gauges[name] = fn()
+        except Exception:
+            gauges[name] = None
+    return {"counters": counters, "gauges": gauges, "timings": timings}
+
+
+def reset() -> None:
+    """Forget counters and timings (gauges stay registered)."""
+    with _lock:
+        _counters.clear()
+        _timings.clear()
@@ -0,0 +1,92 @@
+# app/utils/motion_gate.py
+"""
+Cheap per-camera change detection in front of the detector.
+
+Each camera keeps a tiny grayscale reference (`REF_SIZE`, decoded straight
+from the JPEG at 1/8 scale).  A new frame is compared with a vectorised mean
+absolute difference; below the camera's threshold the frame skips inference
+and the caller reuses the previous detections.
+
+The reference only moves when a frame is let through, so a slow drift still
+adds up and eventually triggers detection.  The default threshold comes from
+`CAM_MOTION_THRESHOLD` (mean grey-level difference, 0 disables gating); a
+camera's `settings["motion_threshold"]` overrides it.
+"""
+
+from __future__ import annotations
+
+import cv2
+import numpy as np
+
+from app.core.config import CAM_MOTION_THRESHOLD
+from app.utils import metrics
+
+REF_SIZE = (64, 48)  # width, height
+
+
+def _thumbnail(jpeg: bytes) -> np.ndarray | None:
+    small = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if small is None:
+        return None
+    return cv2.resize(small, REF_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+class MotionGate:
+    def __init__(self, threshold: float = CAM_MOTION_THRESHOLD):
+        self.threshold = float(threshold)
+        self.thresholds: dict[str, float] = {}   # per-camera overrides
+        self._refs: dict[str, np.ndarray] = {}
+        self._last: dict[str, list[dict]] = {}
+        self.checked: dict[str, int] = {}
+        self.skipped: dict[str, int] = {}
+
+    def threshold_for(self, camera_id: str) -> float:
+        return self.thresholds.get(camera_id, self.threshold)
+
+    def changed(self, camera_id: str, jpeg: bytes) -> bool:
+        """
+        True when the frame differs enough from the camera's reference to be
+        worth running detection on.  Safe to call from an executor thread.
+        """
+        threshold = self.threshold_for(camera_id)
+        if threshold <= 0:
+            return True
+        thumb = _thumbnail(jpeg)
+        if thumb is None:
+            return True  # let the detector decide what to do with it
+
+        self.checked[camera_id] = self.checked.get(camera_id, 0) + 1
+        metrics.inc("camera.motion.checked")
+        ref = self._refs.get(camera_id)
+        if (
+            ref is not None
+            and camera_id in self._last
+            and float(np.abs(thumb - ref).mean()) < threshold
+        ):
+            self.skipped[camera_id] = self.skipped.get(camera_id, 0) + 1
+            metrics.inc("camera.motion.skipped")
+            return False
+        self._refs[camera_id] = thumb
+        return True
+
+    def remember(self, camera_id: str, dets: list[dict]) -> None:
+        self._last[camera_id] = dets
+
+    def last(self, camera_id: str) -> list[dict]:
+        return self._last.get(camera_id, [])
+
+    def forget(self, camera_id: str) -> None:
+        for d in (self._refs, self._last, self.checked, self.skipped):
+            d.pop(camera_id, None)
+
+    def skip_rate(self, camera_id: str | None = None) -> float:
+        if camera_id is not None:
+            checked = self.checked.get(camera_id, 0)
+            skipped = self.skipped.get(camera_id, 0)
+        else:
+            checked = sum(self.checked.values())
+            skipped = sum(self.skipped.values())
+        return round(skipped / checked, 4) if checked else 0.0
+
+    def stats(self) -> dict[str, float]:
+        return {cam: self.skip_rate(cam) for cam in self.checked}
@@ -0,0 +1,261 @@
+# app/utils/presence.py
+"""
+Push-based camera online/offline tracking.
+
+Uploads call `presence.seen(camera_id)`.  Exactly one process – the worker
+holding an `flock` on `<CAM_PRESENCE_SOCKET>.lock` – keeps the state:
+
+* a deadline per camera (`last_seen + OFFLINE_TIMEOUT`) in a min-heap with
+  lazy re-arming, so a frame costs a dict update and the heap only moves
+  when a deadline is reached;
+* the loop sleeps until the earliest deadline (at most `TICK` seconds),
+  marks expired cameras offline and writes every transition since the last
+  tick with one UPDATE;
+* transitions are pushed to in-process subscribers as `PresenceEvent`s.
+
+Other workers forward their uploads to the leader over a Unix datagram
+socket at `CAM_PRESENCE_SOCKET`, at most once per camera per
+`FORWARD_INTERVAL` – fire and forget, a lost datagram is covered by the next
+frame.  If the leader dies its lock is released and another worker takes
+over, seeding itself from the cameras currently marked online.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import heapq
+import logging
+import os
+import socket
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import select, update
+
+from app.core.config import CAM_PRESENCE_SOCKET, OFFLINE_TIMEOUT
+from app.core.database import AsyncSessionLocal
+from app.models import Camera
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+TICK = 1.0               # longest sleep; bounds online/offline persistence lag
+FORWARD_INTERVAL = 1.0   # followers forward a camera at most this often
+LEAD_RETRY_SECONDS = 5   # how often a follower re-checks the leader lock
+QUEUE_SIZE = 100         # events buffered per subscriber (oldest dropped)
+
+
+@dataclass(frozen=True)
+class PresenceEvent:
+    camera_id: str
+    online: bool
+    at: float  # epoch seconds: the upload, or the deadline that expired
+
+
+class PresenceTracker:
+    def __init__(
+        self,
+        timeout: float = OFFLINE_TIMEOUT,
+        socket_path: str = CAM_PRESENCE_SOCKET,
+        tick: float = TICK,
+    ):
+        self.timeout = timeout
+        self.socket_path = socket_path
+        self.tick = tick
+        self.leader = False
+        self._deadline: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._online: set[str] = set()
+        self._changes: dict[str, bool] = {}
+        self._subscribers: set[asyncio.Queue] = set()
+        self._wakeup: asyncio.Event | None = None
+        self._lock_fd: int | None = None
+        self._server: socket.socket | None = None
+        self._client: socket.socket | None = None
+        self._forwarded: dict[str, float] = {}
+
+    # ------------------------------------------------------------ frame path --
+    def seen(self, camera_id: str, ts: float | None = None) -> None:
+        """Note a frame from `camera_id`. Never blocks."""
+        ts = time.time() if ts is None else ts
+        if self.leader:
+            self._mark(camera_id, ts)
+        elif ts - self._forwarded.get(camera_id, 0.0) >= FORWARD_INTERVAL:
+            self._forwarded[camera_id] = ts
+            self._forward(camera_id, ts)
+
+    def _forward(self, camera_id: str, ts: float) -> None:
+        try:
+            if self._client is None:
+                self._client = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                self._client.setblocking(False)
+            self._client.sendto(f"{ts:.3f} {camera_id}".encode(), self.socket_path)
+        except OSError:
+            # no leader yet, or its buffer is full – the next frame will do
+            metrics.inc("camera.presence.forward_dropped")
+
+    def _mark(self, camera_id: str, ts: float) -> None:
+        deadline = ts + self.timeout
+        current = self._deadline.get(camera_id)
+        if current is not None and deadline <= current:
+            return
+        self._deadline[camera_id] = deadline
+        if current is None:
+            heapq.heappush(self._heap, (deadline, camera_id))
+        if camera_id not in self._online:
+            self._online.add(camera_id)
+            self._transition(camera_id, True, ts)
+
+    def _expire(self, now: float) -> None:
+        while self._heap and self._heap[0][0] <= now:
+            _, camera_id = heapq.heappop(self._heap)
+            deadline = self._deadline.get(camera_id)
+            if deadline is None:
+                continue
+            if deadline > now:  # seen again since it was armed
+                heapq.heappush(self._heap, (deadline, camera_id))
+                continue
+            del self._deadline[camera_id]
+            self._online.discard(camera_id)
+            self._transition(camera_id, False, deadline)
+
+    def _transition(self, camera_id: str, online: bool, at: float) -> None:
+        self._changes[camera_id] = online
+        metrics.inc("camera.presence.online" if online else "camera.presence.offline")
+        event = PresenceEvent(camera_id, online, at)
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # ----------------------------------------------------------- subscribers --
+    def subscribe(self, maxsize: int = QUEUE_SIZE) -> asyncio.Queue:
+        """Queue of `PresenceEvent`s (only the leader produces any)."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def is_online(self, camera_id: str) -> bool:
+        return camera_id in self._online
+
+    def online(self) -> int:
+        return len(self._online)
+
+    # ---------------------------------------------------------------- leader --
+    def try_lead(self) -> bool:
+        fd = os.open(f"{self.socket_path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        try:
+            os.unlink(self.socket_path)  # left behind by the previous leader
+        except FileNotFoundError:
+            pass
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        server.bind(self.socket_path)
+        server.setblocking(False)
+        asyncio.get_running_loop().add_reader(server.fileno(), self._receive)
+        self._server = server
+        self.leader = True
+        logger.info("Camera presence tracker leading on %s", self.socket_path)
+        return True
+
+    def _receive(self) -> None:
+        while True:
+            try:
+                data = self._server.recv(512)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                ts, camera_id = data.decode().split(" ", 1)
+                self._mark(camera_id, float(ts))
+            except ValueError:
+                logger.warning("Malformed presence datagram %r", data[:64])
+
+    async def seed(self) -> None:
+        """Arm deadlines for the cameras the database says are online."""
+        async with AsyncSessionLocal() as session:
+            rows = await session.execute(
+                select(Camera.id, Camera.last_seen).where(Camera.is_online.is_(True))
+            )
+            for camera_id, last_seen in rows:
+                ts = last_seen.timestamp() if last_seen else 0.0
+                self._online.add(camera_id)  # already persisted as online
+                self._mark(camera_id, ts)
+
+    async def flush(self) -> int:
+        """Persist the transitions since the last flush in one UPDATE."""
+        if not self._changes:
+            return 0
+        changes, self._changes = self._changes, {}
+        online = [cam for cam, state in changes.items() if state]
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    update(Camera)
+                    .where(Camera.id.in_(list(changes)))
+                    .values(is_online=Camera.id.in_(online))
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+        except Exception:
+            for cam, state in changes.items():
+                self._changes.setdefault(cam, state)  # newer transitions win
+            raise
+        for cam, state in changes.items():
+            logger.info("Camera %s online=%s", cam, state)
+        return len(changes)
+
+    async def run(self) -> None:
+        self._wakeup = asyncio.Event()
+        next_try = 0.0
+        while True:
+            try:
+                if not self.leader and time.monotonic() >= next_try:
+                    next_try = time.monotonic() + LEAD_RETRY_SECONDS
+                    if self.try_lead():
+                        await self.seed()
+                if self.leader:
+                    self._expire(time.time())
+                    await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Camera presence tracking failed")
+
+            delay = self.tick if self.leader else LEAD_RETRY_SECONDS
+            if self._heap:
+                delay = min(delay, max(0.0, self._heap[0][0] - time.time()))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+                await asyncio.sleep(min(self.tick, 0.05))  # let a burst of transitions gather
+            except asyncio.TimeoutError:
+                pass
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            asyncio.get_event_loop().remove_reader(self._server.fileno())
+            self._server.close()
+            self._server = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        self.leader = False
+
+
+presence = PresenceTracker()
+metrics.register_gauge("camera.presence.online_cameras", presence.online)
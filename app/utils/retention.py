@@ -0,0 +1,401 @@
+# app/utils/retention.py
+"""
+Disk retention for camera data: `RETENTION_DAYS` and per-camera quotas.
+
+Every file the camera pipeline writes is announced to `storage_index`
+(`record()` is O(1): one insertion into the camera's age-ordered dict), so
+the frame path never lists a directory.  `RetentionSweeper` runs in the
+background every `CAM_RETENTION_SWEEP_SECONDS` and
+
+1. pops files older than `RETENTION_DAYS` off the front of each camera's index,
+2. while a camera is over its quota (`CAM_STORAGE_QUOTA_MB`, or the camera's
+   `settings["storage_quota_mb"]`), pops its oldest files as well,
+3. unlinks the victims in batches on the default executor, and
+4. flushes `camera_stats`, where every byte recorded in the index and every
+   byte actually unlinked has been counted towards `Camera.storage_used` (MB).
+
+`Camera.storage_used` is the total across gunicorn workers: each worker
+indexes the files it wrote itself and adds their sizes, and subtracts only
+what its unlinks really freed, so a file some other worker deleted first is
+not taken off twice.  The worker holding an `flock` on
+`<CAM_DATA_ROOT>/.retention.owner` leads: when it takes the lock and every
+`CAM_RETENTION_RESCAN_SECONDS` after that it scans the directories, adopts
+every file it does not index yet (those of exited workers included) and
+resets `storage_used` to what is on disk.  Holding every file, it is also
+the only worker that enforces quotas, so an overrun is freed once.  Deltas
+other workers flush around a rescan can skew `storage_used` by a few
+seconds' writes until the next one.  The sweeper only looks at the raw,
+processed and clips directories; HLS segments are ffmpeg's business.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from sqlalchemy import bindparam, select, update
+
+from app.core.config import (
+    CAM_RETENTION_RESCAN_SECONDS,
+    CAM_RETENTION_SWEEP_SECONDS,
+    CAM_STORAGE_QUOTA_MB,
+    CLIPS_DIR,
+    DATA_ROOT,
+    PROCESSED_DIR,
+    RAW_DIR,
+    RETENTION_DAYS,
+)
+from app.core.database import AsyncSessionLocal
+from app.models import Camera
+from app.utils import metrics
+from app.utils.camera_stats import CameraStats, camera_stats
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 ** 2
+DELETE_BATCH = 500  # unlinks per executor hop
+
+
+class _CameraFiles:
+    __slots__ = ("files", "bytes")
+
+    def __init__(self) -> None:
+        # path → (timestamp, size); insertion order is age order
+        self.files: OrderedDict[str, tuple[float, int]] = OrderedDict()
+        self.bytes = 0
+
+
+class StorageIndex:
+    """Per-camera size/age index of the files this process is responsible for."""
+
+    def __init__(self, stats: CameraStats = camera_stats) -> None:
+        self.stats = stats  # receives recorded sizes for `storage_used`
+        self._cams: dict[str, _CameraFiles] = {}
+        self._lock = threading.Lock()  # record() is also called from writer threads
+        self._touched: set[tuple[str, str]] | None = None  # (camera, path) changed during load()
+
+    def record(self, camera_id: str, path: Path | str, size: int, ts: float | None = None) -> None:
+        """Note a newly written (or rewritten) file. Safe from any thread."""
+        key = str(path)
+        with self._lock:
+            cam = self._cams.get(camera_id)
+            if cam is None:
+                cam = self._cams[camera_id] = _CameraFiles()
+            old = cam.files.get(key)
+            change = size
+            if old is not None:
+                change -= old[1]
+                ts = old[0]  # keep its place in the age order
+            cam.files[key] = (time.time() if ts is None else ts, size)
+            cam.bytes += change
+            if self._touched is not None:
+                self._touched.add((camera_id, key))
+        self.stats.add(camera_id, nbytes=change)
+
+    def forget(self, camera_id: str, path: Path | str) -> None:
+        """Drop a file that somebody else deleted."""
+        with self._lock:
+            cam = self._cams.get(camera_id)
+            entry = cam.files.pop(str(path), None) if cam else None
+            if entry is None:
+                return
+            cam.bytes -= entry[1]
+            if self._touched is not None:
+                self._touched.add((camera_id, str(path)))
+        self.stats.add(camera_id, nbytes=-entry[1])
+
+    def cameras(self) -> list[str]:
+        with self._lock:
+            return list(self._cams)
+
+    def bytes(self, camera_id: str | None = None) -> int:
+        with self._lock:
+            if camera_id is not None:
+                cam = self._cams.get(camera_id)
+                return cam.bytes if cam else 0
+            return sum(cam.bytes for cam in self._cams.values())
+
+    def pop_expired(self, camera_id: str, cutoff: float) -> list[tuple[str, int]]:
+        """
+        Remove and return the leading files with a timestamp before `cutoff`.
+        The caller deletes them and reports the bytes it freed to `stats`.
+        """
+        return self._pop(camera_id, lambda ts, freed: ts < cutoff)
+
+    def pop_oldest(self, camera_id: str, nbytes: float) -> list[tuple[str, int]]:
+        """Remove and return the oldest files until at least `nbytes` are covered."""
+        return self._pop(camera_id, lambda ts, freed: freed < nbytes)
+
+    def _pop(self, camera_id, take) -> list[tuple[str, int]]:
+        out: list[tuple[str, int]] = []
+        freed = 0
+        with self._lock:
+            cam = self._cams.get(camera_id)
+            if cam is None:
+                return out
+            while cam.files:
+                path, (ts, size) = next(iter(cam.files.items()))
+                if not take(ts, freed):
+                    break
+                cam.files.popitem(last=False)
+                cam.bytes -= size
+                freed += size
+                out.append((path, size))
+                if self._touched is not None:
+                    self._touched.add((camera_id, path))
+            if not cam.files:
+                del self._cams[camera_id]
+        return out
+
+    def load(self, scanned: dict[str, list[tuple[float, int, str]]]) -> None:
+        """
+        Merge a scan into the index, by path, keeping age order.  Blocking:
+        run it on an executor.  The merge and sort work on a snapshot; the
+        lock is held only to take it and to swap the result in, replaying
+        the files recorded, forgotten or popped in between.  Scanned bytes
+        are not counted as a change (the caller resets `storage_used` to the
+        scanned totals instead).
+        """
+        with self._lock:
+            snapshot = {camera_id: dict(cam.files) for camera_id, cam in self._cams.items()}
+            self._touched = set()
+        try:
+            built = _merge(snapshot, scanned)
+        except BaseException:
+            with self._lock:
+                self._touched = None
+            raise
+        with self._lock:
+            touched, self._touched = self._touched, None
+            self._swap(built, touched)
+
+    def _swap(self, built: dict[str, _CameraFiles], touched: set[tuple[str, str]]) -> None:
+        """Install `built`, brought up to date with the live index for `touched` paths. Lock held."""
+        for camera_id, key in touched:
+            live = self._cams.get(camera_id)
+            entry = live.files.get(key) if live is not None else None
+            cam = built.get(camera_id)
+            if cam is None:
+                if entry is None:
+                    continue
+                cam = built[camera_id] = _CameraFiles()
+            old = cam.files.pop(key, None) if entry is None else cam.files.get(key)
+            if entry is not None:
+                cam.files[key] = entry  # a new file goes last: it is the newest
+                cam.bytes += entry[1]
+            if old is not None:
+                cam.bytes -= old[1]
+        self._cams = {camera_id: cam for camera_id, cam in built.items() if cam.files}
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(cam.files) for cam in self._cams.values())
+
+
+def _merge(
+    snapshot: dict[str, dict[str, tuple[float, int]]],
+    scanned: dict[str, list[tuple[float, int, str]]],
+) -> dict[str, _CameraFiles]:
+    """Indexed files plus the scanned ones not indexed yet, per camera, in age order."""
+    built: dict[str, _CameraFiles] = {}
+    for camera_id in snapshot.keys() | scanned.keys():
+        files = snapshot.get(camera_id, {})
+        for ts, size, path in scanned.get(camera_id, ()):
+            files.setdefault(path, (ts, size))
+        cam = _CameraFiles()
+        cam.files = OrderedDict(sorted(files.items(), key=lambda item: item[1][0]))
+        cam.bytes = sum(size for _, size in cam.files.values())
+        built[camera_id] = cam
+    return built
+
+
+def scan(data_root: Path, before: float) -> dict[str, list[tuple[float, int, str]]]:
+    """
+    One walk over every camera's raw/processed/clips directories, collecting
+    files last modified before `before` (newer ones belong to a live writer,
+    which records them itself).
+    """
+    found: dict[str, list[tuple[float, int, str]]] = {}
+    if not data_root.is_dir():
+        return found
+    for cam_dir in data_root.iterdir():
+        if not cam_dir.is_dir():
+            continue
+        entries: list[tuple[float, int, str]] = []
+        for sub in (RAW_DIR, PROCESSED_DIR, CLIPS_DIR):
+            for root, _, names in os.walk(cam_dir / sub):
+                for name in names:
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    if st.st_mtime < before:
+                        entries.append((st.st_mtime, st.st_size, path))
+        if entries:
+            found[cam_dir.name] = entries
+    return found
+
+
+def _unlink_batch(victims: list[tuple[str, str, int]]) -> list[tuple[str, int]]:
+    """Delete (camera, path, size) files; returns (camera, size) of those really deleted."""
+    deleted: list[tuple[str, int]] = []
+    for camera_id, path, size in victims:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            continue  # another worker got there first and counted it
+        except OSError:
+            logger.warning("Failed to delete %s", path)
+            continue  # still on disk: the next rescan picks it up again
+        deleted.append((camera_id, size))
+    return deleted
+
+
+class RetentionSweeper:
+    def __init__(
+        self,
+        index: StorageIndex,
+        data_root: str = DATA_ROOT,
+        retention_days: int = RETENTION_DAYS,
+        quota_mb: int = CAM_STORAGE_QUOTA_MB,
+        interval: float = CAM_RETENTION_SWEEP_SECONDS,
+        rescan_interval: float = CAM_RETENTION_RESCAN_SECONDS,
+        delete_batch: int = DELETE_BATCH,
+    ):
+        self.index = index
+        self.data_root = Path(data_root)
+        self.retention_days = retention_days
+        self.quota_mb = quota_mb
+        self.interval = interval
+        self.rescan_interval = rescan_interval
+        self.delete_batch = max(1, delete_batch)
+        self.scanned_at: float | None = None
+        self.leader = False
+        self._lock_fd: int | None = None
+        self.reclaimed = 0
+
+    def _try_lead(self) -> bool:
+        self.data_root.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.data_root / ".retention.owner", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        self.leader = True
+        return True
+
+    async def bootstrap(self) -> int:
+        """
+        Index every file on disk not indexed yet and reset `storage_used` to
+        what all of them add up to.  Run by the leader on taking the lock
+        and every `rescan_interval`.
+        """
+        loop = asyncio.get_running_loop()
+        await self.index.stats.flush()  # our own deltas must not land on top of the reset
+        started = time.time()
+
+        def scan_and_load() -> dict[str, list[tuple[float, int, str]]]:
+            scanned = scan(self.data_root, started)
+            self.index.load(scanned)  # merge and sort here too, not on the event loop
+            return scanned
+
+        scanned = await loop.run_in_executor(None, scan_and_load)
+        self.scanned_at = started
+        totals = {cam_id: sum(size for _, size, _ in entries) for cam_id, entries in scanned.items()}
+        if totals:
+            table = Camera.__table__
+            stmt = update(table).where(table.c.id == bindparam("cam_id")).values(storage_used=bindparam("used"))
+            async with AsyncSessionLocal() as session:
+                conn = await session.connection()
+                await conn.execute(stmt, [{"cam_id": c, "used": b / MB} for c, b in totals.items()])
+                await session.commit()
+        logger.info("Retention index scanned %d files", sum(len(e) for e in scanned.values()))
+        return sum(totals.values())
+
+    async def _quotas(self) -> tuple[dict[str, float], dict[str, int]]:
+        """({camera: storage_used bytes}, {camera: quota bytes}) for indexed cameras."""
+        cams = self.index.cameras()
+        usage: dict[str, float] = {}
+        quotas: dict[str, int] = {}
+        if not cams:
+            return usage, quotas
+        async with AsyncSessionLocal() as session:
+            rows = await session.execute(
+                select(Camera.id, Camera.storage_used, Camera.settings).where(Camera.id.in_(cams))
+            )
+            for cam_id, used, settings in rows:
+                usage[cam_id] = (used or 0.0) * MB
+                quota_mb = (settings or {}).get("storage_quota_mb", self.quota_mb)
+                try:
+                    quotas[cam_id] = int(float(quota_mb) * MB)
+                except (TypeError, ValueError):
+                    quotas[cam_id] = self.quota_mb * MB
+        return usage, quotas
+
+    async def sweep_once(self) -> int:
+        """One retention pass; returns the bytes reclaimed."""
+        victims: list[tuple[str, str, int]] = []
+        if self.retention_days > 0:
+            cutoff = time.time() - self.retention_days * 86400
+            for cam_id in self.index.cameras():
+                victims += [(cam_id, p, size) for p, size in self.index.pop_expired(cam_id, cutoff)]
+
+        if self.leader:
+            expiring: dict[str, int] = {}
+            for cam_id, _, size in victims:
+                expiring[cam_id] = expiring.get(cam_id, 0) + size
+            usage, quotas = await self._quotas()
+            for cam_id, quota in quotas.items():
+                if quota <= 0:
+                    continue
+                pending = self.index.stats.pending(cam_id)
+                used = usage[cam_id] + (pending.nbytes if pending else 0) - expiring.get(cam_id, 0)
+                over = used - quota
+                if over > 0:
+                    victims += [(cam_id, p, size) for p, size in self.index.pop_oldest(cam_id, over)]
+
+        loop = asyncio.get_running_loop()
+        freed: dict[str, int] = {}
+        files = 0
+        for i in range(0, len(victims), self.delete_batch):
+            for cam_id, size in await loop.run_in_executor(None, _unlink_batch, victims[i:i + self.delete_batch]):
+                freed[cam_id] = freed.get(cam_id, 0) + size
+                files += 1
+        for cam_id, nbytes in freed.items():
+            self.index.stats.add(cam_id, nbytes=-nbytes)
+        await self.index.stats.flush()
+
+        reclaimed = sum(freed.values())
+        if files:
+            self.reclaimed += reclaimed
+            metrics.inc("camera.retention.deleted_files", files)
+            metrics.inc("camera.retention.reclaimed_bytes", reclaimed)
+            logger.info("Retention sweep deleted %d files (%.1f MB)", files, reclaimed / MB)
+        return reclaimed
+
+    async def run(self) -> None:
+        while True:
+            try:
+                if self.leader or self._try_lead():
+                    if self.scanned_at is None or time.time() - self.scanned_at >= self.rescan_interval:
+                        await self.bootstrap()
+                await self.sweep_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Retention sweep failed")
+            await asyncio.sleep(self.interval)
+
+
+storage_index = StorageIndex()
+retention_sweeper = RetentionSweeper(storage_index)
+metrics.register_gauge("camera.retention.indexed_bytes", storage_index.bytes)
+metrics.register_gauge("camera.retention.indexed_files", storage_index.__len__)
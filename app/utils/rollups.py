@@ -0,0 +1,397 @@
+# app/utils/rollups.py
+"""
+Hierarchical time rollups of detections and sensor readings.
+
+`rollups` holds one row per (series, source, metric, resolution, bucket)
+with count / total / min / max (avg = total / count) at 1-minute, 1-hour and
+1-day resolution, so a chart reads a few hundred buckets instead of
+scanning raw rows.
+
+Maintenance is incremental.  Every `ROLLUP_INTERVAL_SECONDS` the job takes
+the series' row in `rollup_watermarks` (`SELECT … FOR UPDATE`, so several
+workers never fold the same rows twice), folds the raw rows in
+`(watermark, now - ROLLUP_LAG_SECONDS]` into every resolution with one
+`INSERT … SELECT … GROUP BY … ON CONFLICT DO UPDATE` each – count, total,
+min and max merge associatively – and moves the watermark, all in one
+transaction.  The lag leaves time for late writers (detection events are
+only final once closed); rows that arrive later than that are not counted.
+
+Series:
+
+* ``detections`` – `detection_events` by camera and object class,
+  watermarked on `end_time`.  `count` is the number of detections: an event
+  spanning several buckets is split across them in proportion to its time
+  in each (rounded so the parts add up to the event's count).  min / max /
+  avg are of the events' peak confidence, avg weighted by detections.
+  Events are folded once they end, so a bucket an event reaches back into
+  is still updated when that event is folded: buckets are final only once
+  no event overlapping them is still open.
+* ``sensor`` – `sensor_readings` by device and reading type; min / max / avg
+  are of the readings.  Readings stored as compact chunks
+  (`SENSOR_STORAGE=chunks`) are decoded and aggregated in Python and merged
+  with the same upsert.
+
+`query_rollups()` serves a range at the finest resolution that fits the
+caller's point budget (falling back to the coarsest).  `rebuild()` drops a
+series' buckets and clears its watermark, so the next pass folds every row
+again – for rows written behind the watermark, such as backfilled events.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import numpy as np
+from sqlalchemy import Integer, case, cast, delete, func, literal, literal_column, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import ROLLUP_INTERVAL_SECONDS, ROLLUP_LAG_SECONDS
+from app.core.database import AsyncSessionLocal
+from app.models import DetectionEvent, Rollup, RollupWatermark, SensorChunk, SensorReading
+from app.utils import metrics
+from app.utils.sensor_store import CHUNK_SECONDS, unpack
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = (60, 3600, 86400)  # finest first
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+
+
+@dataclass(frozen=True)
+class Series:
+    name: str
+    source: Any      # grouping column: camera / device id
+    metric: Any      # grouping column: object class / reading type
+    bucket_ts: Any   # timestamp the bucket is taken from
+    watermark: Any   # timestamp the watermark advances over
+    value: Any       # aggregated value (min / max / avg)
+    weight: Any      # samples per row (count)
+
+
+_e, _r = DetectionEvent.__table__, SensorReading.__table__
+SERIES = {
+    "detections": Series(  # folded by _fold_events: an event spans buckets
+        "detections", _e.c.camera_id, _e.c.object_name, _e.c.start_time, _e.c.end_time,
+        _e.c.max_confidence, _e.c.count,
+    ),
+    "sensor": Series(
+        "sensor", _r.c.device_id, _r.c.reading_type, _r.c.timestamp, _r.c.timestamp,
+        _r.c.value, literal_column("1"),
+    ),
+}
+
+
+def _dialect(session: AsyncSession):
+    return postgresql if session.bind.dialect.name == "postgresql" else sqlite
+
+
+def _bucket(dialect_name: str, ts, resolution: int):
+    """Start of the `resolution`-second UTC bucket containing `ts`."""
+    width = literal_column(str(int(resolution)))  # inlined: it appears in GROUP BY
+    if dialect_name == "sqlite":
+        epoch = cast(func.strftime("%s", ts), Integer) // width * width
+        return func.strftime("%Y-%m-%d %H:%M:%S.000000", epoch, "unixepoch")
+    return func.to_timestamp(func.floor(func.extract("epoch", ts) / width) * width)
+
+
+def align(ts: datetime, resolution: int) -> datetime:
+    return datetime.fromtimestamp(ts.timestamp() // resolution * resolution, timezone.utc)
+
+
+def resolve_range(start: datetime | None, end: datetime | None) -> tuple[datetime, datetime]:
+    """Defaults to the last day; naive datetimes are UTC.  ValueError if empty."""
+    end = end or datetime.now(timezone.utc)
+    end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+    start = start or end - timedelta(days=1)
+    start = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+    if start >= end:
+        raise ValueError("start must be before end")
+    return start, end
+
+
+def pick_resolution(start: datetime, end: datetime, max_points: int) -> int:
+    """Finest resolution whose bucket count over [start, end) fits `max_points`."""
+    span = (end - start).total_seconds()
+    for resolution in RESOLUTIONS:
+        if span / resolution <= max_points:
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+def _fold_statement(dialect, dialect_name: str, series: Series, resolution: int, lo, hi):
+    bucket = _bucket(dialect_name, series.bucket_ts, resolution)
+    conds = [series.watermark <= hi, series.source.is_not(None)]
+    if lo is not None:
+        conds.append(series.watermark > lo)
+    rows = (
+        select(
+            literal(series.name),
+            series.source,
+            series.metric,
+            literal_column(str(int(resolution))),
+            bucket,
+            func.sum(series.weight),
+            func.coalesce(func.sum(series.value * series.weight), 0.0),
+            func.min(series.value),
+            func.max(series.value),
+        )
+        .where(*conds)
+        .group_by(series.source, series.metric, bucket)
+    )
+    stmt = dialect.insert(Rollup.__table__).from_select(
+        ["series", "source_id", "metric", "resolution", "bucket",
+         "count", "total", "min_value", "max_value"],
+        rows,
+    )
+    return _merge(stmt)
+
+
+def _merge(stmt):
+    """ON CONFLICT: fold the new aggregates into the existing bucket."""
+    t = Rollup.__table__
+    new = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[t.c.series, t.c.source_id, t.c.metric, t.c.resolution, t.c.bucket],
+        set_={
+            "count": t.c.count + new.count,
+            "total": t.c.total + new.total,
+            "min_value": case(
+                (t.c.min_value.is_(None) | (new.min_value < t.c.min_value), new.min_value),
+                else_=t.c.min_value,
+            ),
+            "max_value": case(
+                (t.c.max_value.is_(None) | (new.max_value > t.c.max_value), new.max_value),
+                else_=t.c.max_value,
+            ),
+        },
+    )
+
+
+UPSERT_ROWS = 1000  # 9 parameters per row, well below PostgreSQL's 32767
+
+
+async def _upsert(session: AsyncSession, dialect, acc: dict[tuple, list], series: str) -> int:
+    """Merge {(source, metric, resolution, bucket epoch): [count, total, min, max]} into `rollups`."""
+    rows = [
+        {"series": series, "source_id": source_id, "metric": metric,
+         "resolution": resolution, "bucket": datetime.fromtimestamp(bucket, timezone.utc),
+         "count": n, "total": total, "min_value": lo_v, "max_value": hi_v}
+        for (source_id, metric, resolution, bucket), (n, total, lo_v, hi_v) in acc.items()
+    ]
+    for i in range(0, len(rows), UPSERT_ROWS):
+        await session.execute(_merge(dialect.insert(Rollup.__table__).values(rows[i:i + UPSERT_ROWS])))
+    return len(rows)
+
+
+def _split(count: int, start: float, end: float, resolution: int) -> list[tuple[int, int]]:
+    """
+    [(bucket epoch, detections)] of an event over [start, end]: its count
+    shared out by the time it spends in each bucket, rounded on the running
+    total so the parts add up to `count`.  Buckets that get none are left out.
+    """
+    first = int(start // resolution * resolution)
+    if end <= start or end <= first + resolution:
+        return [(first, count)]
+    parts, given, bucket = [], 0, first
+    while bucket < end:
+        upto = round(count * (min(end, bucket + resolution) - start) / (end - start))
+        if upto > given:
+            parts.append((bucket, upto - given))
+            given = upto
+        bucket += resolution
+    return parts
+
+
+async def _fold_events(session: AsyncSession, dialect, lo: datetime | None, hi: datetime) -> int:
+    """Detection events ending in (lo, hi], split across the buckets they span."""
+    e = DetectionEvent.__table__
+    q = select(e.c.camera_id, e.c.object_name, e.c.start_time, e.c.end_time, e.c.count, e.c.max_confidence)
+    q = q.where(e.c.end_time <= hi, e.c.camera_id.is_not(None))
+    if lo is not None:
+        q = q.where(e.c.end_time > lo)
+
+    acc: dict[tuple, list] = {}
+    async for camera_id, name, start, end, count, conf in await session.stream(q):
+        if not count:
+            continue
+        start = (start if start.tzinfo else start.replace(tzinfo=timezone.utc)).timestamp()
+        end = (end if end.tzinfo else end.replace(tzinfo=timezone.utc)).timestamp()
+        for resolution in RESOLUTIONS:
+            for bucket, n in _split(count, start, end, resolution):
+                key = (camera_id, name, resolution, bucket)
+                total = conf * n if conf is not None else 0.0
+                a = acc.get(key)
+                if a is None:
+                    acc[key] = [n, total, conf, conf]
+                else:
+                    a[0] += n
+                    a[1] += total
+                    if conf is not None:
+                        a[2] = conf if a[2] is None else min(a[2], conf)
+                        a[3] = conf if a[3] is None else max(a[3], conf)
+    return await _upsert(session, dialect, acc, "detections") if acc else 0
+
+
+async def _fold_chunks(session: AsyncSession, dialect, lo: datetime | None, hi: datetime) -> int:
+    """Sensor readings kept as compact chunks: decoded and aggregated here."""
+    c = SensorChunk.__table__
+    q = select(c.c.device_id, c.c.reading_type, c.c.hour, c.c.offsets, c.c.samples).where(c.c.hour <= hi)
+    if lo is not None:
+        q = q.where(c.c.hour > lo - timedelta(seconds=CHUNK_SECONDS))
+
+    acc: dict[tuple, list] = {}
+    for device_id, reading_type, hour, offsets, samples in await session.execute(q):
+        ts, values = unpack(hour, offsets, samples)
+        keep = ts <= hi.timestamp()
+        if lo is not None:
+            keep &= ts > lo.timestamp()
+        ts, values = ts[keep], values[keep].astype(np.float64)
+        for resolution in RESOLUTIONS:
+            buckets = ts // resolution * resolution
+            for bucket in np.unique(buckets):
+                v = values[buckets == bucket]
+                key = (device_id, reading_type, resolution, int(bucket))
+                n, total, lo_v, hi_v = len(v), float(v.sum()), float(v.min()), float(v.max())
+                if key in acc:
+                    a = acc[key]
+                    acc[key] = [a[0] + n, a[1] + total, min(a[2], lo_v), max(a[3], hi_v)]
+                else:
+                    acc[key] = [n, total, lo_v, hi_v]
+    return await _upsert(session, dialect, acc, "sensor") if acc else 0
+
+
+async def fold(session: AsyncSession, series: Series, now: datetime | None = None, lag: float = ROLLUP_LAG_SECONDS) -> int:
+    """
+    Fold the series' rows past its watermark into every resolution and move
+    the watermark.  Caller commits.  Returns the number of buckets touched.
+    """
+    hi = (now or datetime.now(timezone.utc)) - timedelta(seconds=lag)
+    dialect = _dialect(session)
+    await session.execute(
+        dialect.insert(RollupWatermark).values(series=series.name).on_conflict_do_nothing()
+    )
+    lo = await session.scalar(
+        select(RollupWatermark.watermark)
+        .where(RollupWatermark.series == series.name)
+        .with_for_update()
+    )
+    if lo is not None and lo.tzinfo is None:
+        lo = lo.replace(tzinfo=timezone.utc)  # SQLite drops the offset
+    if lo is not None and lo >= hi:
+        return 0
+
+    touched = 0
+    if series.name == "detections":
+        touched += await _fold_events(session, dialect, lo, hi)
+    else:
+        for resolution in RESOLUTIONS:
+            result = await session.execute(
+                _fold_statement(dialect, session.bind.dialect.name, series, resolution, lo, hi)
+            )
+            touched += max(result.rowcount or 0, 0)
+    if series.name == "sensor":
+        touched += await _fold_chunks(session, dialect, lo, hi)
+    await session.execute(
+        RollupWatermark.__table__.update()
+        .where(RollupWatermark.series == series.name)
+        .values(watermark=hi)
+    )
+    return touched
+
+
+async def rebuild(session: AsyncSession, series: Series) -> None:
+    """
+    Forget the series' buckets and watermark; the next fold starts over from
+    the first row.  Takes the watermark lock, so it cannot interleave with a
+    fold.  Caller commits.
+    """
+    await session.execute(
+        _dialect(session).insert(RollupWatermark).values(series=series.name).on_conflict_do_nothing()
+    )
+    await session.scalar(
+        select(RollupWatermark.watermark)
+        .where(RollupWatermark.series == series.name)
+        .with_for_update()
+    )
+    await session.execute(delete(Rollup).where(Rollup.series == series.name))
+    await session.execute(
+        RollupWatermark.__table__.update()
+        .where(RollupWatermark.series == series.name)
+        .values(watermark=None)
+    )
+
+
+async def query_rollups(
+    session: AsyncSession,
+    series: str,
+    source_id: str,
+    *,
+    start: datetime,
+    end: datetime,
+    metric: str | None = None,
+    max_points: int = DEFAULT_POINTS,
+) -> tuple[int, list[dict[str, Any]]]:
+    """(resolution, points) for buckets starting in [start, end)."""
+    resolution = pick_resolution(start, end, max_points)
+    t = Rollup.__table__
+    q = (
+        select(t.c.metric, t.c.bucket, t.c.count, t.c.total, t.c.min_value, t.c.max_value)
+        .where(
+            t.c.series == series,
+            t.c.source_id == source_id,
+            t.c.resolution == resolution,
+            t.c.bucket >= align(start, resolution),
+            t.c.bucket < end,
+        )
+        .order_by(t.c.bucket, t.c.metric)
+    )
+    if metric is not None:
+        q = q.where(t.c.metric == metric)
+    points = [
+        {
+            "metric": name,
+            "bucket": bucket if bucket.tzinfo else bucket.replace(tzinfo=timezone.utc),
+            "count": count,
+            "min": lo,
+            "max": hi,
+            "avg": total / count if count else None,
+        }
+        for name, bucket, count, total, lo, hi in await session.execute(q)
+    ]
+    return resolution, points
+
+
+class RollupJob:
+    def __init__(self, interval: float = ROLLUP_INTERVAL_SECONDS, lag: float = ROLLUP_LAG_SECONDS):
+        self.interval = interval
+        self.lag = lag
+
+    async def run_once(self, now: datetime | None = None) -> int:
+        touched = 0
+        for series in SERIES.values():
+            start = time.perf_counter()
+            async with AsyncSessionLocal() as session:
+                n = await fold(session, series, now, self.lag)
+                await session.commit()
+            metrics.observe(f"rollups.{series.name}.fold", time.perf_counter() - start)
+            metrics.inc(f"rollups.{series.name}.buckets", n)
+            touched += n
+        return touched
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Rollup maintenance failed")
+            await asyncio.sleep(self.interval)
+
+
+rollup_job = RollupJob()
@@ -0,0 +1,246 @@
+# app/utils/sensor_cache.py
+"""
+In-process cache of the most recent sensor readings.
+
+Every (device, reading type) series gets a fixed-size ring buffer of
+`SENSOR_CACHE_SIZE` (timestamp, value) pairs.  The buffers are rows of two
+2-D NumPy arrays, so a window query over one device or over many devices is
+a handful of vectorised operations – no database round trip:
+
+* `latest()` / `latest_values()` – newest value(s), by device or location
+* `window()` – count, mean, min, max and least-squares slope (per second)
+  over the last N seconds
+* `window_many()` – the same for a list of devices at once, as arrays
+
+A buffer is in time order, so the readings of a window are its newest `k`
+slots; `k` is found by bisection and only those slots are read.
+
+Memory: each series holds two float64 rows of `SENSOR_CACHE_SIZE` slots
+(about 56 KiB at the default 3600), rows are allocated in doubling blocks,
+and every gunicorn worker keeps its own copy of the cache.
+
+Readings enter through `SensorStore.append` (ingest) and through
+`SensorStore.refresh_cache` (warm-up on start, then a periodic catch-up
+with what other workers stored).  A series only accepts readings newer than
+its latest one, so overlapping refreshes are idempotent.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Iterable, Sequence
+
+import numpy as np
+
+from app.core.config import SENSOR_CACHE_SIZE, SENSOR_CACHE_WINDOW_SECONDS
+from app.utils import metrics
+
+
+@dataclass(frozen=True)
+class WindowStats:
+    count: int
+    mean: float
+    min: float
+    max: float
+    slope: float  # value units per second; nan below two readings
+
+
+def _epoch(ts: datetime | float) -> float:
+    return ts.timestamp() if isinstance(ts, datetime) else float(ts)
+
+
+class SensorCache:
+    def __init__(self, capacity: int = SENSOR_CACHE_SIZE, window: float = SENSOR_CACHE_WINDOW_SECONDS):
+        self.capacity = capacity
+        self.window_seconds = window
+        self._rows: dict[tuple[str, str], int] = {}
+        self._ts = np.full((0, capacity), np.nan)
+        self._val = np.full((0, capacity), np.nan)
+        self._next = np.zeros(0, dtype=np.int64)  # total writes per row
+        self._location: dict[str, str] = {}
+        self._types: dict[str, set[str]] = {}  # device -> reading types
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _row(self, device_id: str, reading_type: str) -> int:
+        key = (device_id, reading_type)
+        row = self._rows.get(key)
+        if row is not None:
+            return row
+        row = len(self._rows)
+        if row == len(self._next):  # grow by doubling
+            extra = max(16, row)
+            self._ts = np.vstack([self._ts, np.full((extra, self.capacity), np.nan)])
+            self._val = np.vstack([self._val, np.full((extra, self.capacity), np.nan)])
+            self._next = np.concatenate([self._next, np.zeros(extra, dtype=np.int64)])
+        self._rows[key] = row
+        self._types.setdefault(device_id, set()).add(reading_type)
+        return row
+
+    def _last_ts(self, row: int) -> float:
+        n = self._next[row]
+        return self._ts[row, (n - 1) % self.capacity] if n else -np.inf
+
+    # ------------------------------------------------------------- writing --
+    def add(
+        self,
+        device_id: str,
+        reading_type: str,
+        value: float,
+        ts: datetime | float,
+        location: str | None = None,
+    ) -> bool:
+        """Append one reading; False if it is not newer than the series' latest."""
+        row = self._row(device_id, reading_type)
+        ts = _epoch(ts)
+        if ts <= self._last_ts(row):
+            return False
+        pos = self._next[row] % self.capacity
+        self._ts[row, pos] = ts
+        self._val[row, pos] = value
+        self._next[row] += 1
+        if location:
+            self._location[device_id] = location
+        return True
+
+    def extend(self, readings: Iterable[dict[str, Any]]) -> int:
+        """Append {device_id, reading_type, value, timestamp, location?} dicts, oldest first."""
+        added = 0
+        for r in sorted(readings, key=lambda r: _epoch(r["timestamp"])):
+            added += self.add(r["device_id"], r["reading_type"], r["value"], r["timestamp"], r.get("location"))
+        return added
+
+    # ------------------------------------------------------------- reading --
+    def latest(self, device_id: str, reading_type: str) -> tuple[float, float] | None:
+        """(epoch seconds, value) of the newest reading, or None."""
+        row = self._rows.get((device_id, reading_type))
+        if row is None or not self._next[row]:
+            return None
+        pos = (self._next[row] - 1) % self.capacity
+        return float(self._ts[row, pos]), float(self._val[row, pos])
+
+    def latest_values(self, *, device_id: str | None = None, location: str | None = None) -> dict[str, float]:
+        """Newest value per reading type of a device, or of every device at a location."""
+        if device_id is not None:
+            devices = [device_id]
+        else:
+            devices = [d for d, loc in self._location.items() if loc == location]
+        newest: dict[str, tuple[float, float]] = {}
+        for device in devices:
+            for reading_type in self._types.get(device, ()):
+                hit = self.latest(device, reading_type)
+                if hit and (reading_type not in newest or hit[0] > newest[reading_type][0]):
+                    newest[reading_type] = hit
+        return {name: value for name, (_, value) in newest.items()}
+
+    def _recent_counts(self, rows: np.ndarray, cutoff: float) -> np.ndarray:
+        """
+        Per row, how many of the newest readings are at or after `cutoff`.
+        A buffer is in time order, so this is a bisection – run for all rows
+        at once in O(log capacity) vector steps.
+        """
+        last = self._next[rows]
+        if len(rows) == 1:  # scalar bisection: no per-step array overhead
+            row, n, cap = int(rows[0]), int(last[0]), self.capacity
+            lo, hi = 0, min(n, cap)
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if self._ts[row, (n - mid) % cap] >= cutoff:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            return np.array([lo])
+        lo = np.zeros(len(rows), dtype=np.int64)
+        hi = np.minimum(last, self.capacity)
+        while True:
+            active = lo < hi
+            if not active.any():
+                return lo
+            mid = (lo + hi + 1) // 2
+            ok = self._ts[rows, (last - mid) % self.capacity] >= cutoff
+            lo = np.where(active & ok, mid, lo)
+            hi = np.where(active & ~ok, mid - 1, hi)
+
+    def window_many(
+        self,
+        device_ids: Sequence[str],
+        reading_type: str,
+        seconds: float | None = None,
+        now: float | None = None,
+    ) -> dict[str, np.ndarray]:
+        """
+        count / mean / min / max / slope arrays (one entry per device, in
+        order) over the readings of the last `seconds`; nan where empty.
+        """
+        now = time.time() if now is None else now
+        seconds = self.window_seconds if seconds is None else seconds
+        rows = np.fromiter((self._rows.get((d, reading_type), -1) for d in device_ids), np.int64, len(device_ids))
+        known = rows >= 0
+        out = {name: np.full(len(rows), np.nan) for name in ("mean", "min", "max", "slope")}
+        out["count"] = np.zeros(len(rows), dtype=np.int64)
+        if not known.any():
+            return out
+
+        rk = rows[known]
+        n = self._recent_counts(rk, now - seconds)
+        if not n.any():  # every known series is stale: nothing to reduce
+            return out
+        back = np.arange(n.max())
+        pos = (self._next[rk][:, None] - 1 - back) % self.capacity  # newest first
+        ts, val = self._ts[rk[:, None], pos], self._val[rk[:, None], pos]
+        mask = back < n[:, None]
+        t = np.where(mask, ts - now, 0.0)  # relative times keep the sums small
+        v = np.where(mask, val, 0.0)
+        st, sv = t.sum(axis=1), v.sum(axis=1)
+        stt, stv = np.einsum("ij,ij->i", t, t), np.einsum("ij,ij->i", t, v)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = sv / n
+            slope = (stv - st * sv / n) / (stt - st * st / n)
+        slope[n < 2] = np.nan
+        lo = np.where(mask, val, np.inf).min(axis=1)
+        hi = np.where(mask, val, -np.inf).max(axis=1)
+        empty = n == 0
+        lo[empty] = hi[empty] = np.nan
+
+        out["count"][known] = n
+        out["mean"][known], out["slope"][known] = mean, slope
+        out["min"][known], out["max"][known] = lo, hi
+        return out
+
+    def window(
+        self,
+        device_id: str,
+        reading_type: str,
+        seconds: float | None = None,
+        now: float | None = None,
+    ) -> WindowStats:
+        """`window_many` for one series, on plain slices of its buffer."""
+        now = time.time() if now is None else now
+        seconds = self.window_seconds if seconds is None else seconds
+        row = self._rows.get((device_id, reading_type))
+        n = 0 if row is None else int(self._recent_counts(np.array([row]), now - seconds)[0])
+        if n == 0:
+            return WindowStats(0, math.nan, math.nan, math.nan, math.nan)
+        # the newest n slots: one slice, or two when they wrap around
+        end = int(self._next[row]) % self.capacity
+        start = end - n
+        if start >= 0:
+            ts, val = self._ts[row, start:end], self._val[row, start:end]
+        else:
+            ts = np.concatenate((self._ts[row, start:], self._ts[row, :end]))
+            val = np.concatenate((self._val[row, start:], self._val[row, :end]))
+        mean = float(val.mean())
+        slope = math.nan
+        if n >= 2:
+            dt = ts - ts.mean()
+            denom = float(dt @ dt)
+            slope = float(dt @ (val - mean)) / denom if denom else math.nan
+        return WindowStats(n, mean, float(val.min()), float(val.max()), slope)
+
+
+sensor_cache = SensorCache()
+metrics.register_gauge("sensor.cache.series", sensor_cache.__len__)
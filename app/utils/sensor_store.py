@@ -0,0 +1,332 @@
+# app/utils/sensor_store.py
+"""
+Sensor reading storage: row per value or compact hourly chunks.
+
+`SENSOR_STORAGE=rows` (default) keeps one `sensor_readings` row per value –
+a 64-char id, strings and an index entry for every float.
+
+`SENSOR_STORAGE=chunks` keeps one `sensor_chunks` row per
+(device, reading type, hour) holding the values as little-endian float32 and
+their second offsets from the hour as int32 – 8 bytes a reading.  New
+readings are appended in place by a single `INSERT … ON CONFLICT DO UPDATE
+SET samples = samples || new, offsets = offsets || new` per batch, and a
+chunk decodes with two `np.frombuffer` calls.
+
+Readers go through `sensor_store` and see both layouts merged, so switching
+modes (or a table holding both) needs no migration.
+
+Readings enter through `append()` (in the caller's transaction) or
+`record()` (a session and commit of its own).  Where the server reads a
+device's sensors (`GET /devices/{id}/sensoreading`, dosing-profile
+creation) it uses `record()`, so neither a read endpoint's nor a service's
+transaction carries the write; `device_readings()` turns the device's JSON
+into their input.
+
+The store also feeds the in-process `sensor_cache` (app.utils.sensor_cache):
+appended readings go straight in, and `run_cache()` warms it with the last
+`SENSOR_CACHE_WINDOW_SECONDS` on start, then every
+`SENSOR_CACHE_REFRESH_SECONDS` picks up what other workers stored.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable
+
+import numpy as np
+from sqlalchemy import LargeBinary, cast, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import (
+    SENSOR_CACHE_REFRESH_SECONDS,
+    SENSOR_CACHE_WINDOW_SECONDS,
+    SENSOR_STORAGE,
+)
+from app.core.database import AsyncSessionLocal
+from app.models import SensorChunk, SensorReading
+from app.utils.sensor_cache import SensorCache, sensor_cache
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SECONDS = 3600
+READING_TYPES = ("ph", "tds")  # what devices report and dosing reads
+VALUE_DTYPE = np.dtype("<f4")
+OFFSET_DTYPE = np.dtype("<i4")
+
+
+def _utc(ts: datetime) -> datetime:
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)  # SQLite drops the offset
+
+
+def chunk_start(ts: datetime) -> datetime:
+    epoch = int(_utc(ts).timestamp())
+    return datetime.fromtimestamp(epoch - epoch % CHUNK_SECONDS, timezone.utc)
+
+
+def device_readings(device, data: dict[str, Any], ts: datetime | None = None) -> list[dict[str, Any]]:
+    """`append()` input from a device's sensor JSON (`ph`/`pH`, `tds`/`TDS`); the rest is ignored."""
+    ts = ts or datetime.now(timezone.utc)
+    location = (device.location_description or "")[:100] or None
+    out = []
+    for key, value in data.items():
+        reading_type = str(key).lower()
+        if reading_type not in READING_TYPES or isinstance(value, bool):
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            continue
+        out.append({"device_id": device.id, "reading_type": reading_type, "value": value,
+                    "timestamp": ts, "location": location})
+    return out
+
+
+def pack(offsets: Iterable[int], values: Iterable[float]) -> tuple[bytes, bytes]:
+    return (
+        np.asarray(list(offsets), dtype=OFFSET_DTYPE).tobytes(),
+        np.asarray(list(values), dtype=VALUE_DTYPE).tobytes(),
+    )
+
+
+def unpack(hour: datetime, offsets: bytes, samples: bytes) -> tuple[np.ndarray, np.ndarray]:
+    """(epoch seconds int64, float32 values) of one chunk, in append order."""
+    base = int(_utc(hour).timestamp())
+    ts = np.frombuffer(offsets, dtype=OFFSET_DTYPE).astype(np.int64) + base
+    return ts, np.frombuffer(samples, dtype=VALUE_DTYPE)
+
+
+class SensorStore:
+    def __init__(self, mode: str = SENSOR_STORAGE, cache: SensorCache | None = None):
+        if mode not in ("rows", "chunks"):
+            raise ValueError(f"unknown sensor storage mode {mode!r}")
+        self.mode = mode
+        self.cache = cache
+
+    # ------------------------------------------------------------- writing --
+    async def append(self, session: AsyncSession, readings: Iterable[dict[str, Any]]) -> int:
+        """
+        Store readings ({device_id, reading_type, value, timestamp, location?})
+        in one statement.  The caller commits.
+        """
+        readings = list(readings)
+        if not readings:
+            return 0
+        if self.mode == "rows":
+            await session.execute(insert(SensorReading), [
+                {
+                    "device_id": r["device_id"],
+                    "reading_type": r["reading_type"],
+                    "value": r["value"],
+                    "timestamp": r["timestamp"],
+                    "location": r.get("location"),
+                }
+                for r in readings
+            ])
+        else:
+            await session.execute(self._append_chunks(session, readings))
+        if self.cache is not None:
+            self.cache.extend(readings)
+        return len(readings)
+
+    async def record(self, readings: Iterable[dict[str, Any]]) -> int:
+        """
+        `append()` in a session of its own, committed at once.  Failures are
+        logged, not raised: storing what a device reported is a side effect.
+        """
+        readings = list(readings)
+        if not readings:
+            return 0
+        try:
+            async with AsyncSessionLocal() as session:
+                n = await self.append(session, readings)
+                await session.commit()
+        except Exception:
+            logger.exception("Could not store %d sensor readings", len(readings))
+            return 0
+        return n
+
+    @staticmethod
+    def _append_chunks(session: AsyncSession, readings: list[dict[str, Any]]):
+        groups: dict[tuple, list] = defaultdict(lambda: [[], [], None])
+        for r in readings:
+            ts = _utc(r["timestamp"])
+            hour = chunk_start(ts)
+            offsets, values, _ = group = groups[(r["device_id"], r["reading_type"], hour)]
+            offsets.append(int(ts.timestamp() - hour.timestamp()))
+            values.append(r["value"])
+            group[2] = r.get("location") or group[2]
+
+        rows = []
+        for (device_id, reading_type, hour), (offsets, values, location) in groups.items():
+            packed_offsets, packed_values = pack(offsets, values)
+            rows.append({
+                "device_id": device_id, "reading_type": reading_type, "hour": hour,
+                "location": location, "count": len(values),
+                "samples": packed_values, "offsets": packed_offsets,
+            })
+
+        dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+        t = SensorChunk.__table__
+        stmt = dialect.insert(t).values(rows)
+        new = stmt.excluded
+        return stmt.on_conflict_do_update(
+            index_elements=[t.c.device_id, t.c.reading_type, t.c.hour],
+            set_={
+                # the cast keeps SQLite's || (a text operator) binary
+                "samples": cast(t.c.samples.op("||")(new.samples), LargeBinary),
+                "offsets": cast(t.c.offsets.op("||")(new.offsets), LargeBinary),
+                "count": t.c.count + new.count,
+                "location": func.coalesce(new.location, t.c.location),
+            },
+        )
+
+    # ------------------------------------------------------------- reading --
+    async def series(
+        self,
+        session: AsyncSession,
+        device_id: str,
+        reading_type: str,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """(epoch seconds int64, float64 values) in [start, end), time-ordered."""
+        r = SensorReading.__table__
+        q = select(r.c.timestamp, r.c.value).where(
+            r.c.device_id == device_id, r.c.reading_type == reading_type
+        )
+        c = SensorChunk.__table__
+        cq = select(c.c.hour, c.c.offsets, c.c.samples).where(
+            c.c.device_id == device_id, c.c.reading_type == reading_type
+        )
+        if start is not None:
+            q = q.where(r.c.timestamp >= start)
+            cq = cq.where(c.c.hour > start - timedelta(seconds=CHUNK_SECONDS))
+        if end is not None:
+            q = q.where(r.c.timestamp < end)
+            cq = cq.where(c.c.hour < end)
+
+        rows = (await session.execute(q)).all()
+        parts_ts = [np.fromiter((int(_utc(ts).timestamp()) for ts, _ in rows), np.int64, len(rows))]
+        parts_v = [np.fromiter((v for _, v in rows), np.float64, len(rows))]
+        for hour, offsets, samples in await session.execute(cq):
+            ts, values = unpack(hour, offsets, samples)
+            parts_ts.append(ts)
+            parts_v.append(values.astype(np.float64))
+
+        ts, values = np.concatenate(parts_ts), np.concatenate(parts_v)
+        keep = np.ones(len(ts), dtype=bool)
+        if start is not None:
+            keep &= ts >= int(_utc(start).timestamp())
+        if end is not None:
+            keep &= ts < int(_utc(end).timestamp())
+        ts, values = ts[keep], values[keep]
+        order = np.argsort(ts, kind="stable")
+        return ts[order], values[order]
+
+    async def latest(
+        self,
+        session: AsyncSession,
+        *,
+        location: str | None = None,
+        device_id: str | None = None,
+    ) -> dict[str, float]:
+        """
+        Newest value per reading type for a location and/or device.  The
+        newest row and chunk are taken per (device, reading type) – chunks of
+        several devices can share an hour – and merged here.
+        """
+        newest: dict[str, tuple[float, float]] = {}  # type -> (epoch, value)
+
+        r = SensorReading.__table__
+        rn = func.row_number().over(
+            partition_by=(r.c.device_id, r.c.reading_type), order_by=r.c.timestamp.desc()
+        )
+        q = select(r.c.reading_type, r.c.value, r.c.timestamp, rn.label("rn"))
+        c = SensorChunk.__table__
+        crn = func.row_number().over(
+            partition_by=(c.c.device_id, c.c.reading_type), order_by=c.c.hour.desc()
+        )
+        cq = select(c.c.reading_type, c.c.hour, c.c.offsets, c.c.samples, crn.label("rn"))
+        if location is not None:
+            q, cq = q.where(r.c.location == location), cq.where(c.c.location == location)
+        if device_id is not None:
+            q, cq = q.where(r.c.device_id == device_id), cq.where(c.c.device_id == device_id)
+
+        q, cq = q.subquery(), cq.subquery()
+        for reading_type, value, ts in await session.execute(
+            select(q.c.reading_type, q.c.value, q.c.timestamp).where(q.c.rn == 1)
+        ):
+            epoch = _utc(ts).timestamp()
+            if reading_type not in newest or epoch > newest[reading_type][0]:
+                newest[reading_type] = (epoch, value)
+        for reading_type, hour, offsets, samples in await session.execute(
+            select(cq.c.reading_type, cq.c.hour, cq.c.offsets, cq.c.samples).where(cq.c.rn == 1)
+        ):
+            ts, values = unpack(hour, offsets, samples)
+            if not len(ts):
+                continue
+            i = int(np.argmax(ts))
+            if reading_type not in newest or ts[i] >= newest[reading_type][0]:
+                newest[reading_type] = (float(ts[i]), float(values[i]))
+        return {name: value for name, (_, value) in newest.items()}
+
+    async def recent(self, session: AsyncSession, since: datetime) -> list[dict[str, Any]]:
+        """Every reading at or after `since` from both layouts, oldest first."""
+        out: list[dict[str, Any]] = []
+        r = SensorReading.__table__
+        for device_id, reading_type, ts, value, location in await session.execute(
+            select(r.c.device_id, r.c.reading_type, r.c.timestamp, r.c.value, r.c.location)
+            .where(r.c.timestamp >= since, r.c.device_id.is_not(None))
+        ):
+            out.append({"device_id": device_id, "reading_type": reading_type,
+                        "timestamp": _utc(ts).timestamp(), "value": value, "location": location})
+        c = SensorChunk.__table__
+        floor = _utc(since).timestamp()
+        for device_id, reading_type, hour, location, offsets, samples in await session.execute(
+            select(c.c.device_id, c.c.reading_type, c.c.hour, c.c.location, c.c.offsets, c.c.samples)
+            .where(c.c.hour > since - timedelta(seconds=CHUNK_SECONDS))
+        ):
+            ts, values = unpack(hour, offsets, samples)
+            keep = ts >= floor
+            out.extend(
+                {"device_id": device_id, "reading_type": reading_type,
+                 "timestamp": float(t), "value": float(v), "location": location}
+                for t, v in zip(ts[keep], values[keep])
+            )
+        out.sort(key=lambda x: x["timestamp"])
+        return out
+
+    # --------------------------------------------------------------- cache --
+    async def refresh_cache(self, since: datetime) -> int:
+        """Load readings stored since `since` into the cache; returns how many were new."""
+        if self.cache is None:
+            return 0
+        async with AsyncSessionLocal() as session:
+            readings = await self.recent(session, since)
+        return self.cache.extend(readings)
+
+    async def run_cache(
+        self,
+        window: float = SENSOR_CACHE_WINDOW_SECONDS,
+        interval: float = SENSOR_CACHE_REFRESH_SECONDS,
+    ) -> None:
+        since = datetime.now(timezone.utc) - timedelta(seconds=window)
+        while True:
+            started = datetime.now(timezone.utc)
+            try:
+                t0 = time.perf_counter()
+                n = await self.refresh_cache(since)
+                logger.debug("Sensor cache: %d new readings in %.3fs", n, time.perf_counter() - t0)
+                # overlap by one interval: rows committed late are still picked up
+                since = started - timedelta(seconds=interval)
+            except Exception:
+                logger.exception("Sensor cache refresh failed")
+            await asyncio.sleep(interval)
+
+
+sensor_store = SensorStore(cache=sensor_cache)
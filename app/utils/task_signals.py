@@ -0,0 +1,146 @@
+# app/utils/task_signals.py
+"""
+Wake-ups for `/tasks/lease` long-polls.
+
+A leaser that finds no work parks on its device's signal instead of
+re-running the lease query every half second:
+
+* enqueue paths call `task_signals.notify(db, device_id, …)` before they
+  commit.  The ids are kept on the session and woken in this process once
+  the commit succeeds (a rollback drops them).  On PostgreSQL a
+  `pg_notify` on `CHANNEL` rides in the same transaction, so other workers
+  hear about the task exactly when it becomes visible;
+* `run()` keeps one connection per worker LISTENing on `CHANNEL` and wakes
+  local leasers for every notification sent by another worker.
+
+Every device has a generation counter, bumped on each wake.  A leaser reads
+it before its lease query and `wait()` returns at once if it has moved
+since, so a task committed between the query and the wait is not missed.
+While the listener is down leasers fall back to polling every
+`FALLBACK_POLL_SECONDS`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Iterable
+from uuid import uuid4
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "task_ready"
+KEEPALIVE_SECONDS = 15      # listener liveness check; also the reconnect delay
+FALLBACK_POLL_SECONDS = 5   # leaser re-check interval while not listening
+PAYLOAD_LIMIT = 7000        # bytes per NOTIFY payload (PostgreSQL allows < 8000)
+_PENDING = "task_signals.pending"  # session.info key: ids to wake after commit
+
+
+class TaskSignals:
+    def __init__(self, channel: str = CHANNEL):
+        self.channel = channel
+        self.token = uuid4().hex[:12]  # tags this worker's own notifications
+        self.listening = False
+        self._generation: dict[str, int] = {}
+        self._events: dict[str, asyncio.Event] = {}
+
+    # -------------------------------------------------------------- leasers --
+    def generation(self, device_id: str) -> int:
+        return self._generation.get(device_id, 0)
+
+    async def wait(self, device_id: str, generation: int, timeout: float) -> bool:
+        """Until `device_id` is woken past `generation` or `timeout` passes; True if woken."""
+        if self._generation.get(device_id, 0) != generation:
+            return True
+        if timeout <= 0:
+            return False
+        event_ = self._events.get(device_id)
+        if event_ is None:
+            event_ = self._events[device_id] = asyncio.Event()
+        try:
+            await asyncio.wait_for(event_.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        metrics.inc("tasks.lease.woken")
+        return True
+
+    def wake(self, device_ids: Iterable[str]) -> None:
+        for device_id in device_ids:
+            self._generation[device_id] = self._generation.get(device_id, 0) + 1
+            event_ = self._events.pop(device_id, None)
+            if event_ is not None:
+                event_.set()
+
+    # ------------------------------------------------------------ enqueuers --
+    async def notify(self, db: AsyncSession, *device_ids: str) -> None:
+        """Wake the leasers of `device_ids` when `db` commits. Call before the commit."""
+        ids = set(device_ids)
+        if not ids:
+            return
+        db.info.setdefault(_PENDING, set()).update(ids)
+        if db.bind.dialect.name != "postgresql":
+            return
+        payloads, current = [], self.token
+        for device_id in sorted(ids):
+            if len(current) + len(device_id) + 1 > PAYLOAD_LIMIT:
+                payloads.append(current)
+                current = self.token
+            current = f"{current} {device_id}"
+        payloads.append(current)
+        await db.execute(
+            text("SELECT pg_notify(:channel, p) FROM unnest(CAST(:payloads AS text[])) AS p"),
+            {"channel": self.channel, "payloads": payloads},
+        )
+
+    # ------------------------------------------------------------- listener --
+    def _on_notify(self, _connection, _pid, _channel, payload: str) -> None:
+        token, *device_ids = payload.split(" ")
+        if token != self.token:  # ours were woken on commit already
+            self.wake(device_ids)
+
+    async def run(self, engine: AsyncEngine | None = None) -> None:
+        if engine is None:
+            from app.core.database import engine
+        if engine.dialect.name != "postgresql":
+            return
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    try:
+                        raw = (await conn.get_raw_connection()).driver_connection
+                        await raw.add_listener(self.channel, self._on_notify)
+                        self.listening = True
+                        logger.info("Listening for task notifications on %r", self.channel)
+                        self.wake(list(self._events))  # whatever came in while we were away
+                        while True:
+                            await asyncio.sleep(KEEPALIVE_SECONDS)
+                            await raw.execute("SELECT 1")
+                    finally:
+                        self.listening = False
+                        await conn.invalidate()  # never hand a LISTENing connection back to the pool
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Task notification listener failed")
+            await asyncio.sleep(KEEPALIVE_SECONDS)
+
+
+task_signals = TaskSignals()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session: Session) -> None:
+    device_ids = session.info.pop(_PENDING, None)
+    if device_ids:
+        task_signals.wake(device_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING, None)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+One-off migration for deployments that still have per-frame
+`detection_records`: turn them into `detection_events` and rebuild the
+detection rollups.  The records are deleted as they are converted.
+
+    python backfill_detection_events.py [--yes]
+"""
+import asyncio
+import logging
+import sys
+
+from sqlalchemy import func, select
+
+from app.core.database import AsyncSessionLocal
+from app.models import DetectionRecord
+from app.utils.detection_events import backfill_records
+
+
+async def main(confirmed: bool):
+    async with AsyncSessionLocal() as session:
+        pending = await session.scalar(select(func.count()).select_from(DetectionRecord))
+    if not pending:
+        print("✅  No detection records left to convert.")
+        return
+
+    print(f"{pending} detection records will be converted into events and then DELETED.")
+    if not confirmed and input("Continue? [y/N] ").strip().lower() != "y":
+        print("❌  Aborted.")
+        return
+
+    written = await backfill_records()
+    print(f"✅  Wrote {written} detection events; detection rollups are rebuilt on the next pass.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main("--yes" in sys.argv[1:]))
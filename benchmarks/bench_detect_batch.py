@@ -0,0 +1,85 @@
+# benchmarks/bench_detect_batch.py
+"""
+Detection throughput (frames/sec) versus micro-batch size.
+
+Runs the real `DetectionPool` with the configured detector backend
+(`DETECTOR_BACKEND`, `YOLO_MODEL_PATH`) and feeds it from `--cameras`
+concurrent producers, each submitting its next frame as soon as the previous
+one comes back – the same shape of load `CameraQueue` generates.
+
+    python -m benchmarks.bench_detect_batch --batch 1,2,4,8 --frames 256
+    python -m benchmarks.bench_detect_batch --image data/cam1/latest.jpg
+
+Needs the app environment (.env / DATABASE_URL) because the pool reads its
+defaults from app.core.config.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+import cv2
+import numpy as np
+
+from app.utils.detection_pool import DetectionPool
+from app.utils.detectors import StubDetector, get_detector
+
+
+def _frame(path: str | None) -> bytes:
+    if path:
+        with open(path, "rb") as fh:
+            return fh.read()
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    ok, buf = cv2.imencode(".jpg", img)
+    assert ok
+    return buf.tobytes()
+
+
+async def _run(batch: int, args: argparse.Namespace, jpeg: bytes) -> tuple[float, float]:
+    pool = DetectionPool(workers=args.workers, batch_size=batch, batch_wait_ms=args.wait_ms)
+    pool.start()
+    try:
+        # warm-up: load the model in every process
+        await asyncio.gather(*(pool.detect(jpeg) for _ in range(pool.capacity)))
+        remaining = args.frames
+
+        async def camera():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                await pool.detect(jpeg)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(camera() for _ in range(args.cameras)))
+        elapsed = time.perf_counter() - start
+        stats = pool.stats()
+        return args.frames / elapsed, stats["avg_batch"]
+    finally:
+        pool.shutdown()
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--batch", default="1,2,4,8", help="comma separated batch sizes")
+    ap.add_argument("--frames", type=int, default=128)
+    ap.add_argument("--cameras", type=int, default=16, help="concurrent producers")
+    ap.add_argument("--workers", type=int, default=1, help="pool processes")
+    ap.add_argument("--wait-ms", type=int, default=20)
+    ap.add_argument("--image", help="JPEG to use instead of a synthetic 640x480 frame")
+    args = ap.parse_args()
+
+    if isinstance(get_detector(), StubDetector):
+        print("warning: detector backend is the stub – numbers measure plumbing only")
+
+    jpeg = _frame(args.image)
+    print(f"{'batch':>5} {'avg batch':>10} {'frames/s':>10}")
+    for batch in (int(b) for b in args.batch.split(",")):
+        fps, avg = await _run(batch, args, jpeg)
+        print(f"{batch:>5} {avg:>10.2f} {fps:>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+# benchmarks/bench_detector_backends.py
+"""
+Accuracy / throughput of the CPU detector backends against ultralytics.
+
+Loads the ultralytics model (`YOLO_MODEL_PATH`) as the reference and the
+exported ONNX model (`ONNX_MODEL_PATH`) in fp32 and, with `--int8`, in
+dynamically quantised int8.  For every backend it reports frames/sec at
+batch 1 and at `--batch`, and how well its boxes agree with the reference
+(same class, IoU >= 0.5): precision, recall and mean |conf delta|.
+
+    python -m benchmarks.bench_detector_backends --images data/cam1/raw --int8
+    python -m benchmarks.bench_detector_backends --images samples/ --threads 4 --batch 8
+
+Use real greenhouse frames; synthetic images produce no detections.
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from app.utils import detectors
+from app.utils.detectors import OnnxDetector, YoloDetector
+
+
+def _iou(a, b) -> float:
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _agreement(ref: list[list[dict]], got: list[list[dict]]) -> tuple[float, float, float]:
+    matched = n_ref = n_got = 0
+    deltas = []
+    for ref_dets, got_dets in zip(ref, got):
+        n_ref += len(ref_dets)
+        n_got += len(got_dets)
+        used = set()
+        for r in ref_dets:
+            best, best_j = 0.0, None
+            for j, g in enumerate(got_dets):
+                if j in used or g["name"] != r["name"]:
+                    continue
+                iou = _iou(r["bbox"], g["bbox"])
+                if iou > best:
+                    best, best_j = iou, j
+            if best_j is not None and best >= 0.5:
+                used.add(best_j)
+                matched += 1
+                deltas.append(abs(r["conf"] - got_dets[best_j]["conf"]))
+    precision = matched / n_got if n_got else 1.0
+    recall = matched / n_ref if n_ref else 1.0
+    return precision, recall, float(np.mean(deltas)) if deltas else 0.0
+
+
+def _throughput(det, imgs: list[np.ndarray], batch: int, rounds: int) -> float:
+    det.detect_batch(imgs[:batch])  # warm-up
+    frames = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for i in range(0, len(imgs), batch):
+            chunk = imgs[i:i + batch]
+            det.detect_batch(chunk)
+            frames += len(chunk)
+    return frames / (time.perf_counter() - start)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--images", required=True, help="directory of JPEG frames")
+    ap.add_argument("--limit", type=int, default=64)
+    ap.add_argument("--batch", type=int, default=4)
+    ap.add_argument("--rounds", type=int, default=2)
+    ap.add_argument("--threads", type=int, default=detectors.ONNX_THREADS)
+    ap.add_argument("--int8", action="store_true", help="also benchmark int8 weights")
+    args = ap.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.images, "*.jpg")))[: args.limit]
+    imgs = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+    if not imgs:
+        raise SystemExit(f"no JPEG frames in {args.images}")
+
+    reference = YoloDetector(detectors.YOLO_MODEL_PATH)
+    backends = {
+        "ultralytics": reference,
+        "onnx-fp32": OnnxDetector(detectors.ONNX_MODEL_PATH, threads=args.threads, int8=False),
+    }
+    if args.int8:
+        backends["onnx-int8"] = OnnxDetector(detectors.ONNX_MODEL_PATH, threads=args.threads, int8=True)
+
+    ref_dets = [d for _, d in reference.detect_batch(imgs)]
+    print(f"{len(imgs)} frames, {sum(map(len, ref_dets))} reference boxes, onnx threads={args.threads}")
+    print(f"{'backend':<12} {'fps@1':>8} {'fps@' + str(args.batch):>8} {'precision':>10} {'recall':>8} {'|dconf|':>8}")
+    for name, det in backends.items():
+        fps1 = _throughput(det, imgs, 1, args.rounds)
+        fpsb = _throughput(det, imgs, args.batch, args.rounds)
+        got = [d for _, d in det.detect_batch(imgs)]
+        precision, recall, dconf = _agreement(ref_dets, got)
+        print(f"{name:<12} {fps1:>8.1f} {fpsb:>8.1f} {precision:>10.3f} {recall:>8.3f} {dconf:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
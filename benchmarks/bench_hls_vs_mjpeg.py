@@ -0,0 +1,150 @@
+# benchmarks/bench_hls_vs_mjpeg.py
+"""
+Server CPU per live viewer: MJPEG generator vs HLS static files.
+
+One synthetic camera publishes 640x480 JPEGs at `CAM_FPS` for `--seconds`.
+
+* mjpeg – `--viewers` concurrent `/cameras/stream?mode=mjpeg` generators
+  (the real endpoint, driven in-process) consume every frame.
+* hls   – one `HlsSegmenter` (ffmpeg) encodes the camera; viewers poll the
+  playlist like a player does and fetch each new segment from the real
+  `HlsStaticFiles` mount over an in-process ASGI transport.
+
+Reported: Python CPU seconds (this process), encoder CPU (ffmpeg, HLS only)
+and CPU milliseconds per viewer-second.  Socket I/O is excluded for both
+modes; behind a CDN/nginx the HLS viewer cost leaves Python entirely and
+only the fixed encoder cost remains.
+
+    python -m benchmarks.bench_hls_vs_mjpeg --viewers 1,10,50 --seconds 20
+
+Needs the app environment (.env / DATABASE_URL) and an ffmpeg binary
+(`FFMPEG_BIN`).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+# keep frames and segments out of the real data root
+os.environ["CAM_DATA_ROOT"] = tempfile.mkdtemp(prefix="bench-hls-")
+
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.routing import Mount  # noqa: E402
+
+from app.core.config import DATA_ROOT, FFMPEG_BIN, FPS, HLS_TARGET_DURATION  # noqa: E402
+from app.routers import cameras  # noqa: E402
+from app.utils.frame_hub import frame_hub  # noqa: E402
+from app.utils.frame_store import frame_store  # noqa: E402
+from app.utils.hls import HlsSegmenter, HlsStaticFiles, playlist_url  # noqa: E402
+
+CAM = "bench-cam"
+
+
+def _frames(n: int = 30) -> list[bytes]:
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    out = []
+    for i in range(n):
+        img = np.roll(base, i * 8, axis=1)
+        out.append(cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes())
+    return out
+
+
+async def _publish(frames: list[bytes], seconds: float) -> None:
+    interval = 1 / max(FPS, 1)
+    end = time.monotonic() + seconds
+    i = 0
+    while time.monotonic() < end:
+        frame_hub.publish(frame_store.put(CAM, frames[i % len(frames)]))
+        i += 1
+        await asyncio.sleep(interval)
+
+
+def _children_cpu() -> float:
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime
+
+
+async def bench_mjpeg(viewers: int, seconds: float, frames: list[bytes]) -> tuple[float, float]:
+    frame_store.put(CAM, frames[0])
+    responses = [await cameras.stream(CAM, None, mode="mjpeg") for _ in range(viewers)]
+
+    async def viewer(body):
+        sent = 0
+        async for part in body:
+            sent += len(part)
+        return sent
+
+    tasks = [asyncio.create_task(viewer(r.body_iterator)) for r in responses]
+    cpu = time.process_time()
+    await _publish(frames, seconds)
+    cpu = time.process_time() - cpu
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return cpu, 0.0
+
+
+async def bench_hls(viewers: int, seconds: float, frames: list[bytes], ffmpeg: str) -> tuple[float, float]:
+    app = Starlette(routes=[Mount("/hls", HlsStaticFiles(directory=DATA_ROOT), name="hls")])
+    seg = HlsSegmenter(enabled=True, data_root=DATA_ROOT, ffmpeg=ffmpeg, idle_seconds=1)
+    url = playlist_url(CAM)
+
+    async def viewer(client: AsyncClient):
+        seen: set[str] = set()
+        while True:
+            r = await client.get(url)
+            if r.status_code == 200:
+                for line in r.text.splitlines():
+                    if line.endswith(".ts") and line not in seen:
+                        seen.add(line)
+                        await client.get(url.rsplit("/", 1)[0] + "/" + line)
+            await asyncio.sleep(HLS_TARGET_DURATION / 2)
+
+    enc = _children_cpu()
+    seg.ensure(CAM)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        tasks = [asyncio.create_task(viewer(client)) for _ in range(viewers)]
+        cpu = time.process_time()
+        await _publish(frames, seconds)
+        cpu = time.process_time() - cpu
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    while seg.running(CAM):  # idle timeout stops and reaps ffmpeg
+        await asyncio.sleep(0.1)
+    return cpu, _children_cpu() - enc
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--viewers", default="1,10,50")
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--ffmpeg", default=FFMPEG_BIN)
+    args = ap.parse_args()
+
+    frames = _frames()
+    print(f"{'mode':<6} {'viewers':>7} {'python s':>9} {'encoder s':>10} {'ms/viewer-s':>12}")
+    for viewers in (int(v) for v in args.viewers.split(",")):
+        for mode in ("mjpeg", "hls"):
+            if mode == "mjpeg":
+                py, enc = await bench_mjpeg(viewers, args.seconds, frames)
+            else:
+                py, enc = await bench_hls(viewers, args.seconds, frames, args.ffmpeg)
+            per = (py + enc) * 1000 / (viewers * args.seconds)
+            print(f"{mode:<6} {viewers:>7} {py:>9.2f} {enc:>10.2f} {per:>12.2f}")
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,156 @@
+# benchmarks/bench_sensor_storage.py
+"""
+Sensor storage: row per value (`sensor_readings`) vs compact hourly chunks
+(`sensor_chunks`, float32 values + int32 offsets).
+
+`--readings` values from `--devices` devices × two reading types at 1 Hz
+are written through `SensorStore.append` in time-ordered batches (as
+devices report), then read back:
+
+* series – one device/type over one day via `SensorStore.series`
+* scan   – the mean of every stored value (SQL `avg()` over rows; chunk
+  blobs decoded with NumPy)
+
+Reported per layout: write time, bytes on disk (table + indexes) per
+reading, both read times, and the on-disk size extrapolated to 100M
+readings.  Pass `--readings 100000000` with a PostgreSQL `--url` for the
+real thing; the default is a throw-away SQLite file.
+
+    python -m benchmarks.bench_sensor_storage --readings 2000000
+    python -m benchmarks.bench_sensor_storage --url postgresql+asyncpg://…/bench
+
+Needs the app environment (.env) for imports.  `devices`, `sensor_readings`
+and `sensor_chunks` are created in, and dropped from, the target database –
+point `--url` at a scratch database.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.core.database import Base
+from app.models import Device, SensorChunk, SensorReading
+from app.schemas import DeviceType
+from app.utils.sensor_store import SensorStore, unpack
+
+T0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+TYPES = ("ph", "tds")
+TARGET = 100_000_000
+
+
+def _batches(devices: int, readings: int, batch: int):
+    """Time-ordered batches of reading dicts, `batch` readings each."""
+    per_second = devices * len(TYPES)
+    rng = np.random.default_rng(0)
+    out = []
+    for second in range(readings // per_second):
+        ts = T0 + timedelta(seconds=second)
+        noise = rng.normal(0, 0.05, per_second)
+        for d in range(devices):
+            for k, reading_type in enumerate(TYPES):
+                out.append({
+                    "device_id": f"bench-{d}", "reading_type": reading_type,
+                    "value": (6.0 if k == 0 else 800.0) + float(noise[d * len(TYPES) + k]),
+                    "timestamp": ts, "location": f"bay-{d % 10}",
+                })
+        if len(out) >= batch:
+            yield out
+            out = []
+    if out:
+        yield out
+
+
+async def _size(conn, table: str, path: str | None) -> int:
+    if conn.dialect.name == "postgresql":
+        return await conn.scalar(text(f"SELECT pg_total_relation_size('{table}')"))
+    await conn.execute(text("VACUUM"))
+    return os.path.getsize(path)
+
+
+async def _scan(session: AsyncSession, mode: str) -> float:
+    if mode == "rows":
+        return float(await session.scalar(select(func.avg(SensorReading.value))))
+    total, n = 0.0, 0
+    result = await session.stream(select(SensorChunk.hour, SensorChunk.offsets, SensorChunk.samples))
+    async for hour, offsets, samples in result:
+        _, values = unpack(hour, offsets, samples)
+        total += float(values.sum(dtype=np.float64))
+        n += len(values)
+    return total / n
+
+
+async def run_layout(mode: str, url: str, args) -> dict:
+    path = None
+    if url.startswith("sqlite"):
+        path = os.path.join(tempfile.mkdtemp(prefix="bench-sensors-"), f"{mode}.db")
+        url = f"sqlite+aiosqlite:///{path}"
+    engine = create_async_engine(url)
+    tables = [Device.__table__, SensorReading.__table__, SensorChunk.__table__]
+    table = "sensor_readings" if mode == "rows" else "sensor_chunks"
+    store = SensorStore(mode)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all, tables=tables)
+            await conn.run_sync(Base.metadata.create_all, tables=tables)
+            await conn.execute(insert(Device.__table__), [
+                {"id": f"bench-{d}", "mac_id": f"bench-{d}", "name": f"bench {d}",
+                 "type": DeviceType.PH_TDS_SENSOR, "http_endpoint": "http://bench", "is_active": True}
+                for d in range(args.devices)
+            ])
+
+        written = 0
+        start = time.perf_counter()
+        async with AsyncSession(engine) as session:
+            for batch in _batches(args.devices, args.readings, args.batch):
+                written += await store.append(session, batch)
+                await session.commit()
+        write_s = time.perf_counter() - start
+
+        async with engine.connect() as conn:
+            size = await _size(conn, table, path)
+
+        async with AsyncSession(engine) as session:
+            start = time.perf_counter()
+            ts, _ = await store.series(session, "bench-0", "ph", T0, T0 + timedelta(days=1))
+            series_s = time.perf_counter() - start
+            start = time.perf_counter()
+            mean = await _scan(session, mode)
+            scan_s = time.perf_counter() - start
+        return {
+            "mode": mode, "readings": written, "write_s": write_s, "bytes": size,
+            "series_points": len(ts), "series_s": series_s, "scan_s": scan_s, "mean": mean,
+        }
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all, tables=tables)
+        await engine.dispose()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--readings", type=int, default=1_000_000)
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=20_000)
+    parser.add_argument("--url", default="sqlite", help="SQLAlchemy async URL (default: temp SQLite file)")
+    args = parser.parse_args()
+
+    print(f"{'layout':<7}{'readings':>12}{'write s':>9}{'B/reading':>11}{'series s':>10}"
+          f"{'scan s':>9}{'@100M GB':>10}")
+    for mode in ("rows", "chunks"):
+        r = await run_layout(mode, args.url, args)
+        per = r["bytes"] / r["readings"]
+        print(f"{mode:<7}{r['readings']:>12,}{r['write_s']:>9.1f}{per:>11.1f}{r['series_s']:>10.3f}"
+              f"{r['scan_s']:>9.3f}{per * TARGET / 1e9:>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,36 @@
 # example: gunicorn_conf.py
 import multiprocessing
+import os
 
 workers = multiprocessing.cpu_count() * 2 + 1
 worker_class = "uvicorn.workers.UvicornWorker"
 timeout = 30
+
+# One detection service for all workers (model loaded once, batching across
+# workers). Set before anything imports app.core.config; export
+# CAM_DETECTION_SOCKET="" to fall back to a detection pool per worker.
+os.environ.setdefault("CAM_DETECTION_SOCKET", "/tmp/hydroleaf-detect.sock")
+
+
+def on_starting(server):
+    if os.environ["CAM_DETECTION_SOCKET"]:
+        from app.core import config
+        from app.utils.detection_service import ServiceSupervisor
+
+        # the spawned service gets its settings from here, not from app.core.config
+        server.detection_service = ServiceSupervisor(
+            config.CAM_DETECTION_SOCKET,
+            {
+                "workers": config.CAM_DETECTION_WORKERS,
+                "slot_bytes": config.CAM_MAX_FRAME_BYTES,
+                "batch_size": config.CAM_DETECT_BATCH_SIZE,
+                "batch_wait_ms": config.CAM_DETECT_BATCH_WAIT_MS,
+            },
+        )
+        server.detection_service.start()
+
+
+def on_exit(server):
+    supervisor = getattr(server, "detection_service", None)
+    if supervisor is not None:
+        supervisor.stop()
@@ -0,0 +1,55 @@
+# tests/test_camera_queue.py
+"""
+Detection scheduler: one pending frame per camera (newest wins), bounded
+by camera count, served round-robin with one frame in flight per camera.
+"""
+
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from app.utils.camera_queue import CameraQueue
+
+
+@pytest.mark.asyncio
+async def test_newer_frame_replaces_pending_one():
+    q = CameraQueue(max_cameras=4)
+    for i in range(5):
+        q.enqueue("cam", Path(f"{i}.jpg"), bytes([i]))
+
+    assert len(q) == 1 and q.coalesced == 4
+    camera_id, path, data, _ = await q._next()
+    assert (camera_id, path, data) == ("cam", Path("4.jpg"), b"\x04")
+
+
+@pytest.mark.asyncio
+async def test_round_robin_and_one_in_flight_per_camera():
+    q = CameraQueue(max_cameras=4)
+    q.enqueue("chatty", Path("a1.jpg"))
+    q.enqueue("quiet", Path("b1.jpg"))
+
+    first = await q._next()
+    q.enqueue("chatty", Path("a2.jpg"))  # arrives while a1 is still in detection
+    second = await q._next()
+    assert [first[0], second[0]] == ["chatty", "quiet"]
+
+    # chatty's newer frame waits until its in-flight frame is done
+    waiter = asyncio.create_task(q._next())
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    q._done("chatty")
+    camera_id, path, _, _ = await asyncio.wait_for(waiter, 1)
+    assert (camera_id, path) == ("chatty", Path("a2.jpg"))
+
+
+def test_queue_is_bounded_by_camera_count():
+    q = CameraQueue(max_cameras=2)
+    assert q.enqueue("a", Path("a.jpg"))
+    assert q.enqueue("b", Path("b.jpg"))
+    assert not q.enqueue("c", Path("c.jpg"))
+    assert q.enqueue("a", Path("a2.jpg"))  # replacing never needs room
+
+    assert len(q) == 2
+    assert q.stats()["rejected"] == 1
+    assert q.dropped_by_camera == {"c": 1, "a": 1}
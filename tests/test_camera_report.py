@@ -0,0 +1,165 @@
+# tests/test_camera_report.py
+"""
+Camera report: gaps-and-islands over detection events in SQL (PostgreSQL and
+SQLite), filters, keyset paging and a streamed body.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.database import Base
+from app.models import Camera, DetectionEvent
+from app.utils import detection_report
+
+T0 = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _events(camera_id: str) -> list[dict]:
+    # leaf: 0–1s and 1–2s (overlapping, e.g. two workers) form one island,
+    # then 10–11s; pest: 1s and 30s (two islands)
+    rows = [("leaf", 0, 1, 2, 0.5), ("leaf", 1, 2, 1, 0.7), ("pest", 1, 1, 1, 0.6),
+            ("leaf", 10, 11, 2, 0.9), ("pest", 30, 30, 1, 0.4)]
+    return [
+        {"id": f"{camera_id}-{i}", "camera_id": camera_id, "object_name": name,
+         "start_time": T0 + timedelta(seconds=start), "end_time": T0 + timedelta(seconds=end),
+         "count": count, "max_confidence": conf}
+        for i, (name, start, end, count, conf) in enumerate(rows)
+    ]
+
+
+EXPECTED = [
+    ("leaf", 0, 2, 3),
+    ("pest", 1, 1, 1),
+    ("leaf", 10, 11, 2),
+    ("pest", 30, 30, 1),
+]
+
+
+def _shape(items):
+    return [
+        (d["object_name"],
+         int((datetime.fromisoformat(d["start_time"]) - T0).total_seconds()),
+         int((datetime.fromisoformat(d["end_time"]) - T0).total_seconds()),
+         d["detections"])
+        for d in items
+    ]
+
+
+@pytest.fixture
+async def report_camera():
+    async with detection_report.AsyncSessionLocal() as s:
+        s.add(Camera(id="rep_cam", name="report"))
+        await s.flush()
+        await s.execute(insert(DetectionEvent), _events("rep_cam"))
+        await s.commit()
+    return "rep_cam"
+
+
+@pytest.mark.asyncio
+async def test_report_groups_in_sql_and_pages(async_client: AsyncClient, report_camera):
+    url = f"/api/v1/cameras/report/{report_camera}"
+    r = await async_client.get(url)
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert _shape(body["detections"]) == EXPECTED
+    assert [d["max_confidence"] for d in body["detections"]] == [0.7, 0.6, 0.9, 0.4]
+    assert body["next_cursor"] is None
+
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        body = (await async_client.get(url, params=params)).json()
+        pages.append(_shape(body["detections"]))
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert pages == [EXPECTED[:3], EXPECTED[3:]]
+
+
+@pytest.mark.asyncio
+async def test_report_filters(async_client: AsyncClient, report_camera):
+    url = f"/api/v1/cameras/report/{report_camera}"
+    body = (await async_client.get(url, params={"object_name": "pest"})).json()
+    assert _shape(body["detections"]) == [EXPECTED[1], EXPECTED[3]]
+
+    window = {"start": (T0 + timedelta(seconds=5)).isoformat(),
+              "end": (T0 + timedelta(seconds=20)).isoformat()}
+    body = (await async_client.get(url, params=window)).json()
+    assert _shape(body["detections"]) == [EXPECTED[2]]
+
+    r = await async_client.get(url, params={"cursor": "not-a-cursor"})
+    assert r.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_islands_query_on_sqlite(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'report.db'}")
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(
+                Base.metadata.create_all, tables=[Camera.__table__, DetectionEvent.__table__]
+            )
+            await conn.execute(insert(Camera.__table__), [{"id": "cam", "name": "c"}])
+            await conn.execute(insert(DetectionEvent.__table__), _events("cam"))
+
+            rows = (await conn.execute(detection_report.islands_query("sqlite", "cam", gap_seconds=2))).all()
+            got = [(n, int((s.replace(tzinfo=timezone.utc) - T0).total_seconds()),
+                    int((e.replace(tzinfo=timezone.utc) - T0).total_seconds()), c)
+                   for n, s, e, c, _ in rows]
+            assert got == EXPECTED
+
+            after = (rows[1].start_time, rows[1].object_name)
+            rest = await conn.execute(
+                detection_report.islands_query("sqlite", "cam", gap_seconds=2, after=after)
+            )
+            assert [r.object_name for r in rest] == ["leaf", "pest"]
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_later_pages_do_not_read_the_history_before_the_cursor(tmp_path):
+    # 60 leaf islands 10s apart, the last one joined by an event that overlaps it
+    events = [
+        {"id": f"e{i}", "camera_id": "cam", "object_name": "leaf",
+         "start_time": T0 + timedelta(seconds=10 * i), "end_time": T0 + timedelta(seconds=10 * i + 1),
+         "count": 1, "max_confidence": 0.5}
+        for i in range(60)
+    ]
+    events.append({**events[-1], "id": "e-late", "start_time": events[-1]["end_time"], "count": 2})
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'pages.db'}")
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(
+                Base.metadata.create_all, tables=[Camera.__table__, DetectionEvent.__table__]
+            )
+            await conn.execute(insert(Camera.__table__), [{"id": "cam", "name": "c"}])
+            await conn.execute(insert(DetectionEvent.__table__), events)
+
+            everything = (await conn.execute(
+                detection_report.islands_query("sqlite", "cam", gap_seconds=2, limit=100)
+            )).all()
+            pages, read, after = [], [], None
+            while True:
+                page = (await conn.execute(
+                    detection_report.islands_query("sqlite", "cam", gap_seconds=2, limit=10, after=after)
+                )).all()
+                if not page:
+                    break
+                pages.extend(page)
+                after = (page[-1].start_time, page[-1].object_name)
+                conds = detection_report._event_filter(
+                    "cam", start=None, end=None, object_name=None, after=after, gap_seconds=2
+                )
+                read.append(await conn.scalar(select(func.count()).select_from(DetectionEvent.__table__).where(*conds)))
+    finally:
+        await engine.dispose()
+
+    assert [tuple(r) for r in pages] == [tuple(r) for r in everything]
+    assert everything[-1].detections == 3
+    # rows read after each page: only the tail from the cursor on, never the history
+    assert read == [61 - 10 * k + 1 for k in range(1, 6)] + [2]
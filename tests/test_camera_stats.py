@@ -0,0 +1,77 @@
+# tests/test_camera_stats.py
+"""
+Write-behind camera counters: many frames, one UPDATE … FROM (VALUES …) for
+all cameras, and `cam_status` still sees what has not been flushed.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event
+
+from app.models import Camera
+from app.utils import camera_stats as stats_mod
+from app.utils.camera_stats import CameraStats
+
+T0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_all_cameras_in_one_update():
+    Session = stats_mod.AsyncSessionLocal
+    engine = Session.kw["bind"]
+    async with Session() as s:
+        s.add_all([
+            Camera(id="st_a", name="a", frames_received=5, last_seen=T0 + timedelta(hours=1)),
+            Camera(id="st_b", name="b"),
+        ])
+        await s.commit()
+
+    stats = CameraStats()
+    for i in range(100):
+        stats.add("st_a", frames=1, seen=T0 + timedelta(seconds=i))
+    stats.add("st_b", frames=2, nbytes=3 * 1024 ** 2, seen=T0)
+    stats.add("st_b", clips=1, clip_time=T0)
+    stats.add("st_b", nbytes=-1024 ** 2)
+
+    statements = []
+    listener = lambda *a, **k: statements.append(a[2])  # noqa: E731
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        assert await stats.flush() == 2
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+
+    updates = [q for q in statements if q.lstrip().upper().startswith("UPDATE")]
+    assert len(updates) == 1 and "VALUES" in updates[0].upper()
+    assert len(stats) == 0 and await stats.flush() == 0
+
+    async with Session() as s:
+        a = await s.get(Camera, "st_a")
+        b = await s.get(Camera, "st_b")
+        assert a.frames_received == 105
+        assert a.last_seen == T0 + timedelta(hours=1)  # never moves backwards
+        assert (b.frames_received, b.clips_count) == (2, 1)
+        assert b.storage_used == pytest.approx(2.0)
+        assert b.last_seen == T0 and b.last_clip_time == T0
+
+
+@pytest.mark.asyncio
+async def test_cam_status_merges_unflushed_delta(async_client: AsyncClient, monkeypatch):
+    from app.routers import cameras
+
+    async with stats_mod.AsyncSessionLocal() as s:
+        s.add(Camera(id="st_live", name="live", frames_received=10, last_seen=T0))
+        await s.commit()
+
+    stats = CameraStats()
+    monkeypatch.setattr(cameras, "camera_stats", stats)
+    seen = T0 + timedelta(minutes=5)
+    stats.add("st_live", frames=3, seen=seen)
+
+    r = await async_client.get("/api/v1/cameras/status/st_live")
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["frames_received"] == 13
+    assert datetime.fromisoformat(body["last_seen"]) == seen
@@ -0,0 +1,94 @@
+# tests/test_camera_stream.py
+"""
+still / stream?mode=poll are served from the in-memory latest-frame store
+with ETag / If-None-Match support.
+"""
+
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from app.main import app
+from app.dependencies import verify_camera_token
+from app.utils.frame_store import PROCESSED, frame_store
+
+JPEG = b"\xff\xd8" + b"\x01" * 512 + b"\xff\xd9"
+
+
+@pytest.fixture(autouse=True)
+def _camera_env(tmp_path, monkeypatch):
+    from app.routers import cameras
+    monkeypatch.setattr(cameras, "DATA_ROOT", str(tmp_path))
+    app.dependency_overrides[verify_camera_token] = lambda camera_id: camera_id
+    yield
+    app.dependency_overrides.pop(verify_camera_token, None)
+    frame_store.forget("cam-s")
+
+
+@pytest.mark.asyncio
+async def test_still_serves_latest_upload_with_etag(async_client: AsyncClient):
+    r = await async_client.post("/api/v1/cameras/upload/cam-s/day", content=JPEG)
+    assert r.status_code == 200, r.text
+
+    r = await async_client.get("/api/v1/cameras/still/cam-s")
+    assert r.status_code == 200
+    assert r.content == JPEG
+    etag = r.headers["etag"]
+
+    r = await async_client.get("/api/v1/cameras/still/cam-s", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.content == b""
+
+    r = await async_client.get(
+        "/api/v1/cameras/stream/cam-s", params={"mode": "poll"}, headers={"If-None-Match": etag}
+    )
+    assert r.status_code == 304
+
+
+@pytest.mark.asyncio
+async def test_still_prefers_processed_frame(async_client: AsyncClient):
+    await async_client.post("/api/v1/cameras/upload/cam-s/day", content=JPEG)
+    annotated = b"\xff\xd8annotated\xff\xd9"
+    frame_store.put("cam-s", annotated, PROCESSED)
+
+    r = await async_client.get("/api/v1/cameras/stream/cam-s", params={"mode": "poll"})
+    assert r.status_code == 200
+    assert r.content == annotated
+
+
+@pytest.mark.asyncio
+async def test_still_falls_back_to_latest_on_disk(async_client: AsyncClient, tmp_path):
+    # frame written by another worker: only latest.jpg exists on disk
+    (tmp_path / "cam-s").mkdir()
+    (tmp_path / "cam-s" / "latest.jpg").write_bytes(JPEG)
+
+    r = await async_client.get("/api/v1/cameras/still/cam-s")
+    assert r.status_code == 200
+    assert r.content == JPEG
+
+
+@pytest.mark.asyncio
+async def test_stream_unknown_camera_404(async_client: AsyncClient):
+    r = await async_client.get("/api/v1/cameras/stream/nope", params={"mode": "poll"})
+    assert r.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_mjpeg_is_pushed_by_uploads(async_client: AsyncClient):
+    from app.routers import cameras
+    from app.utils.frame_hub import frame_hub
+
+    await async_client.post("/api/v1/cameras/upload/cam-s/day", content=JPEG)
+    # httpx' ASGI transport buffers whole bodies, so drive the generator directly
+    resp = await cameras.stream("cam-s", None, mode="mjpeg")
+    parts = resp.body_iterator
+    assert JPEG in await parts.__anext__()
+    assert frame_hub.viewers("cam-s") == 1
+
+    second = b"\xff\xd8second\xff\xd9"
+    await async_client.post("/api/v1/cameras/upload/cam-s/day", content=second)
+    assert second in await asyncio.wait_for(parts.__anext__(), 2)
+
+    await parts.aclose()
+    assert frame_hub.viewers("cam-s") == 0
@@ -4,6 +4,7 @@ Quick sanity-check that the camera_tasks pipeline
 
 • moves raw → processed
 • starts (or appends to) a clip writer
+• persists a batch with one bulk insert and one commit
 """
 
 import asyncio
@@ -45,11 +46,12 @@ async def test_encode_and_cleanup_creates_processed_and_clip(tmp_path, monkeypat
     raw_dir.mkdir(parents=True, exist_ok=True)          # in case helper skipped it
     cv2.imwrite(str(raw_path), img)
 
-    # Skip YOLO – make _annotate() a cheap no-op that returns zero detections
-    monkeypatch.setattr(camera_tasks, "_annotate", lambda x: (x, []))
+    # Skip YOLO – make _annotate_batch() a cheap no-op that returns zero detections
+    monkeypatch.setattr(camera_tasks, "_annotate_batch", lambda xs: [(x, []) for x in xs])
 
     # ── run the pipeline ────────────────────────────────────────────────────
     await camera_tasks.encode_and_cleanup(cam_id)
+    camera_tasks.clip_writer.flush(cam_id)  # clips are encoded on writer threads
 
     # ── assertions ─────────────────────────────────────────────────────────
     # processed JPEG present
@@ -62,3 +64,60 @@ async def test_encode_and_cleanup_creates_processed_and_clip(tmp_path, monkeypat
 
     # raw frame should be gone
     assert not raw_path.exists(), "raw frame should have been deleted"
+
+
+@pytest.mark.asyncio
+async def test_encode_and_cleanup_batches_db_round_trips(monkeypatch):
+    from sqlalchemy import event, select
+
+    from app.models import Camera, DetectionEvent
+    from app.utils import camera_tasks, detection_events
+    from app.utils.detection_events import DetectionEventBuilder
+
+    AsyncSessionLocal = detection_events.AsyncSessionLocal  # the test-DB sessionmaker
+    engine = AsyncSessionLocal.kw["bind"]
+
+    cam_id = "cam_batch"
+    async with AsyncSessionLocal() as s:
+        s.add(Camera(id=cam_id, name="batch"))
+        await s.commit()
+
+    raw_dir, _, _ = camera_tasks._ensure_dirs(cam_id)
+    img = np.zeros((120, 160, 3), dtype=np.uint8)
+    for i in range(6):
+        cv2.imwrite(str(raw_dir / f"{1700000000000 + i}.jpg"), img)
+
+    dets = [{"name": "leaf", "conf": 0.9, "bbox": (0, 0, 10, 10)},
+            {"name": "pest", "conf": 0.8, "bbox": (5, 5, 20, 20)}]
+    calls = []
+
+    def _fake_batch(xs):
+        calls.append(len(xs))
+        return [(x, dets) for x in xs]
+
+    monkeypatch.setattr(camera_tasks, "_annotate_batch", _fake_batch)
+    monkeypatch.setattr(camera_tasks, "_call_disease_model", lambda p: asyncio.sleep(0))
+    monkeypatch.setattr(camera_tasks, "event_builder", DetectionEventBuilder(gap_seconds=2))
+
+    statements = []
+    listener = lambda *a, **k: statements.append(a[2])  # noqa: E731
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        await camera_tasks.encode_and_cleanup(cam_id)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+
+    assert calls == [6]  # one detector call for the whole batch
+    inserts = [q for q in statements if q.lstrip().upper().startswith("INSERT")]
+    updates = [q for q in statements if q.lstrip().upper().startswith("UPDATE")]
+    assert len(inserts) == 1 and not updates  # one event upsert; counters are write-behind
+
+    async with AsyncSessionLocal() as s:
+        rows = (await s.execute(
+            select(DetectionEvent.object_name, DetectionEvent.count, DetectionEvent.max_confidence)
+            .where(DetectionEvent.camera_id == cam_id)
+            .order_by(DetectionEvent.object_name)
+        )).all()
+        # 12 detections over 6 frames 1ms apart → one event per class
+        assert [tuple(r) for r in rows] == [("leaf", 6, 0.9), ("pest", 6, 0.8)]
+        assert not list(raw_dir.glob("*.jpg"))
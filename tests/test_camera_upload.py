@@ -0,0 +1,100 @@
+# tests/test_camera_upload.py
+"""
+Streaming frame ingest for /cameras/upload:
+
+• body is spooled to disk and published as raw/<ts>.jpg + latest.jpg
+• published frames get the umask-derived mode, not mkstemp's 0600
+• oversized / non-JPEG bodies are rejected without leaving temp files
+"""
+
+import os
+import stat
+
+import pytest
+from httpx import AsyncClient
+
+from app.main import app
+from app.dependencies import verify_camera_token
+
+JPEG = b"\xff\xd8" + b"\x00" * 2048 + b"\xff\xd9"
+
+
+@pytest.fixture(autouse=True)
+def _camera_env(tmp_path, monkeypatch):
+    from app.routers import cameras
+    monkeypatch.setattr(cameras, "DATA_ROOT", str(tmp_path))
+    app.dependency_overrides[verify_camera_token] = lambda camera_id: camera_id
+    yield
+    app.dependency_overrides.pop(verify_camera_token, None)
+
+
+@pytest.mark.asyncio
+async def test_upload_streams_to_raw_and_latest(async_client: AsyncClient, tmp_path):
+    r = await async_client.post(
+        "/api/v1/cameras/upload/cam1/day",
+        content=JPEG,
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["ok"] is True and body["mode"] == "day"
+    assert "total;dur=" in r.headers["server-timing"]
+
+    raw_file = tmp_path / "cam1" / "raw" / f"{body['ts']}.jpg"
+    latest = tmp_path / "cam1" / "latest.jpg"
+    assert raw_file.read_bytes() == JPEG
+    assert latest.read_bytes() == JPEG
+    # no temp spool files left behind
+    assert not [p for p in os.listdir(raw_file.parent) if p.endswith(".part")]
+
+
+def test_spool_is_published_with_the_umask_mode(tmp_path):
+    from app.routers import cameras
+
+    fd, tmp_name = cameras._open_spool(tmp_path / "raw")
+    for chunk in (JPEG[:1000], JPEG[1000:]):
+        cameras._spool_write(fd, chunk)
+    raw_file, data = cameras._spool_commit(fd, tmp_name, tmp_path / "raw", tmp_path, 1, len(JPEG))
+
+    umask = os.umask(0)
+    os.umask(umask)
+    assert data == JPEG and raw_file.read_bytes() == JPEG
+    for path in (raw_file, tmp_path / "latest.jpg"):
+        assert stat.S_IMODE(path.stat().st_mode) == 0o666 & ~umask
+
+
+@pytest.mark.asyncio
+async def test_upload_queues_raw_frame_for_detection(async_client: AsyncClient, monkeypatch):
+    from app.routers import cameras
+    from app.utils.camera_queue import CameraQueue
+
+    queue = CameraQueue()
+    monkeypatch.setattr(cameras, "camera_queue", queue)
+    r = await async_client.post("/api/v1/cameras/upload/cam1/day", content=JPEG)
+    assert r.status_code == 200, r.text
+
+    camera_id, path, data, _ = await queue._next()
+    # the immutable raw/<ts>.jpg, not latest.jpg which the next upload replaces
+    assert (camera_id, path.name, data) == ("cam1", f"{r.json()['ts']}.jpg", JPEG)
+
+
+@pytest.mark.asyncio
+async def test_upload_rejects_oversized_frame(async_client: AsyncClient, tmp_path, monkeypatch):
+    from app.routers import cameras
+    monkeypatch.setattr(cameras, "CAM_MAX_FRAME_BYTES", 1024)
+
+    r = await async_client.post("/api/v1/cameras/upload/cam1/night", content=JPEG)
+    assert r.status_code == 413
+    assert not (tmp_path / "cam1" / "latest.jpg").exists()
+
+
+@pytest.mark.asyncio
+async def test_upload_rejects_non_jpeg(async_client: AsyncClient, tmp_path):
+    r = await async_client.post(
+        "/api/v1/cameras/upload/cam1/day",
+        content=b"not a jpeg",
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    assert r.status_code == 415
+    raw_dir = tmp_path / "cam1" / "raw"
+    assert not raw_dir.exists() or not list(raw_dir.iterdir())
@@ -0,0 +1,92 @@
+# tests/test_clip_writer.py
+"""
+Clip-writer service: encoding on worker threads, bounded per-camera queues,
+LRU cap on open writers, idle eviction and a flushing shutdown.
+"""
+
+import time
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from app.utils.camera_stats import CameraStats
+from app.utils.clip_writer import ClipWriterService
+
+FRAME = np.zeros((48, 64, 3), dtype=np.uint8)
+
+
+@pytest.fixture
+def service():
+    svc = ClipWriterService(threads=2, queue_size=4, max_open=2, idle_seconds=60, stats=CameraStats())
+    yield svc
+    svc.shutdown()
+
+
+def _wait(pred, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not pred():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def test_frames_are_written_off_thread_and_counted(service, tmp_path):
+    for _ in range(3):
+        service.submit("cam", FRAME, tmp_path / "cam")
+    service.flush("cam")
+
+    assert len(list((tmp_path / "cam").glob("*.mp4"))) == 1
+    assert service.stats.pending("cam").clips == 1
+
+
+def test_rotation_starts_a_new_clip(tmp_path):
+    svc = ClipWriterService(threads=1, clip_duration=timedelta(0), stats=CameraStats())
+    try:
+        svc.submit("cam", FRAME, tmp_path)
+        svc.flush("cam")
+        time.sleep(0.002)  # clip names are millisecond timestamps
+        svc.submit("cam", FRAME, tmp_path)
+        svc.flush("cam")
+        assert svc.stats.pending("cam").clips == 2
+    finally:
+        svc.shutdown()
+
+
+def test_lru_caps_open_writers(service, tmp_path):
+    for cam in ("a", "b", "c"):
+        service.submit(cam, FRAME, tmp_path / cam)
+        service.flush(cam)
+    _wait(lambda: service.open_writers() == 2)
+    assert "a" not in service._open
+
+
+def test_idle_writers_are_closed_and_forgotten(service, tmp_path):
+    service.submit("cam", FRAME, tmp_path)
+    service.flush("cam")
+    assert service.open_writers() == 1
+
+    service.idle_seconds = 0
+    _wait(lambda: service.sweep_idle() or not service._cameras)
+    assert service.open_writers() == 0 and not service._cameras
+
+
+def test_full_queue_drops_oldest(tmp_path):
+    svc = ClipWriterService(threads=1, queue_size=2)
+    try:
+        svc.submit("cam", FRAME, tmp_path)
+        # hold the camera lock so nothing drains while we overfill the queue
+        state = svc._cameras["cam"]
+        with state.lock:
+            for _ in range(5):
+                svc.submit("cam", FRAME, tmp_path)
+            assert len(state.frames) <= 2 and state.dropped >= 3
+    finally:
+        svc.shutdown()
+
+
+def test_shutdown_flushes_queued_frames(tmp_path):
+    svc = ClipWriterService(threads=1)
+    svc.submit("cam", FRAME, tmp_path)
+    svc.shutdown()
+    clips = list(tmp_path.glob("*.mp4"))
+    assert len(clips) == 1 and clips[0].stat().st_size > 0
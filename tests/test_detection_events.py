@@ -0,0 +1,148 @@
+# tests/test_detection_events.py
+"""
+Ingest-time detection events: open events stretch within the gap, a longer
+gap closes them, and every flush is one upsert of what changed.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event, select
+
+from app.models import Camera, DetectionEvent, DetectionRecord, Rollup, RollupWatermark
+from app.utils import detection_events
+from app.utils.detection_events import DetectionEventBuilder
+
+T0 = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _at(seconds: float) -> datetime:
+    return T0 + timedelta(seconds=seconds)
+
+
+def test_events_extend_within_the_gap_and_close_after_it():
+    builder = DetectionEventBuilder(gap_seconds=2)
+    leaf = {"name": "leaf", "conf": 0.4}
+    builder.observe("cam", [leaf, {"name": "leaf", "conf": 0.8}], _at(0))
+    builder.observe("cam", [leaf, {"name": "pest", "conf": 0.3}], _at(1.5))
+    builder.observe("cam", [leaf], _at(3))
+    builder.observe("cam", [leaf], _at(6))  # gap of 3s: a new leaf event
+
+    (closed,) = builder._closed
+    assert (closed.object_name, closed.start_time, closed.end_time) == ("leaf", _at(0), _at(3))
+    assert (closed.count, closed.max_confidence) == (4, 0.8)
+    assert sorted((e.object_name, e.count) for e in builder.open_events("cam")) == [("leaf", 1), ("pest", 1)]
+
+    assert builder.close_idle(_at(7)) == 1  # pest idle since 1.5s
+    assert [e.object_name for e in builder.open_events()] == ["leaf"]
+
+
+@pytest.mark.asyncio
+async def test_flush_upserts_changed_events_in_one_statement():
+    Session = detection_events.AsyncSessionLocal
+    engine = Session.kw["bind"]
+    async with Session() as s:
+        s.add(Camera(id="ev_cam", name="events"))
+        await s.commit()
+
+    builder = DetectionEventBuilder(gap_seconds=2)
+    now = datetime.now(timezone.utc)
+    builder.observe("ev_cam", [{"name": "leaf", "conf": 0.5}], now)
+    assert await builder.flush(now) == 1
+
+    builder.observe("ev_cam", [{"name": "leaf", "conf": 0.9}], now + timedelta(seconds=1))
+    builder.observe("ev_cam", [{"name": "pest", "conf": 0.2}], now + timedelta(seconds=1))
+    statements = []
+    listener = lambda *a, **k: statements.append(a[2])  # noqa: E731
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        assert await builder.flush(now + timedelta(seconds=1)) == 2
+        assert await builder.flush(now + timedelta(seconds=1)) == 0  # nothing changed
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+    assert len([q for q in statements if q.lstrip().upper().startswith("INSERT")]) == 1
+
+    async with Session() as s:
+        rows = (await s.execute(
+            select(DetectionEvent.object_name, DetectionEvent.count, DetectionEvent.max_confidence)
+            .where(DetectionEvent.camera_id == "ev_cam")
+            .order_by(DetectionEvent.object_name)
+        )).all()
+    assert [tuple(r) for r in rows] == [("leaf", 2, 0.9), ("pest", 1, 0.2)]
+
+
+@pytest.mark.asyncio
+async def test_flush_drops_events_of_unregistered_cameras():
+    Session = detection_events.AsyncSessionLocal
+    async with Session() as s:
+        s.add(Camera(id="ev_known", name="known"))
+        await s.commit()
+
+    builder = DetectionEventBuilder(gap_seconds=2)
+    now = datetime.now(timezone.utc)
+    builder.observe("ev_known", [{"name": "leaf"}], now)
+    builder.observe("token_only_cam", [{"name": "leaf"}], now)  # CameraToken, no Camera row
+    for _ in range(3):
+        await builder.flush(now)  # must not raise
+    assert [e.camera_id for e in builder.open_events()] == ["ev_known"]
+    assert builder._closed == []
+
+    async with Session() as s:
+        cams = (await s.scalars(select(DetectionEvent.camera_id))).all()
+    assert "ev_known" in cams and "token_only_cam" not in cams
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_requeues_a_bounded_backlog(monkeypatch):
+    class _Down:
+        async def __aenter__(self):
+            raise ConnectionError("db down")
+
+        async def __aexit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(detection_events, "AsyncSessionLocal", lambda: _Down())
+    monkeypatch.setattr(detection_events, "MAX_BACKLOG", 3)
+    builder = DetectionEventBuilder(gap_seconds=2)
+    for i in range(5):
+        builder.observe("cam", [{"name": "leaf"}], _at(10 * i))
+    with pytest.raises(ConnectionError):
+        await builder.flush(_at(100))
+    assert [e.start_time for e in builder._closed] == [_at(20), _at(30), _at(40)]
+
+
+@pytest.mark.asyncio
+async def test_backfill_turns_detection_records_into_events():
+    Session = detection_events.AsyncSessionLocal
+    async with Session() as s:
+        s.add(Camera(id="bf_cam", name="backfill"))
+        await s.flush()
+        # leaf at 0, 1, 2s (one island) and 10s; pest at 1s
+        for name, sec in [("leaf", 0), ("leaf", 1), ("leaf", 2), ("leaf", 10), ("pest", 1)]:
+            s.add(DetectionRecord(camera_id="bf_cam", object_name=name, timestamp=_at(sec)))
+        # rollups already folded past the backfilled events
+        await s.merge(RollupWatermark(series="detections", watermark=_at(3600)))
+        await s.merge(Rollup(series="detections", source_id="bf_cam", metric="leaf", resolution=60,
+                             bucket=_at(3000), count=1, total=0.5, min_value=0.5, max_value=0.5))
+        await s.commit()
+
+    assert await detection_events.backfill_records(_at(60)) == 3
+    assert await detection_events.backfill_records(_at(60)) == 0  # records are gone
+
+    async with Session() as s:
+        rows = (await s.execute(
+            select(DetectionEvent.object_name, DetectionEvent.start_time, DetectionEvent.end_time,
+                   DetectionEvent.count)
+            .where(DetectionEvent.camera_id == "bf_cam")
+            .order_by(DetectionEvent.start_time, DetectionEvent.object_name)
+        )).all()
+        left = (await s.scalars(select(DetectionRecord.id).where(DetectionRecord.camera_id == "bf_cam"))).all()
+    assert [tuple(r) for r in rows] == [
+        ("leaf", _at(0), _at(2), 3), ("pest", _at(1), _at(1), 1), ("leaf", _at(10), _at(10), 1),
+    ]
+    assert left == []
+
+    async with Session() as s:
+        # the rollups start over, so the next pass counts the backfilled events too
+        assert await s.scalar(select(RollupWatermark.watermark).where(RollupWatermark.series == "detections")) is None
+        assert (await s.scalars(select(Rollup.bucket).where(Rollup.series == "detections"))).all() == []
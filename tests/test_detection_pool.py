@@ -0,0 +1,149 @@
+# tests/test_detection_pool.py
+"""
+Detection runs in a spawned process pool; frames go in and annotated JPEGs
+come back through shared memory.
+"""
+
+import asyncio
+import os
+import signal
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+import pytest
+
+from app.utils.detection_pool import DetectionPool
+from app.utils.detectors import BaseDetector
+
+
+class _BoxDetector(BaseDetector):
+    def detect_and_annotate(self, img):
+        out = img.copy()
+        cv2.rectangle(out, (10, 10), (50, 50), (0, 255, 0), 2)
+        return out, [{"name": "leaf", "conf": 0.9, "bbox": (10, 10, 50, 50)}]
+
+
+class _BatchSizeDetector:
+    def detect_batch(self, imgs):
+        return [(img, [{"name": "leaf", "batch": len(imgs)}]) for img in imgs]
+
+
+class _DarkFrameCrashDetector(_BoxDetector):
+    def detect_and_annotate(self, img):
+        if img.mean() < 10:
+            os._exit(1)  # stands in for a segfault / OOM kill inside the runtime
+        return super().detect_and_annotate(img)
+
+
+def _box_detector_factory():
+    return _BoxDetector()
+
+
+def _dark_frame_crash_detector_factory():
+    return _DarkFrameCrashDetector()
+
+
+def _batch_size_detector_factory():
+    return _BatchSizeDetector()
+
+
+def _jpeg(w=160, h=120, level=128) -> bytes:
+    img = np.full((h, w, 3), level, dtype=np.uint8)
+    ok, buf = cv2.imencode(".jpg", img)
+    assert ok
+    return buf.tobytes()
+
+
+@pytest.fixture
+def pool():
+    p = DetectionPool(
+        workers=1, slot_bytes=256 * 1024, detector_factory=_box_detector_factory, batch_size=1
+    )
+    p.start()
+    yield p
+    p.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_pool_returns_annotated_frame_and_detections(pool):
+    annotated, dets = await pool.detect(_jpeg())
+
+    assert dets == [{"name": "leaf", "conf": 0.9, "bbox": (10, 10, 50, 50)}]
+    assert annotated[:2] == b"\xff\xd8"
+    img = cv2.imdecode(np.frombuffer(annotated, np.uint8), cv2.IMREAD_COLOR)
+    assert img.shape == (120, 160, 3)
+
+    stats = pool.stats()
+    assert stats["frames"] == 1 and stats["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_pool_skips_undecodable_frames(pool):
+    annotated, dets = await pool.detect(b"\xff\xd8garbage")
+    assert annotated is None and dets == []
+
+
+@pytest.mark.asyncio
+async def test_pool_rejects_frames_larger_than_slot(pool):
+    with pytest.raises(ValueError):
+        await pool.detect(b"\x00" * (pool.slot_bytes + 1))
+
+
+@pytest.mark.asyncio
+async def test_concurrent_frames_share_one_batched_call():
+    p = DetectionPool(
+        workers=1, slot_bytes=256 * 1024, detector_factory=_batch_size_detector_factory,
+        batch_size=4, batch_wait_ms=5000,
+    )
+    p.start()
+    try:
+        results = await asyncio.gather(*(p.detect(_jpeg()) for _ in range(4)))
+        assert [dets[0]["batch"] for _, dets in results] == [4, 4, 4, 4]
+        assert all(annotated[:2] == b"\xff\xd8" for annotated, _ in results)
+        assert p.stats()["batches"] == 1
+    finally:
+        p.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_partial_batch_is_flushed_after_max_wait():
+    p = DetectionPool(
+        workers=1, slot_bytes=256 * 1024, detector_factory=_batch_size_detector_factory,
+        batch_size=8, batch_wait_ms=10,
+    )
+    p.start()
+    try:
+        results = await asyncio.wait_for(asyncio.gather(p.detect(_jpeg()), p.detect(_jpeg())), 30)
+        assert [dets[0]["batch"] for _, dets in results] == [2, 2]
+    finally:
+        p.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_pool_recovers_from_a_killed_worker(pool):
+    await pool.detect(_jpeg())
+    for proc in list(pool._executor._processes.values()):
+        os.kill(proc.pid, signal.SIGKILL)
+        proc.join(10)
+
+    annotated, dets = await asyncio.wait_for(pool.detect(_jpeg()), 60)
+    assert dets[0]["name"] == "leaf" and annotated[:2] == b"\xff\xd8"
+    assert pool.stats()["restarts"] == 1
+    assert len(pool._slots) == pool.capacity
+
+
+@pytest.mark.asyncio
+async def test_frame_that_keeps_killing_workers_fails_alone():
+    p = DetectionPool(
+        workers=1, slot_bytes=256 * 1024, detector_factory=_dark_frame_crash_detector_factory, batch_size=1,
+    )
+    p.start()
+    try:
+        with pytest.raises(BrokenProcessPool):
+            await asyncio.wait_for(p.detect(_jpeg(level=0)), 60)  # crashes, retried once, crashes again
+        annotated, dets = await asyncio.wait_for(p.detect(_jpeg()), 60)
+        assert dets[0]["name"] == "leaf"
+        assert p.stats()["restarts"] == 2
+    finally:
+        p.shutdown()
@@ -0,0 +1,137 @@
+# tests/test_detection_service.py
+"""
+Shared detection service: API workers reach one pool over a Unix socket.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.utils.detection_pool import DetectionPool
+from app.utils import detection_service
+from app.utils.detection_service import DetectionClient, DetectionServer, ServiceSupervisor
+from tests.test_detection_pool import _box_detector_factory, _jpeg
+
+
+def _pool() -> DetectionPool:
+    return DetectionPool(
+        workers=1, slot_bytes=256 * 1024, detector_factory=_box_detector_factory,
+        batch_size=4, batch_wait_ms=10,
+    )
+
+
+@pytest.fixture
+async def server(tmp_path):
+    srv = DetectionServer(str(tmp_path / "detect.sock"), _pool())
+    await srv.start()
+    yield srv
+    await srv.close()
+
+
+@pytest.mark.asyncio
+async def test_client_detects_through_service(server):
+    client = DetectionClient(server.path, timeout=30, capacity=4)
+    try:
+        results = await asyncio.gather(*(client.detect(_jpeg()) for _ in range(3)))
+        for annotated, dets in results:
+            assert annotated[:2] == b"\xff\xd8"
+            assert dets[0]["name"] == "leaf"
+        assert server.pool.frames == 3
+
+        health = await client.health()
+        assert health["ready"] is True and health["mode"] == "service"
+        assert health["clients"] == 1 and health["frames"] == 3
+    finally:
+        client.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_service_errors_are_raised_per_request(server):
+    client = DetectionClient(server.path, timeout=30, capacity=4)
+    try:
+        with pytest.raises(RuntimeError, match="exceeds detection slot"):
+            await client.detect(b"\x00" * (server.pool.slot_bytes + 1))
+        # the connection survives a failed request
+        annotated, dets = await client.detect(b"\xff\xd8garbage")
+        assert annotated is None and dets == []
+    finally:
+        client.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_health_reports_unreachable_service(tmp_path):
+    client = DetectionClient(str(tmp_path / "missing.sock"), timeout=1, capacity=4)
+    health = await client.health()
+    assert health["ready"] is False and "error" in health
+    with pytest.raises(OSError):
+        await client.detect(_jpeg())
+
+
+@pytest.mark.asyncio
+async def test_client_reconnects_after_service_restart(server):
+    client = DetectionClient(server.path, timeout=30, capacity=4)
+    try:
+        await client.detect(_jpeg())
+        await server.close()
+        await asyncio.sleep(0.05)  # the read loop notices the closed socket
+        assert not client.running
+
+        restarted = DetectionServer(server.path, _pool())
+        await restarted.start()
+        try:
+            annotated, dets = await client.detect(_jpeg())
+            assert annotated[:2] == b"\xff\xd8" and dets[0]["name"] == "leaf"
+            assert client.reconnects == 1
+        finally:
+            await restarted.close()
+    finally:
+        client.shutdown()
+
+
+class _FakeProcess:
+    def __init__(self):
+        self.alive = True
+        self.exitcode = None
+
+    def is_alive(self):
+        return self.alive
+
+    def terminate(self):
+        self.alive, self.exitcode = False, -15
+
+    def join(self, timeout=None):
+        pass
+
+
+def test_supervisor_restarts_exited_service(monkeypatch):
+    started = []
+
+    def fake_start(path, pool_options):
+        assert pool_options == {"workers": 1}
+        started.append(_FakeProcess())
+        return started[-1]
+
+    monkeypatch.setattr(detection_service, "start_process", fake_start)
+    supervisor = ServiceSupervisor("/tmp/x.sock", {"workers": 1}, backoff=0.01, poll=0.01)
+    supervisor.start()
+    try:
+        started[0].alive, started[0].exitcode = False, 1  # service crashed
+        deadline = time.monotonic() + 5
+        while supervisor.restarts < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert supervisor.restarts == 1 and supervisor.proc is started[1]
+    finally:
+        supervisor.stop()
+    assert not started[1].alive
+
+
+@pytest.mark.asyncio
+async def test_system_health_includes_detection(async_client, monkeypatch):
+    from app.main import app
+    monkeypatch.setattr(app.state, "start_time", time.time(), raising=False)  # startup hook skipped in tests
+    r = await async_client.get("/api/v1/health/system")
+    assert r.status_code == 200, r.text
+    detection = r.json()["detection"]
+    assert detection["mode"] in ("in-process", "service")
+    assert "ready" in detection
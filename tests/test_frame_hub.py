@@ -0,0 +1,93 @@
+# tests/test_frame_hub.py
+"""
+Broadcast hub: frames fan out by reference, slow viewers drop the oldest
+frame and are evicted once they stall for too long.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils import frame_hub as hub_mod
+from app.utils.frame_hub import FrameHub
+from app.utils.frame_store import PROCESSED, FrameStore
+
+
+@pytest.fixture
+def store():
+    return FrameStore()
+
+
+@pytest.mark.asyncio
+async def test_publish_fans_out_same_frame_object(store):
+    hub = FrameHub(queue_size=2)
+    subs = [hub.subscribe("cam") for _ in range(50)]
+
+    frame = store.put("cam", b"\xff\xd8abc\xff\xd9")
+    assert hub.publish(frame) == 50
+
+    received = await asyncio.gather(*(s.get() for s in subs))
+    assert all(f is frame for f in received)
+    assert frame.mjpeg_part() is frame.mjpeg_part()  # encoded once
+
+
+@pytest.mark.asyncio
+async def test_slow_viewer_drops_oldest(store):
+    hub = FrameHub(queue_size=2)
+    sub = hub.subscribe("cam")
+    frames = [store.put("cam", bytes([i])) for i in range(4)]
+    for f in frames:
+        hub.publish(f)
+
+    assert sub.dropped == 2
+    assert [await sub.get(), await sub.get()] == frames[2:]
+
+
+@pytest.mark.asyncio
+async def test_stalled_viewer_is_evicted(store, monkeypatch):
+    monkeypatch.setattr(hub_mod, "CAM_HUB_EVICT_AFTER", 3)
+    hub = FrameHub(queue_size=1)
+    slow = hub.subscribe("cam")
+    fast = hub.subscribe("cam")
+
+    for i in range(5):
+        hub.publish(store.put("cam", bytes([i])))
+        await fast.get()
+
+    assert slow.closed
+    assert hub.viewers("cam") == 1
+    await slow.get()  # the one frame still buffered
+    with pytest.raises(StopAsyncIteration):
+        await slow.get()
+
+
+@pytest.mark.asyncio
+async def test_unsubscribe_wakes_waiting_viewer():
+    hub = FrameHub()
+    sub = hub.subscribe("cam")
+    waiter = asyncio.create_task(sub.get())
+    await asyncio.sleep(0)
+    hub.unsubscribe(sub)
+    with pytest.raises(StopAsyncIteration):
+        await waiter
+    assert hub.viewers() == 0
+
+
+@pytest.mark.asyncio
+async def test_viewers_prefer_processed_frames(store, monkeypatch):
+    hub = FrameHub(queue_size=8)
+    sub = hub.subscribe("cam")
+    clock = [100.0]
+    monkeypatch.setattr(hub_mod, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+
+    raw = store.put("cam", b"raw-1")
+    assert hub.publish(raw) == 1  # nothing annotated yet: the raw feed
+    processed = store.put("cam", b"boxes-1", PROCESSED)
+    assert hub.publish(processed) == 1
+    assert hub.publish(store.put("cam", b"raw-2")) == 0  # held back while detection keeps up
+
+    clock[0] += hub_mod.PROCESSED_HOLD_SECONDS
+    late_raw = store.put("cam", b"raw-3")
+    assert hub.publish(late_raw) == 1  # detection went quiet
+    assert [await sub.get() for _ in range(3)] == [raw, processed, late_raw]
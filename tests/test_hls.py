@@ -0,0 +1,95 @@
+# tests/test_hls.py
+"""
+Live HLS: one ffmpeg segmenter per camera (per host), fed from the frame
+hub, and cache headers on the /hls static mount.
+"""
+
+import asyncio
+import os
+import shutil
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+from httpx import AsyncClient
+
+from app.utils.frame_hub import frame_hub
+from app.utils.frame_store import frame_store
+from app.utils.hls import HlsSegmenter
+
+
+def _ffmpeg() -> str | None:
+    exe = shutil.which(os.getenv("FFMPEG_BIN", "ffmpeg"))
+    if exe:
+        return exe
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+
+def _jpeg(i: int) -> bytes:
+    img = np.zeros((120, 160, 3), np.uint8)
+    cv2.putText(img, str(i), (20, 80), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+
+@pytest.mark.asyncio
+async def test_hls_mount_sets_cache_headers(async_client: AsyncClient):
+    from app.core.config import DATA_ROOT
+
+    cam_dir = Path(DATA_ROOT) / "cam-hls-static" / "hls"
+    cam_dir.mkdir(parents=True, exist_ok=True)
+    (cam_dir / "index.m3u8").write_text("#EXTM3U\n")
+    (cam_dir / "seg_1700000000.ts").write_bytes(b"\x47" * 188)
+    try:
+        r = await async_client.get("/hls/cam-hls-static/hls/index.m3u8")
+        assert r.status_code == 200 and r.headers["cache-control"] == "no-cache"
+        r = await async_client.get("/hls/cam-hls-static/hls/seg_1700000000.ts")
+        assert r.status_code == 200 and "immutable" in r.headers["cache-control"]
+    finally:
+        shutil.rmtree(cam_dir.parent)
+
+
+@pytest.mark.asyncio
+async def test_disabled_segmenter_does_nothing(tmp_path):
+    seg = HlsSegmenter(enabled=False, data_root=str(tmp_path))
+    assert seg.ensure("cam") is False
+    assert not (tmp_path / "cam").exists()
+
+
+@pytest.mark.asyncio
+async def test_segmenter_writes_playlist_and_single_owner(tmp_path):
+    ffmpeg = _ffmpeg()
+    if ffmpeg is None:
+        pytest.skip("ffmpeg not available")
+
+    seg = HlsSegmenter(enabled=True, data_root=str(tmp_path), ffmpeg=ffmpeg, idle_seconds=1)
+    other = HlsSegmenter(enabled=True, data_root=str(tmp_path), ffmpeg=ffmpeg, idle_seconds=1)
+    try:
+        assert seg.ensure("cam-hls")
+        assert not other.ensure("cam-hls")  # the directory lock has an owner
+        await asyncio.sleep(0.2)  # let ffmpeg start and the segmenter subscribe
+
+        for i in range(20):
+            frame_hub.publish(frame_store.put("cam-hls", _jpeg(i)))
+            await asyncio.sleep(1 / 15)
+
+        # idle timeout closes ffmpeg, which finalises the playlist
+        for _ in range(100):
+            if not seg.running("cam-hls"):
+                break
+            await asyncio.sleep(0.1)
+        assert not seg.running("cam-hls")
+
+        out = tmp_path / "cam-hls" / "hls"
+        playlist = (out / "index.m3u8").read_text()
+        segments = list(out.glob("seg_*.ts"))
+        assert "#EXTM3U" in playlist and segments
+        assert segments[0].name in playlist
+    finally:
+        await seg.shutdown()
+        await other.shutdown()
+        frame_store.forget("cam-hls")
@@ -0,0 +1,103 @@
+# tests/test_lease_reaper.py
+"""
+Expired leases are requeued by one background pass over all devices – one
+UPDATE, by the one worker holding the reaper lock – which wakes the
+devices' leasers.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event, func, select
+
+from app.core import database
+from app.models import Device, Task, TaskStatus
+from app.schemas import DeviceType
+from app.utils import lease_reaper as reaper_mod, metrics
+from app.utils.lease_reaper import LeaseReaper
+from app.utils.task_signals import task_signals
+
+
+@pytest.mark.asyncio
+async def test_reaper_requeues_expired_leases_and_wakes_leasers():
+    Session = database.AsyncSessionLocal
+    engine = Session.kw["bind"]
+    now = datetime.now(timezone.utc)
+    async with Session() as s:
+        for d in ("lr_a", "lr_b"):
+            s.add(Device(id=d, mac_id=d, name=d, type=DeviceType.DOSING_UNIT, http_endpoint="http://lr"))
+        await s.flush()
+        s.add_all([
+            Task(id="expired_a1", device_id="lr_a", type="pump", status=TaskStatus.LEASED,
+                 lease_id="l1", leased_until=now - timedelta(seconds=30)),
+            Task(id="expired_a2", device_id="lr_a", type="pump", status=TaskStatus.LEASED,
+                 lease_id="l1", leased_until=now - timedelta(seconds=30)),
+            Task(id="expired_b", device_id="lr_b", type="pump", status=TaskStatus.LEASED,
+                 lease_id="l2", leased_until=now - timedelta(seconds=1)),
+            Task(id="live", device_id="lr_b", type="pump", status=TaskStatus.LEASED,
+                 lease_id="l3", leased_until=now + timedelta(seconds=60)),
+        ])
+        await s.commit()
+
+    metrics.reset()
+    generations = {d: task_signals.generation(d) for d in ("lr_a", "lr_b")}
+    statements = []
+    listener = lambda *a, **k: statements.append(a[2])  # noqa: E731
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    reaper = LeaseReaper()
+    try:
+        assert await reaper.run_once(now) == 3
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+    assert len([q for q in statements if q.lstrip().upper().startswith("UPDATE")]) == 1
+    assert all(task_signals.generation(d) == g + 1 for d, g in generations.items())
+    assert metrics.snapshot()["counters"]["tasks.lease.reaped"] == 3
+
+    async with Session() as s:
+        rows = dict((await s.execute(select(Task.id, Task.status))).all())
+        assert rows == {"expired_a1": TaskStatus.PENDING, "expired_a2": TaskStatus.PENDING,
+                        "expired_b": TaskStatus.PENDING, "live": TaskStatus.LEASED}
+        assert await s.scalar(select(func.count()).where(Task.lease_id.is_not(None))) == 1
+
+    try:
+        assert await reaper.run_once(now) == 0
+    finally:
+        await reaper.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_only_the_lock_holder_reaps():
+    engine = database.AsyncSessionLocal.kw["bind"]
+    async with engine.connect() as leader:
+        assert await leader.scalar(select(func.pg_try_advisory_lock(reaper_mod.LOCK_KEY)))
+        statements = []
+        listener = lambda *a, **k: statements.append(a[2])  # noqa: E731
+        event.listen(engine.sync_engine, "before_cursor_execute", listener)
+        reaper = LeaseReaper()
+        try:
+            assert await reaper.run_once() == 0
+            assert not reaper.leader
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", listener)
+        assert not [q for q in statements if "UPDATE" in q.upper()]
+        await leader.scalar(select(func.pg_advisory_unlock(reaper_mod.LOCK_KEY)))
+
+
+@pytest.mark.asyncio
+async def test_leadership_outlasts_the_reaping_transaction():
+    first, second = LeaseReaper(), LeaseReaper()
+    try:
+        await first.run_once()
+        assert first.leader
+        # the lock is not released by the reaping commit: the next pass still leads
+        await second.run_once()
+        assert not second.leader
+        await first.run_once()
+        assert first.leader
+
+        await first.shutdown()  # the leader goes away: the next pass elsewhere takes over
+        await second.run_once()
+        assert second.leader
+    finally:
+        await first.shutdown()
+        await second.shutdown()
@@ -0,0 +1,61 @@
+# tests/test_motion_gate.py
+"""
+Change detection before inference: near-identical frames are skipped,
+real changes (or slow drift) go through, thresholds are per camera.
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from app.utils.motion_gate import MotionGate
+
+
+def _jpeg(level: int, box: bool = False) -> bytes:
+    img = np.full((480, 640, 3), level, dtype=np.uint8)
+    if box:
+        cv2.rectangle(img, (100, 100), (400, 350), (255, 255, 255), -1)
+    ok, buf = cv2.imencode(".jpg", img)
+    assert ok
+    return buf.tobytes()
+
+
+def test_static_scene_is_skipped_and_reuses_detections():
+    gate = MotionGate(threshold=4)
+    assert gate.changed("cam", _jpeg(100))
+    gate.remember("cam", [{"name": "leaf"}])
+
+    assert not gate.changed("cam", _jpeg(101))
+    assert gate.last("cam") == [{"name": "leaf"}]
+    assert gate.changed("cam", _jpeg(100, box=True))
+    assert gate.skip_rate("cam") == pytest.approx(1 / 3, abs=1e-3)
+
+
+def test_slow_drift_eventually_triggers():
+    gate = MotionGate(threshold=4)
+    gate.changed("cam", _jpeg(100))
+    gate.remember("cam", [])
+    results = [gate.changed("cam", _jpeg(100 + step)) for step in range(1, 7)]
+    # the reference stays put until the accumulated change crosses the threshold
+    assert results[:3] == [False, False, False]
+    assert True in results
+
+
+def test_per_camera_threshold_and_disable():
+    gate = MotionGate(threshold=4)
+    gate.thresholds = {"sensitive": 0.5, "off": 0}
+    for cam in ("sensitive", "off", "default"):
+        gate.changed(cam, _jpeg(100))
+        gate.remember(cam, [])
+
+    assert gate.changed("sensitive", _jpeg(102))
+    assert gate.changed("off", _jpeg(100))
+    assert not gate.changed("default", _jpeg(102))
+
+
+def test_first_frame_and_undecodable_frames_go_through():
+    gate = MotionGate(threshold=4)
+    assert gate.changed("cam", b"\xff\xd8garbage")
+    assert gate.changed("cam", _jpeg(100))
+    # no detections remembered yet -> nothing to reuse, keep detecting
+    assert gate.changed("cam", _jpeg(100))
@@ -0,0 +1,108 @@
+# tests/test_onnx_detector.py
+"""
+ONNX Runtime backend: decoding of both YOLO export layouts and a full
+detect_batch() round-trip through a tiny generated model.
+"""
+
+import numpy as np
+import pytest
+
+from app.utils.detectors import _letterbox, _postprocess
+
+NAMES = {0: "leaf", 1: "pest"}
+
+
+def _v5_rows():
+    # cx, cy, w, h, obj, cls0, cls1 (letterbox space)
+    return np.array(
+        [
+            [320, 320, 100, 100, 0.9, 0.9, 0.1],   # leaf
+            [322, 321, 100, 100, 0.8, 0.9, 0.1],   # overlapping duplicate -> NMS
+            [100, 400, 40, 60, 0.9, 0.05, 0.8],    # pest
+            [500, 100, 40, 40, 0.2, 0.9, 0.1],     # below conf after objectness
+        ],
+        dtype=np.float32,
+    )
+
+
+def test_postprocess_yolov5_layout_maps_back_to_image():
+    img = np.zeros((480, 640, 3), np.uint8)
+    _, scale, pad = _letterbox(img)
+    dets = _postprocess(_v5_rows(), scale, pad, img.shape[:2], NAMES)
+
+    assert sorted(d["name"] for d in dets) == ["leaf", "pest"]
+    leaf = next(d for d in dets if d["name"] == "leaf")
+    assert leaf["conf"] == pytest.approx(0.81)
+    # 640x480 letterboxed into 640x640 -> 80 px of top padding
+    assert leaf["bbox"] == (270, 190, 370, 290)
+
+
+def test_postprocess_yolov8_layout():
+    rows = _v5_rows()
+    v8 = np.column_stack([rows[:, :4], rows[:, 5:] * rows[:, 4:5]]).T  # (4 + nc, N)
+    img = np.zeros((640, 640, 3), np.uint8)
+    _, scale, pad = _letterbox(img)
+    dets = _postprocess(v8, scale, pad, img.shape[:2], NAMES)
+    assert sorted(d["name"] for d in dets) == ["leaf", "pest"]
+
+
+def test_postprocess_keeps_classes_apart_on_large_images():
+    # 8192x8192 frame: the pest box shifted by a fixed 4096 per class would
+    # land exactly on the leaf box and be suppressed by it
+    scale = 640 / 8192  # letterboxed without padding
+    rows = np.array(
+        [
+            [400, 400, 50, 50, 0.9, 0.9, 0.1],   # leaf at (5120, 5120)
+            [80, 80, 50, 50, 0.9, 0.1, 0.8],     # pest at (1024, 1024)
+        ],
+        dtype=np.float32,
+    )
+    dets = _postprocess(rows, scale, (0, 0), (8192, 8192), NAMES)
+    assert sorted(d["name"] for d in dets) == ["leaf", "pest"]
+    assert next(d for d in dets if d["name"] == "leaf")["bbox"] == (4800, 4800, 5440, 5440)
+
+
+def _tiny_model(path, rows):
+    onnx = pytest.importorskip("onnx")
+    from onnx import TensorProto, helper, numpy_helper
+
+    # output = mean(images) * 0 + rows  -> (N, K, 5 + nc), dynamic batch
+    nodes = [
+        helper.make_node("ReduceMean", ["images"], ["m"], axes=[1, 2, 3], keepdims=1),
+        helper.make_node("Reshape", ["m", "shape"], ["m3"]),
+        helper.make_node("Mul", ["m3", "zero"], ["z"]),
+        helper.make_node("Add", ["z", "rows"], ["output0"]),
+    ]
+    graph = helper.make_graph(
+        nodes,
+        "tiny",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, ["batch", 3, 640, 640])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, ["batch", rows.shape[0], rows.shape[1]])],
+        initializer=[
+            numpy_helper.from_array(np.array([-1, 1, 1], np.int64), "shape"),
+            numpy_helper.from_array(np.zeros((1,), np.float32), "zero"),
+            numpy_helper.from_array(rows[None], "rows"),
+        ],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    helper.set_model_props(model, {"names": repr(NAMES)})
+    onnx.save(model, str(path))
+
+
+def test_onnx_detector_batch_round_trip(tmp_path):
+    pytest.importorskip("onnxruntime")
+    from app.utils.detectors import OnnxDetector
+
+    path = tmp_path / "tiny.onnx"
+    _tiny_model(path, _v5_rows())
+    det = OnnxDetector(str(path), threads=1, int8=False)
+    assert det.batched and det.names == NAMES
+
+    imgs = [np.zeros((640, 640, 3), np.uint8) for _ in range(3)]
+    results = det.detect_batch(imgs)
+    assert len(results) == 3
+    for annotated, dets in results:
+        assert annotated.shape == (640, 640, 3)
+        assert sorted(d["name"] for d in dets) == ["leaf", "pest"]
+        assert set(dets[0]) == {"name", "conf", "bbox"}
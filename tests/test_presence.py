@@ -0,0 +1,109 @@
+# tests/test_presence.py
+"""
+Push-based presence: deadlines instead of table scans, one UPDATE per batch
+of transitions, events for subscribers and forwarding from other workers.
+"""
+
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app.models import Camera
+from app.utils import presence as presence_mod
+from app.utils.presence import PresenceEvent, PresenceTracker
+
+
+def _leader(**kw) -> PresenceTracker:
+    tracker = PresenceTracker(**kw)
+    tracker.leader = True
+    return tracker
+
+
+def test_deadlines_expire_exactly_and_rearm_lazily():
+    tracker = _leader(timeout=10)
+    events = tracker.subscribe()
+
+    tracker.seen("a", 100.0)
+    tracker.seen("b", 100.0)
+    for ts in range(101, 106):
+        tracker.seen("a", float(ts))  # frames only move the deadline
+    assert len(tracker._heap) == 2
+
+    tracker._expire(109.9)
+    assert tracker.online() == 2
+    tracker._expire(110.0)
+    assert not tracker.is_online("b") and tracker.is_online("a")
+    tracker._expire(115.0)
+    assert tracker.online() == 0
+
+    got = [events.get_nowait() for _ in range(events.qsize())]
+    assert got == [
+        PresenceEvent("a", True, 100.0),
+        PresenceEvent("b", True, 100.0),
+        PresenceEvent("b", False, 110.0),
+        PresenceEvent("a", False, 115.0),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_transitions_are_persisted_in_one_update():
+    Session = presence_mod.AsyncSessionLocal
+    engine = Session.kw["bind"]
+    async with Session() as s:
+        s.add_all([
+            Camera(id="pr_on", name="on"),
+            Camera(id="pr_off", name="off", is_online=True),
+            Camera(id="pr_idle", name="idle"),
+        ])
+        await s.commit()
+
+    tracker = _leader(timeout=5)
+    now = time.time()
+    tracker.seen("pr_on", now)
+    tracker.seen("pr_off", now - 60)
+    tracker._expire(now)
+
+    statements = []
+    listener = lambda *a, **k: statements.append(a[2])  # noqa: E731
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        assert await tracker.flush() == 2
+        assert await tracker.flush() == 0
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+    assert len([q for q in statements if q.lstrip().upper().startswith("UPDATE")]) == 1
+
+    async with Session() as s:
+        assert (await s.get(Camera, "pr_on")).is_online is True
+        assert (await s.get(Camera, "pr_off")).is_online is False
+        assert (await s.get(Camera, "pr_idle")).is_online is False
+
+
+@pytest.mark.asyncio
+async def test_followers_forward_to_the_leader(tmp_path):
+    path = str(tmp_path / "presence.sock")
+    leader = PresenceTracker(timeout=30, socket_path=path)
+    follower = PresenceTracker(timeout=30, socket_path=path)
+    try:
+        assert leader.try_lead()
+        assert not follower.try_lead()
+
+        follower.seen("cam_far")
+        follower.seen("cam_far")  # rate-limited, not sent twice
+        for _ in range(50):
+            if leader.is_online("cam_far"):
+                break
+            await asyncio.sleep(0.01)
+        assert leader.is_online("cam_far")
+        assert not follower.is_online("cam_far")
+    finally:
+        follower.shutdown()
+        leader.shutdown()
+    # the lock is released with the leader
+    successor = PresenceTracker(socket_path=path)
+    try:
+        assert successor.try_lead()
+    finally:
+        successor.shutdown()
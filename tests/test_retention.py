@@ -0,0 +1,168 @@
+# tests/test_retention.py
+"""
+Retention: O(1) storage index, age/quota sweeps off the event loop, leader
+scans that adopt orphaned files and `Camera.storage_used` kept in step.
+"""
+
+import os
+import time
+
+import pytest
+
+from app.utils import retention
+from app.utils.camera_stats import CameraStats
+from app.utils.retention import MB, RetentionSweeper, StorageIndex
+
+
+def _file(path, size, age=0.0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    if age:
+        t = time.time() - age
+        os.utime(path, (t, t))
+    return path
+
+
+def test_index_pops_in_age_order_and_reports_recorded_sizes():
+    index = StorageIndex(CameraStats())
+    now = time.time()
+    index.record("cam", "/d/a", 10, now - 300)
+    index.record("cam", "/d/b", 20, now - 200)
+    index.record("cam", "/d/c", 30, now)
+    index.record("cam", "/d/b", 25)  # rewritten: new size, same position
+
+    assert index.bytes("cam") == 65
+    assert index.pop_expired("cam", now - 100) == [("/d/a", 10), ("/d/b", 25)]
+    index.forget("cam", "/d/c")
+    assert index.bytes("cam") == 0 and len(index) == 0
+    # +65 recorded, -30 forgotten; popped files count once their unlink succeeds
+    assert index.stats.pending("cam").nbytes == 35
+
+    index.record("cam", "/d/e", 40)
+    index.record("cam", "/d/f", 40)
+    assert index.pop_oldest("cam", 1) == [("/d/e", 40)]
+    assert index.stats.pending("cam").nbytes == 115
+
+
+def test_load_merges_off_lock_and_keeps_changes_made_meanwhile(monkeypatch):
+    index = StorageIndex(CameraStats())
+    index.record("cam", "/d/popped", 30, 50.0)
+    index.record("cam", "/d/kept", 10, 100.0)
+    index.record("cam", "/d/gone", 20, 200.0)
+
+    merge = retention._merge
+
+    def merge_while_writing(snapshot, scanned):
+        # writers carry on while the scan is merged (outside the lock)
+        assert index._lock.acquire(blocking=False)
+        index._lock.release()
+        index.record("cam", "/d/new", 40, 900.0)
+        index.record("other", "/d/x", 5, 900.0)
+        index.forget("cam", "/d/gone")
+        assert index.pop_expired("cam", 60.0) == [("/d/popped", 30)]
+        return merge(snapshot, scanned)
+
+    monkeypatch.setattr(retention, "_merge", merge_while_writing)
+    index.load({"cam": [(150.0, 7, "/d/orphan"), (100.0, 99, "/d/kept")], "idle": [(1.0, 3, "/d/i")]})
+
+    with index._lock:
+        files = {cam_id: list(cam.files) for cam_id, cam in index._cams.items()}
+    assert files == {
+        "cam": ["/d/kept", "/d/orphan", "/d/new"], "other": ["/d/x"], "idle": ["/d/i"],
+    }
+    assert (index.bytes("cam"), index.bytes("other"), index.bytes("idle")) == (57, 5, 3)
+    assert index._touched is None
+
+
+@pytest.mark.asyncio
+async def test_sweep_enforces_age_and_quota(tmp_path):
+    from app.models import Camera
+    from app.utils import retention
+
+    async with retention.AsyncSessionLocal() as s:
+        s.add(Camera(id="ret_cam", name="r", settings={"storage_quota_mb": 2}))
+        await s.commit()
+
+    index = StorageIndex(CameraStats())
+    sweeper = RetentionSweeper(index, data_root=str(tmp_path), retention_days=1, quota_mb=0)
+    sweeper.leader = True  # quotas are the leader's job
+    cam_dir = tmp_path / "ret_cam"
+    old = _file(cam_dir / "raw" / "old.jpg", 1000)
+    index.record("ret_cam", old, 1000, time.time() - 2 * 86400)
+    clips = [_file(cam_dir / "clips" / f"{i}.mp4", MB) for i in range(3)]
+    for i, clip in enumerate(clips):
+        index.record("ret_cam", clip, MB, time.time() - 60 + i)
+
+    reclaimed = await sweeper.sweep_once()
+
+    assert not old.exists()                     # past RETENTION_DAYS
+    assert not clips[0].exists()                # oldest, over the 2 MB quota
+    assert clips[1].exists() and clips[2].exists()
+    assert reclaimed == 1000 + MB
+    async with retention.AsyncSessionLocal() as s:
+        cam = await s.get(Camera, "ret_cam")
+        assert cam.storage_used == pytest.approx(2.0)
+
+
+@pytest.mark.asyncio
+async def test_bootstrap_scans_once_and_skips_hls(tmp_path):
+    from app.models import Camera
+    from app.utils import retention
+
+    async with retention.AsyncSessionLocal() as s:
+        s.add(Camera(id="boot_cam", name="b", storage_used=123.0))
+        await s.commit()
+
+    cam_dir = tmp_path / "boot_cam"
+    _file(cam_dir / "raw" / "1.jpg", 100, age=60)
+    _file(cam_dir / "processed" / "leaf" / "1_leaf.jpg", 50, age=60)
+    _file(cam_dir / "hls" / "seg_1.ts", 999, age=60)
+    _file(cam_dir / "latest.jpg", 999, age=60)
+
+    index = StorageIndex(CameraStats())
+    sweeper = RetentionSweeper(index, data_root=str(tmp_path), retention_days=0)
+    assert sweeper._try_lead()
+    assert not RetentionSweeper(StorageIndex(CameraStats()), data_root=str(tmp_path))._try_lead()
+
+    assert await sweeper.bootstrap() == 150
+    assert index.bytes("boot_cam") == 150 and len(index) == 2
+    async with retention.AsyncSessionLocal() as s:
+        cam = await s.get(Camera, "boot_cam")
+        assert cam.storage_used == pytest.approx(150 / MB)
+
+
+@pytest.mark.asyncio
+async def test_rescan_adopts_orphans_and_counts_each_deletion_once(tmp_path):
+    from app.models import Camera
+    from app.utils import retention
+
+    async with retention.AsyncSessionLocal() as s:
+        s.add(Camera(id="orph_cam", name="o"))
+        await s.commit()
+
+    cam_dir = tmp_path / "orph_cam"
+    leader = RetentionSweeper(StorageIndex(CameraStats()), data_root=str(tmp_path),
+                              retention_days=1, rescan_interval=0)
+    assert leader._try_lead()
+    await leader.bootstrap()
+
+    # a worker indexes a file, then exits; another one's file is on disk too
+    live = StorageIndex(CameraStats())
+    shared = _file(cam_dir / "raw" / "shared.jpg", 300, age=2 * 86400)
+    live.record("orph_cam", shared, 300, time.time() - 2 * 86400)
+    orphan = _file(cam_dir / "clips" / "orphan.mp4", 700, age=2 * 86400)
+    await live.stats.flush()
+
+    assert await leader.bootstrap() == 1000  # rescan: adopts both, storage_used reset to disk
+    assert leader.index.bytes("orph_cam") == 1000
+    await leader.bootstrap()  # de-duplicated by path
+    assert len(leader.index) == 2
+
+    # the live worker deletes the shared file first; the leader's unlink then frees nothing
+    worker = RetentionSweeper(live, data_root=str(tmp_path), retention_days=1)
+    assert await worker.sweep_once() == 300
+    assert await leader.sweep_once() == 700
+    assert not orphan.exists() and not shared.exists()
+    async with retention.AsyncSessionLocal() as s:
+        cam = await s.get(Camera, "orph_cam")
+        assert cam.storage_used == pytest.approx(0.0)
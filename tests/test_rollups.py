@@ -0,0 +1,167 @@
+# tests/test_rollups.py
+"""
+Time rollups: incremental folding behind a watermark (each raw row counted
+once per resolution), resolution picked from the point budget, PostgreSQL
+and SQLite.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+from app.core.database import Base
+from app.models import (
+    Camera, DetectionEvent, Device, Rollup, RollupWatermark, SensorChunk, SensorReading,
+)
+from app.schemas import DeviceType
+from app.utils import rollups
+
+T0 = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _readings(device_id: str, minutes: range) -> list[dict]:
+    # pH: value = 6 + minute/100, one reading at :00 and one at :30 of each minute
+    return [
+        {"id": f"{device_id}-{m}-{s}", "device_id": device_id, "reading_type": "ph",
+         "value": 6 + m / 100, "timestamp": T0 + timedelta(minutes=m, seconds=s)}
+        for m in minutes for s in (0, 30)
+    ]
+
+
+def test_pick_resolution_fits_the_point_budget():
+    day = (T0, T0 + timedelta(days=1))
+    assert rollups.pick_resolution(*day, max_points=1440) == 60
+    assert rollups.pick_resolution(*day, max_points=100) == 3600
+    assert rollups.pick_resolution(*day, max_points=10) == 86400
+    assert rollups.pick_resolution(T0, T0 + timedelta(days=365), max_points=10) == 86400
+
+
+@pytest.mark.asyncio
+async def test_fold_is_incremental_and_endpoint_reads_rollups(async_client: AsyncClient):
+    Session = rollups.AsyncSessionLocal
+    async with Session() as s:
+        s.add(Device(id="ru_dev", mac_id="ru:dev", name="ph", type=DeviceType.PH_TDS_SENSOR,
+                     http_endpoint="http://ru"))
+        s.add(Camera(id="ru_cam", name="rollup"))
+        await s.flush()
+        await s.execute(insert(SensorReading), _readings("ru_dev", range(0, 90)))
+        await s.execute(insert(DetectionEvent), [
+            {"id": "ru-e1", "camera_id": "ru_cam", "object_name": "leaf", "start_time": T0,
+             "end_time": T0 + timedelta(seconds=5), "count": 4, "max_confidence": 0.5},
+            {"id": "ru-e2", "camera_id": "ru_cam", "object_name": "leaf",
+             "start_time": T0 + timedelta(minutes=70), "end_time": T0 + timedelta(minutes=71),
+             "count": 2, "max_confidence": 0.8},
+        ])
+        await s.commit()
+
+    job = rollups.RollupJob(lag=0)
+    # first pass: everything up to minute 60, then the rest
+    assert await job.run_once(now=T0 + timedelta(minutes=60)) > 0
+    assert await job.run_once(now=T0 + timedelta(minutes=60)) == 0  # watermark holds
+    async with Session() as s:
+        await s.execute(insert(SensorReading), _readings("ru_dev", range(90, 120)))
+        await s.commit()
+    await job.run_once(now=T0 + timedelta(hours=3))
+
+    window = {"start": T0.isoformat(), "end": (T0 + timedelta(hours=2)).isoformat()}
+    r = await async_client.get("/api/v1/devices/ru_dev/readings/rollup", params={**window, "points": 2})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["resolution"] == 3600
+    first, second = body["points"]
+    assert (first["count"], first["min"], first["max"]) == (120, 6.0, 6.59)
+    assert second["count"] == 120 and second["max"] == pytest.approx(7.19)
+    assert first["avg"] == pytest.approx(6 + 29.5 / 100)
+
+    body = (await async_client.get(
+        "/api/v1/devices/ru_dev/readings/rollup", params={**window, "points": 500}
+    )).json()
+    assert body["resolution"] == 60 and len(body["points"]) == 120
+    assert all(p["count"] == 2 for p in body["points"])
+
+    body = (await async_client.get(
+        "/api/v1/cameras/rollup/ru_cam", params={**window, "points": 2, "object_name": "leaf"}
+    )).json()
+    assert [(p["count"], p["max"]) for p in body["points"]] == [(4, 0.5), (2, 0.8)]
+    assert body["points"][0]["avg"] == pytest.approx(0.5)
+
+    r = await async_client.get("/api/v1/cameras/rollup/ru_cam",
+                               params={"start": window["end"], "end": window["start"]})
+    assert r.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_fold_on_sqlite(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'rollups.db'}")
+    tables = [t.__table__ for t in (Device, SensorReading, SensorChunk, Rollup, RollupWatermark)]
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=tables)
+            await conn.execute(insert(Device.__table__), [{
+                "id": "dev", "mac_id": "m", "name": "d", "type": DeviceType.PH_TDS_SENSOR,
+                "http_endpoint": "http://d", "is_active": True,
+            }])
+            await conn.execute(insert(SensorReading.__table__), _readings("dev", range(0, 3)))
+
+        async with AsyncSession(engine) as session:
+            await rollups.fold(session, rollups.SERIES["sensor"], T0 + timedelta(minutes=2), lag=0)
+            await session.commit()
+            await session.execute(insert(SensorReading), _readings("dev", range(3, 5)))
+            await rollups.fold(session, rollups.SERIES["sensor"], T0 + timedelta(hours=1), lag=0)
+            await session.commit()
+
+            resolution, points = await rollups.query_rollups(
+                session, "sensor", "dev", start=T0, end=T0 + timedelta(minutes=5), max_points=10
+            )
+            assert resolution == 60
+            assert [(p["bucket"], p["count"]) for p in points] == [
+                (T0 + timedelta(minutes=m), 2) for m in range(5)
+            ]
+            _, (hour,) = await rollups.query_rollups(
+                session, "sensor", "dev", start=T0, end=T0 + timedelta(hours=1), max_points=1
+            )
+            assert (hour["count"], hour["min"], hour["max"]) == (10, 6.0, 6.04)
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_events_are_split_across_the_buckets_they_span(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'rollups.db'}")
+    tables = [t.__table__ for t in (Camera, DetectionEvent, Rollup, RollupWatermark)]
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=tables)
+            await conn.execute(insert(Camera.__table__), [{"id": "cam", "name": "c"}])
+            await conn.execute(insert(DetectionEvent.__table__), [
+                # 12:00:30–12:01:30: half in each minute
+                {"id": "e1", "camera_id": "cam", "object_name": "leaf",
+                 "start_time": T0 + timedelta(seconds=30), "end_time": T0 + timedelta(seconds=90),
+                 "count": 4, "max_confidence": 0.6},
+                # 12:59–13:01: across the hour boundary
+                {"id": "e2", "camera_id": "cam", "object_name": "leaf",
+                 "start_time": T0 + timedelta(minutes=59), "end_time": T0 + timedelta(minutes=61),
+                 "count": 6, "max_confidence": 0.9},
+            ])
+
+        async with AsyncSession(engine) as session:
+            await rollups.fold(session, rollups.SERIES["detections"], T0 + timedelta(hours=2), lag=0)
+            await session.commit()
+
+            _, minutes = await rollups.query_rollups(
+                session, "detections", "cam", start=T0, end=T0 + timedelta(hours=2), max_points=500
+            )
+            assert [(p["bucket"], p["count"]) for p in minutes] == [
+                (T0, 2), (T0 + timedelta(minutes=1), 2),
+                (T0 + timedelta(minutes=59), 3), (T0 + timedelta(minutes=60), 3),
+            ]
+            _, hours = await rollups.query_rollups(
+                session, "detections", "cam", start=T0, end=T0 + timedelta(hours=2), max_points=2
+            )
+            assert [(p["count"], p["max"]) for p in hours] == [(7, 0.9), (3, 0.9)]
+            assert hours[0]["avg"] == pytest.approx((4 * 0.6 + 3 * 0.9) / 7)
+    finally:
+        await engine.dispose()
@@ -0,0 +1,112 @@
+# tests/test_sensor_cache.py
+"""
+Recent-readings cache: ring buffers per series, window statistics for one
+or many devices, fill on ingest and warm-up from the database.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from app.core import database
+from app.models import Device
+from app.schemas import DeviceType
+from app.utils.sensor_cache import SensorCache
+from app.utils.sensor_store import SensorStore
+
+NOW = 1_700_000_000.0
+
+
+def test_ring_keeps_the_newest_and_rejects_stale():
+    cache = SensorCache(capacity=4)
+    for i in range(6):
+        assert cache.add("d1", "ph", 6 + i / 10, NOW + i, location="bay")
+    assert not cache.add("d1", "ph", 9.9, NOW + 2)  # older than the latest
+    assert cache.latest("d1", "ph") == (NOW + 5, pytest.approx(6.5))
+
+    stats = cache.window("d1", "ph", seconds=3600, now=NOW + 5)
+    assert stats.count == 4  # capacity: readings 2..5 survive
+    assert stats.min == pytest.approx(6.2) and stats.max == pytest.approx(6.5)
+    assert stats.mean == pytest.approx(6.35)
+    assert stats.slope == pytest.approx(0.1)
+    assert cache.latest_values(location="bay") == {"ph": pytest.approx(6.5)}
+
+
+def test_window_many_is_vectorised_across_devices():
+    cache = SensorCache(capacity=120)
+    for t in range(100):
+        cache.add("rising", "ph", 5.0 + 0.01 * t, NOW + t)
+        cache.add("flat", "ph", 7.0, NOW + t)
+    stats = cache.window_many(["rising", "flat", "unknown"], "ph", seconds=10, now=NOW + 99)
+    assert stats["count"].tolist() == [11, 11, 0]
+    assert stats["slope"][:2] == pytest.approx([0.01, 0.0])
+    assert stats["max"][0] == pytest.approx(5.99)
+    assert np.isnan(stats["mean"][2]) and np.isnan(stats["min"][2])
+
+
+def test_window_many_with_only_stale_devices():
+    cache = SensorCache(capacity=16)
+    cache.add("old", "ph", 6.5, NOW - 7200)
+    cache.add("older", "ph", 6.8, NOW - 9000)
+    stats = cache.window_many(["old", "older"], "ph", seconds=3600, now=NOW)
+    assert stats["count"].tolist() == [0, 0]
+    assert np.isnan(stats["mean"]).all() and np.isnan(stats["max"]).all()
+
+
+@pytest.mark.asyncio
+async def test_store_fills_the_cache_and_warms_it_from_the_db():
+    Session = database.AsyncSessionLocal
+    async with Session() as s:
+        s.add(Device(id="sc_dev", mac_id="sc:dev", name="ph", type=DeviceType.PH_TDS_SENSOR,
+                     http_endpoint="http://sc"))
+        await s.commit()
+
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    readings = [
+        {"device_id": "sc_dev", "reading_type": "ph", "value": 6.0 + i / 100,
+         "timestamp": now - timedelta(seconds=60 - i), "location": "bay-9"}
+        for i in range(60)
+    ]
+    for mode in ("rows", "chunks"):
+        ingest = SensorStore(mode, cache=SensorCache())
+        async with Session() as s:
+            await ingest.append(s, readings[:30] if mode == "rows" else readings[30:])
+            await s.commit()
+        assert ingest.cache.window("sc_dev", "ph", now=now.timestamp()).count == 30
+
+    # a fresh worker sees both halves after warm-up
+    warm = SensorStore("rows", cache=SensorCache())
+    assert await warm.refresh_cache(now - timedelta(minutes=5)) == 60
+    assert await warm.refresh_cache(now - timedelta(minutes=5)) == 0  # idempotent
+    stats = warm.cache.window("sc_dev", "ph", seconds=120, now=now.timestamp())
+    assert stats.count == 60 and stats.slope == pytest.approx(0.01, rel=1e-3)
+    assert warm.cache.latest_values(location="bay-9") == {"ph": pytest.approx(6.59)}
+
+
+@pytest.mark.asyncio
+async def test_dosing_fills_what_the_cache_lacks_from_the_db(monkeypatch):
+    from app.routers import plants
+
+    Session = database.AsyncSessionLocal
+    async with Session() as s:
+        s.add(Device(id="pc_dev", mac_id="pc:dev", name="ph", type=DeviceType.PH_TDS_SENSOR,
+                     http_endpoint="http://pc"))
+        await s.commit()
+    now = datetime.now(timezone.utc)
+    async with Session() as s:
+        await SensorStore("rows").append(s, [
+            {"device_id": "pc_dev", "reading_type": "ph", "value": 6.0,
+             "timestamp": now - timedelta(hours=2), "location": "bay-3"},
+            {"device_id": "pc_dev", "reading_type": "tds", "value": 420.0,
+             "timestamp": now - timedelta(hours=2), "location": "bay-3"},
+        ])
+        await s.commit()
+
+    # the cache holds a fresh pH but no TDS (older than its warm-up window)
+    cache = SensorCache()
+    cache.add("pc_dev", "ph", 6.4, now.timestamp(), location="bay-3")
+    monkeypatch.setattr(plants, "sensor_cache", cache)
+    async with Session() as s:
+        latest = await plants._latest_readings(s, "bay-3")
+    assert latest == {"ph": pytest.approx(6.4), "tds": pytest.approx(420.0)}
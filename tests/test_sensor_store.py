@@ -0,0 +1,166 @@
+# tests/test_sensor_store.py
+"""
+Sensor storage: hourly float32/int32 chunks appended in place, read back
+merged with row storage (PostgreSQL and SQLite), and folded into rollups.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core import database
+from app.core.database import Base
+from app.models import Device, Rollup, RollupWatermark, SensorChunk, SensorReading
+from app.schemas import DeviceType
+from app.utils import rollups, sensor_store
+from app.utils.sensor_store import SensorStore, pack, unpack
+
+T0 = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _readings(device_id: str, seconds, reading_type: str = "ph", location: str = "bay-1"):
+    return [
+        {"device_id": device_id, "reading_type": reading_type, "value": 6 + s / 10000,
+         "timestamp": T0 + timedelta(seconds=s), "location": location}
+        for s in seconds
+    ]
+
+
+def test_pack_roundtrip():
+    offsets, samples = pack([0, 5, 3599], [6.5, 7.25, 1e-3])
+    assert len(offsets) == len(samples) == 12  # 8 bytes a reading
+    ts, values = unpack(T0, offsets, samples)
+    assert ts.tolist() == [T0.timestamp() + s for s in (0, 5, 3599)]
+    assert values.dtype == np.float32 and values[1] == 7.25
+
+
+@pytest.mark.asyncio
+async def test_chunks_append_in_place_and_read_transparently():
+    Session = database.AsyncSessionLocal  # the test-DB sessionmaker
+    engine = Session.kw["bind"]
+    async with Session() as s:
+        s.add(Device(id="ss_dev", mac_id="ss:dev", name="ph", type=DeviceType.PH_TDS_SENSOR,
+                     http_endpoint="http://ss"))
+        await s.commit()
+
+    store = SensorStore("chunks")
+    statements = []
+    listener = lambda *a, **k: statements.append(a[2])  # noqa: E731
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        async with Session() as s:
+            assert await store.append(s, _readings("ss_dev", range(0, 1800))) == 1800
+            # second half of the hour plus the next hour, and a tds reading
+            await store.append(s, _readings("ss_dev", range(1800, 4000)) + _readings("ss_dev", [10], "tds"))
+            await s.commit()
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+    assert len([q for q in statements if q.lstrip().upper().startswith("INSERT")]) == 2
+
+    async with Session() as s:
+        chunks = (await s.execute(
+            select(SensorChunk.reading_type, SensorChunk.hour, SensorChunk.count)
+            .where(SensorChunk.device_id == "ss_dev").order_by(SensorChunk.reading_type, SensorChunk.hour)
+        )).all()
+        assert [(t, c) for t, _, c in chunks] == [("ph", 3600), ("ph", 400), ("tds", 1)]
+
+        # one legacy row next to the chunks
+        await SensorStore("rows").append(s, _readings("ss_dev", [5000]))
+        await s.commit()
+
+        ts, values = await store.series(s, "ss_dev", "ph", T0 + timedelta(seconds=3590),
+                                        T0 + timedelta(seconds=6000))
+        assert ts.tolist() == [T0.timestamp() + x for x in (*range(3590, 4000), 5000)]
+        assert values[-1] == pytest.approx(6.5)
+
+        latest = await store.latest(s, location="bay-1")
+        assert latest["ph"] == pytest.approx(6.5) and latest["tds"] == pytest.approx(6.001)
+        assert await store.latest(s, location="elsewhere") == {}
+
+
+@pytest.mark.asyncio
+async def test_chunks_on_sqlite_fold_into_rollups(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'chunks.db'}")
+    tables = [t.__table__ for t in (Device, SensorReading, SensorChunk, Rollup, RollupWatermark)]
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=tables)
+            await conn.execute(insert(Device.__table__), [{
+                "id": "dev", "mac_id": "m", "name": "d", "type": DeviceType.PH_TDS_SENSOR,
+                "http_endpoint": "http://d", "is_active": True,
+            }])
+
+        store = SensorStore("chunks")
+        async with AsyncSession(engine) as session:
+            await store.append(session, _readings("dev", range(0, 120)))
+            await rollups.fold(session, rollups.SERIES["sensor"], T0 + timedelta(seconds=59), lag=0)
+            await store.append(session, _readings("dev", range(120, 180)))
+            await rollups.fold(session, rollups.SERIES["sensor"], T0 + timedelta(hours=1), lag=0)
+            await session.commit()
+
+            assert await session.scalar(select(func.count()).select_from(SensorChunk)) == 1
+            ts, _ = await store.series(session, "dev", "ph")
+            assert len(ts) == 180
+
+            resolution, points = await rollups.query_rollups(
+                session, "sensor", "dev", start=T0, end=T0 + timedelta(minutes=3), max_points=10
+            )
+            assert resolution == 60
+            assert [p["count"] for p in points] == [60, 60, 60]
+            assert points[2]["max"] == pytest.approx(6.0179)
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_latest_takes_the_newest_chunk_of_every_device(tmp_path, monkeypatch):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'latest.db'}")
+    tables = [t.__table__ for t in (Device, SensorReading, SensorChunk)]
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=tables)
+            await conn.execute(insert(Device.__table__), [
+                {"id": d, "mac_id": d, "name": d, "type": DeviceType.PH_TDS_SENSOR,
+                 "http_endpoint": "http://d", "is_active": True}
+                for d in ("dev_a", "dev_b")
+            ])
+
+        # one record() per device: its own session and commit
+        monkeypatch.setattr(sensor_store, "AsyncSessionLocal", async_sessionmaker(engine, expire_on_commit=False))
+        store = SensorStore("chunks")
+        assert await store.record(_readings("dev_b", [10, 50])) == 2
+        assert await store.record(_readings("dev_a", [20, 100])) == 2  # same hour, newer reading
+
+        async with AsyncSession(engine) as session:
+            assert await store.latest(session, location="bay-1") == {"ph": pytest.approx(6.01)}
+            assert await store.latest(session, device_id="dev_b") == {"ph": pytest.approx(6.005)}
+    finally:
+        await engine.dispose()
+
+
+def test_device_readings_keep_ph_and_tds_only():
+    device = Device(id="dev", location_description="bay-2")
+    got = sensor_store.device_readings(
+        device, {"pH": "6.8", "TDS": 410, "uptime": 99, "ok": True}, T0
+    )
+    assert [(r["reading_type"], r["value"], r["location"]) for r in got] == [
+        ("ph", 6.8, "bay-2"), ("tds", 410.0, "bay-2"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_sensor_endpoint_stores_what_the_device_reports(async_client):
+    async with database.AsyncSessionLocal() as s:
+        s.add(Device(id="read_dev", mac_id="read:dev", name="doser", type=DeviceType.DOSING_UNIT,
+                     http_endpoint="http://127.0.0.1:8001", location_description="bay-7"))
+        await s.commit()
+
+    r = await async_client.get("/api/v1/devices/read_dev/sensoreading")  # virtual doser
+    assert r.status_code == 200
+
+    async with database.AsyncSessionLocal() as s:
+        latest = await sensor_store.sensor_store.latest(s, location="bay-7")
+    assert latest == {"ph": pytest.approx(r.json()["ph"]), "tds": pytest.approx(r.json()["tds"])}
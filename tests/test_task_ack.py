@@ -0,0 +1,102 @@
+# tests/test_task_ack.py
+"""
+Bulk ack / extend: one UPDATE per outcome (at most three for any batch),
+per-id results, and lease extension across several leases at once.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event, select
+
+from app.core import database
+from app.dependencies import verify_device_token
+from app.main import app
+from app.models import Device, Task, TaskStatus
+from app.schemas import DeviceType
+
+DEVICE = "ack_dev"
+
+
+@pytest.fixture
+async def leased():
+    """60 tasks leased to DEVICE: 50 under lease A, 10 under lease B; one of another device."""
+    until = datetime.now(timezone.utc) + timedelta(seconds=30)
+    async with database.AsyncSessionLocal() as s:
+        for d in (DEVICE, "ack_other"):
+            s.add(Device(id=d, mac_id=d, name=d, type=DeviceType.DOSING_UNIT, http_endpoint="http://ack"))
+        await s.flush()
+        s.add_all(
+            Task(id=f"t{i}", device_id=DEVICE, type="pump", status=TaskStatus.LEASED,
+                 lease_id="A" if i < 50 else "B", leased_until=until)
+            for i in range(60)
+        )
+        s.add(Task(id="foreign", device_id="ack_other", type="pump", status=TaskStatus.LEASED,
+                   lease_id="A", leased_until=until))
+        await s.commit()
+    app.dependency_overrides[verify_device_token] = lambda: DEVICE
+    yield until
+    app.dependency_overrides.pop(verify_device_token, None)
+
+
+def _count_statements():
+    engine = database.AsyncSessionLocal.kw["bind"]
+    statements = []
+    listener = lambda *a, **k: statements.append(a[2])  # noqa: E731
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    return statements, lambda: event.remove(engine.sync_engine, "before_cursor_execute", listener)
+
+
+@pytest.mark.asyncio
+async def test_ack_is_three_updates_with_per_id_outcomes(async_client, leased):
+    results = (
+        [{"id": f"t{i}", "success": True} for i in range(30)]
+        + [{"id": f"t{i}", "success": False, "requeue": True, "error": f"busy {i}"} for i in range(30, 40)]
+        + [{"id": f"t{i}", "success": False, "error": f"jammed {i}"} for i in range(40, 50)]
+        + [{"id": "t55", "success": True}, {"id": "foreign", "success": True}, {"id": "nope", "success": True}]
+    )
+    statements, stop = _count_statements()
+    try:
+        r = await async_client.post("/api/v1/device_comm/tasks/ack",
+                                    json={"device_id": DEVICE, "lease_id": "A", "results": results})
+    finally:
+        stop()
+    assert r.status_code == 200
+    updates = [q for q in statements if q.lstrip().upper().startswith("UPDATE TASKS")]
+    assert len(updates) == 3
+    assert not [q for q in statements if q.lstrip().upper().startswith("SELECT") and "FROM TASKS" in q.upper()]
+
+    outcomes = r.json()["results"]
+    assert outcomes["t0"] == "completed" and outcomes["t35"] == "requeued" and outcomes["t45"] == "failed"
+    assert outcomes["t55"] == outcomes["foreign"] == outcomes["nope"] == "ignored"  # wrong lease / device
+    assert len(outcomes) == 53
+
+    async with database.AsyncSessionLocal() as s:
+        rows = {t.id: t for t in (await s.execute(select(Task))).scalars()}
+    assert rows["t0"].status == TaskStatus.COMPLETED and rows["t0"].lease_id is None
+    assert rows["t35"].status == TaskStatus.PENDING and rows["t35"].error_message == "busy 35"
+    assert rows["t35"].available_at > datetime.now(timezone.utc)
+    assert rows["t45"].status == TaskStatus.FAILED and rows["t45"].error_message == "jammed 45"
+    assert rows["t55"].status == rows["foreign"].status == TaskStatus.LEASED
+
+
+@pytest.mark.asyncio
+async def test_extend_covers_several_leases_in_one_statement(async_client, leased):
+    statements, stop = _count_statements()
+    try:
+        r = await async_client.post("/api/v1/device_comm/tasks/extend", json={
+            "device_id": DEVICE, "lease_id": "A", "lease_ids": ["B", "gone"], "extend_seconds": 300,
+        })
+    finally:
+        stop()
+    body = r.json()
+    assert body["leases"] == {"A": 50, "B": 10, "gone": 0}
+    assert len([q for q in statements if q.lstrip().upper().startswith("UPDATE TASKS")]) == 1
+
+    async with database.AsyncSessionLocal() as s:
+        until = {t.id: t.leased_until for t in (await s.execute(select(Task))).scalars()}
+    assert until["t59"] > leased + timedelta(seconds=200)
+    assert until["foreign"] == leased  # another device's lease A is untouched
+
+    r = await async_client.post("/api/v1/device_comm/tasks/extend", json={"device_id": DEVICE})
+    assert r.status_code == 422
@@ -0,0 +1,113 @@
+# tests/test_task_bulk_enqueue.py
+"""
+Bulk enqueue: explicit entries or a (farm, device type) selector, the
+caller's devices only, batched multi-row INSERTs, one wake-up per device.
+"""
+
+import math
+import time
+
+import pytest
+from sqlalchemy import event, func, select
+
+from app.core import database
+from app.dependencies import get_current_user
+from app.main import app
+from app.models import Device, Farm, Task, TaskStatus, User
+from app.schemas import DeviceType
+from app.utils.task_signals import task_signals
+
+URL = "/api/v1/device_comm/tasks/enqueue/bulk"
+
+
+@pytest.fixture
+async def fleet():
+    """A user with a farm of 3 valve controllers + 1 dosing unit, 1 own unfarmed device, 1 foreign."""
+    async with database.AsyncSessionLocal() as s:
+        owner = User(id="bulk_user", email="bulk@example.com", hashed_password="x")
+        other = User(id="bulk_other", email="other@example.com", hashed_password="x")
+        s.add_all([owner, other])
+        await s.flush()
+        s.add(Farm(id="bulk_farm", owner_id="bulk_user", name="Greenhouse"))
+        await s.flush()
+
+        def device(id_, type_, **kw):
+            return Device(id=id_, mac_id=id_, name=id_, type=type_, http_endpoint="http://bulk", **kw)
+
+        s.add_all([device(f"valve{i}", DeviceType.VALVE_CONTROLLER, farm_id="bulk_farm") for i in range(3)])
+        s.add(device("doser", DeviceType.DOSING_UNIT, farm_id="bulk_farm"))
+        s.add(device("mine", DeviceType.SMART_SWITCH, user_id="bulk_user"))
+        s.add(device("theirs", DeviceType.VALVE_CONTROLLER, user_id="bulk_other"))
+        await s.commit()
+    app.dependency_overrides[get_current_user] = lambda: owner
+    yield
+    app.dependency_overrides.pop(get_current_user, None)
+
+
+def _inserts():
+    engine = database.AsyncSessionLocal.kw["bind"]
+    statements = []
+    listener = lambda *a, **k: statements.append(a[2])  # noqa: E731
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    return statements, lambda: event.remove(engine.sync_engine, "before_cursor_execute", listener)
+
+
+@pytest.mark.asyncio
+async def test_selector_enqueues_one_task_per_matching_device(async_client, fleet):
+    generations = {d: task_signals.generation(d) for d in ("valve0", "doser")}
+    r = await async_client.post(URL, json={
+        "selector": {"farm_id": "bulk_farm", "device_type": "valve_controller"},
+        "type": "schedule", "parameters": {"on": "06:00"}, "priority": 50,
+    })
+    assert r.status_code == 200
+    body = r.json()
+    assert body["count"] == 3 and [t["device_id"] for t in body["tasks"]] == ["valve0", "valve1", "valve2"]
+    assert task_signals.generation("valve0") == generations["valve0"] + 1
+    assert task_signals.generation("doser") == generations["doser"]
+
+    async with database.AsyncSessionLocal() as s:
+        task = await s.get(Task, body["tasks"][0]["task_id"])
+        assert (task.type, task.parameters, task.priority, task.status) == (
+            "schedule", {"on": "06:00"}, 50, TaskStatus.PENDING)
+
+    # a selector needs a task type and something to select by
+    assert (await async_client.post(URL, json={"selector": {"farm_id": "bulk_farm"}})).status_code == 422
+    assert (await async_client.post(URL, json={"selector": {}, "type": "x"})).status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_entries_are_inserted_in_batches_and_checked_for_ownership(async_client, fleet):
+    r = await async_client.post(URL, json={"tasks": [
+        {"device_id": "mine", "type": "switch"}, {"device_id": "theirs", "type": "valve"},
+    ]})
+    assert r.status_code == 404 and "theirs" in r.json()["detail"]
+
+    n = 2500
+    entries = [{"device_id": ("mine", "doser", "valve1")[i % 3], "type": "pump",
+                "parameters": {"amount": i}, "delay_seconds": i % 2} for i in range(n)]
+    statements, stop = _inserts()
+    start = time.perf_counter()
+    try:
+        r = await async_client.post(URL, json={"tasks": entries})
+    finally:
+        stop()
+    elapsed = time.perf_counter() - start
+    assert r.status_code == 200 and r.json()["count"] == n
+    inserts = [q for q in statements if q.lstrip().upper().startswith("INSERT INTO TASKS")]
+    assert 1 <= len(inserts) <= math.ceil(n / 1000)  # multi-row VALUES, not a row at a time
+    assert elapsed < 5
+
+    async with database.AsyncSessionLocal() as s:
+        assert await s.scalar(select(func.count()).select_from(Task)) == n
+        ids = [t["task_id"] for t in r.json()["tasks"]]
+        assert (await s.get(Task, ids[7])).parameters == {"amount": 7}
+
+
+@pytest.mark.asyncio
+async def test_ownership_check_takes_more_devices_than_query_parameters(async_client, fleet):
+    # > 32767 distinct devices: an IN list would exceed asyncpg's parameter limit
+    entries = [{"device_id": f"ghost{i}", "type": "pump"} for i in range(33_000)]
+    entries.append({"device_id": "mine", "type": "switch"})
+    r = await async_client.post(URL, json={"tasks": entries})
+    assert r.status_code == 404 and "ghost0" in r.json()["detail"]
+    assert "mine" not in r.json()["detail"]
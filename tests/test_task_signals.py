@@ -0,0 +1,136 @@
+# tests/test_task_signals.py
+"""
+Lease long-polls park on a per-device signal: woken by enqueues (in this
+process on commit, from other workers via LISTEN/NOTIFY) instead of
+re-querying every half second, and hold no pooled connection while parked.
+"""
+
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app.core import database
+from app.dependencies import verify_device_token
+from app.main import app
+from app.models import Device
+from app.schemas import DeviceType
+from app.routers import device_comm
+from app.utils.task_signals import TaskSignals, task_signals
+
+
+@pytest.mark.asyncio
+async def test_wait_sees_wakes_since_its_generation():
+    signals = TaskSignals()
+    generation = signals.generation("d1")
+    signals.wake(["d1"])  # lands between the lease query and the wait
+    assert await signals.wait("d1", generation, 5) is True
+
+    generation = signals.generation("d1")
+    start = time.monotonic()
+    assert await signals.wait("d1", generation, 0.05) is False
+    assert time.monotonic() - start < 1
+
+    waiter = asyncio.create_task(signals.wait("d1", generation, 5))
+    await asyncio.sleep(0)
+    signals.wake(["d2"])  # other devices don't wake it
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+    signals.wake(["d1"])
+    assert await waiter is True
+
+
+async def _device(device_id: str) -> None:
+    async with database.AsyncSessionLocal() as s:
+        s.add(Device(id=device_id, mac_id=device_id, name="pump", type=DeviceType.DOSING_UNIT,
+                     http_endpoint="http://ts"))
+        await s.commit()
+
+
+@pytest.mark.asyncio
+async def test_enqueue_wakes_a_parked_lease_without_polling(async_client):
+    engine = database.AsyncSessionLocal.kw["bind"]
+    await _device("ts_dev")
+
+    app.dependency_overrides[verify_device_token] = lambda: "ts_dev"
+    statements, connections = [], []
+    on_execute = lambda *a, **k: statements.append(a[2])  # noqa: E731
+    on_checkout = lambda *a: connections.append(1)  # noqa: E731
+    on_checkin = lambda *a: connections.append(-1)  # noqa: E731
+    try:
+        lease = asyncio.create_task(async_client.post(
+            "/api/v1/device_comm/tasks/lease", json={"device_id": "ts_dev", "wait_seconds": 20},
+        ))
+        await asyncio.sleep(0.5)  # parked by now
+        event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+        event.listen(engine.sync_engine.pool, "checkout", on_checkout)
+        event.listen(engine.sync_engine.pool, "checkin", on_checkin)
+        await asyncio.sleep(1.0)
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+        assert statements == []  # idle leasers cost nothing
+        assert device_comm._lease_gate.polls == 1
+
+        start = time.monotonic()
+        r = await async_client.post("/api/v1/device_comm/request",
+                                    json={"device_id": "ts_dev", "kind": "pump", "payload": {"amount": 5}})
+        task_id = r.json()["id"]
+        body = (await asyncio.wait_for(lease, 5)).json()
+        assert time.monotonic() - start < 2
+        assert [t["id"] for t in body["tasks"]] == [task_id] and body["lease_id"]
+        # the parked poll held no connection: the enqueue's and the lease's came back
+        assert sum(connections) == 0 and len(connections) >= 4
+    finally:
+        event.remove(engine.sync_engine.pool, "checkout", on_checkout)
+        event.remove(engine.sync_engine.pool, "checkin", on_checkin)
+        app.dependency_overrides.pop(verify_device_token, None)
+    assert device_comm._lease_gate.polls == 0
+
+
+@pytest.mark.asyncio
+async def test_excess_long_polls_are_turned_away_with_a_retry_hint(async_client, monkeypatch):
+    await _device("ts_busy")
+    monkeypatch.setattr(device_comm, "_lease_gate", device_comm._LeaseGate(max_polls=1, db_slots=1))
+    app.dependency_overrides[verify_device_token] = lambda: "ts_busy"
+    try:
+        first = asyncio.create_task(async_client.post(
+            "/api/v1/device_comm/tasks/lease", json={"device_id": "ts_busy", "wait_seconds": 2},
+        ))
+        await asyncio.sleep(0.3)
+        r = await async_client.post("/api/v1/device_comm/tasks/lease",
+                                    json={"device_id": "ts_busy", "wait_seconds": 2})
+        assert r.status_code == 429 and int(r.headers["Retry-After"]) > 0
+        assert (await first).json() == {"lease_id": None, "tasks": []}
+    finally:
+        app.dependency_overrides.pop(verify_device_token, None)
+
+
+@pytest.mark.asyncio
+async def test_notify_reaches_other_workers_on_commit_only():
+    Session = database.AsyncSessionLocal
+    engine = Session.kw["bind"]
+    other = TaskSignals()  # a second worker, LISTENing
+    listener = asyncio.create_task(other.run(engine))
+    try:
+        for _ in range(100):
+            if other.listening:
+                break
+            await asyncio.sleep(0.02)
+        assert other.listening
+
+        generation = other.generation("remote")
+        async with Session() as s:
+            await task_signals.notify(s, "remote")
+            await s.rollback()
+        assert await other.wait("remote", generation, 0.3) is False
+
+        async with Session() as s:
+            await task_signals.notify(s, "remote", "another")
+            assert task_signals.generation("remote") == 0
+            await s.commit()
+        assert task_signals.generation("remote") == 1  # woken locally on commit
+        assert await other.wait("remote", generation, 5) is True
+        assert other.generation("another") == 1
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)